@@ -1,5 +1,3 @@
-import dlib
-
 class _dlib_pybind11:
     """
     ## _dlib_pybind11
@@ -1,21 +1,190 @@
 from engine.agent_selection import AgentSelect
-from engine.agent_state import AgentState
-from engine.gaze_detection import GazeOTS
-
-from typing import Dict, Optional, Tuple, Callable
-from turtle import RawTurtle, TurtleScreen
+from engine.agent_state import AgentStore
+from engine.command_bridge import Address, CommandBridge, apply_commands
+from engine.gaze_filter import LatencyCompensator
+from engine.gaze_trace import TraceRecorder
+from engine.instrumentation import MetricsReporter, metrics
+from engine.operators import OPERATOR_KEYS, Operator, OperatorConfig, split_agents
+from engine.position_publisher import PositionPublisher, PositionSubscription
+from engine.renderer import CanvasRenderer, NullRenderer, TurtleRenderer
+from engine.scheduler import SelectionScheduler
+from engine.simulation import SimulationCore
+from engine.startup import StartupProfile
+
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Set, Tuple, Callable
+from concurrent.futures import Future
+from turtle import TurtleScreen
 import tkinter as tk
 import numpy as np
-import threading
+import logging
+import time
+import os
+
+# cv2 and dlib are only imported on the startup threads (see _open_source, _load_face_models)
+if TYPE_CHECKING:
+    from engine.frame_source import FrameSource
+    from engine.gaze_detection import GazeOTS
+
+
+def _open_source(spec: Optional[Any] = None) -> "FrameSource":
+    from engine.frame_source import open_source
+
+    return open_source(0 if spec is None else spec)
+
+
+def _load_face_models(backend: str = "dlib"):
+    from engine.face_tracking import load_face_models
+
+    return load_face_models(backend=backend)
 
 
 class SingleWindowController:
-    def __init__(self) -> None:
-        self.test_gaze = GazeOTS()
+    AGENT_COLORS = ("red", "green", "blue", "orange", "purple", "brown", "cyan", "magenta")
+
+    def __init__(
+        self,
+        source: Optional["FrameSource"] = None,
+        num_agents: int = 2,
+        renderer: Optional[str] = None,
+        metrics_interval: Optional[float] = None,
+        metrics_csv: Optional[str] = None,
+        operators: Optional[Sequence[OperatorConfig]] = None,
+        face_backend: str = "dlib",
+        prediction: Optional[str] = None,
+        record_trace: Optional[str] = None,
+        headless: bool = False,
+        screen_size: Tuple[int, int] = (1920, 1080),
+        bridge: Optional[Address] = None,
+        bridge_rate: Optional[float] = None,
+        export_gaze: Optional[str] = None,
+    ) -> None:
+        self.startup = StartupProfile()
+
+        # Headless runs have no window and draw with the null renderer, see run_headless
+        self.headless = headless
+        if renderer is None:
+            renderer = "null" if headless else "turtle"
+
+        # Per-stage latency metrics, logged (and appended to metrics_csv) every metrics_interval seconds
+        self.metrics_reporter: Optional[MetricsReporter] = None
+        if metrics_interval is not None:
+            metrics.enable()
+            self.metrics_reporter = MetricsReporter(metrics, metrics_interval, metrics_csv)
+            self.metrics_reporter.start()
+
+        # Each operator reads gaze from the webcam unless another frame source is given.
+        # Operators on the same source share its camera and gaze pipeline
+        configs = list(operators) if operators else [OperatorConfig(source=source)]
+        groups: Dict[Any, List[int]] = {}
+        for index, config in enumerate(configs):
+            groups.setdefault(self._source_key(config.source), []).append(index)
+
+        # Webcams and face models load in the background while the UI is built. Video files and
+        # synthetic sources open quickly, and are opened here to see if they bring landmarks
+        cameras: Dict[Any, Any] = {}
+        for key, members in groups.items():
+            spec = configs[members[0]].source
+            if self._is_frame_source(spec):
+                continue
+            if isinstance(key, str):
+                with self.startup.stage(f"open {key}"):
+                    cameras[key] = _open_source(spec)
+            else:
+                cameras[key] = self.startup.background(f"camera {key}", _open_source, spec)
+
+        face_models = None
+        if any(
+            not (self._is_gaze_source(source) or getattr(source, "provides_landmarks", False))
+            for source in (cameras.get(key, key) for key in groups)
+        ):
+            face_models = self.startup.background("face models", _load_face_models, face_backend)
+
+        with self.startup.stage("ui"):
+            if headless:
+                self.root = None
+                self.screen_width, self.screen_height = screen_size
+            else:
+                self._build_window()
+            self._build_agents(num_agents, renderer)
+
+        # Calibration (if needed) runs here, before the window is shown
+        with self.startup.stage("gaze"):
+            from engine.gaze_detection import GazeOTS
+
+            self.gaze_pipelines: List["GazeOTS"] = []
+            gaze_views: List[Any] = [None] * len(configs)
+            for camera_index, (key, members) in enumerate(groups.items()):
+                if self._is_gaze_source(key):
+                    # Ready made gaze, e.g. a recorded trace played back by TraceGaze
+                    if len(members) > 1:
+                        raise ValueError("A gaze source can only drive one operator")
+                    self.gaze_pipelines.append(key)
+                    gaze_views[members[0]] = key
+                    continue
+
+                # Headless runs cannot show calibration, raw gaze is used as screen px
+                source = cameras.get(key, key)
+                gaze = GazeOTS(
+                    source=source.result() if isinstance(source, Future) else source,
+                    screen_size=(self.screen_width, self.screen_height) if headless else None,
+                    transform=[[1, 0, 0], [0, 1, 0]] if headless else None,
+                    face_models=face_models,
+                    startup=self.startup,
+                    max_faces=len(members),
+                    name=f"camera{camera_index}" if len(groups) > 1 else None,
+                )
+                self.gaze_pipelines.append(gaze)
+                for slot, index in enumerate(members):
+                    gaze_views[index] = gaze if len(members) == 1 else gaze.operator(slot)
+            self.test_gaze = self.gaze_pipelines[0]
+
+            # Gaze is shared with other local processes through shared memory (see GazeReader)
+            if export_gaze is not None:
+                exportable = [gaze for gaze in self.gaze_pipelines if hasattr(gaze, "export")]
+                for camera_index, gaze in enumerate(exportable):
+                    gaze.export(export_gaze if len(exportable) == 1 else f"{export_gaze}_{camera_index}")
+
+        # Gaze is optionally extrapolated to the display time ("kalman" or "one_euro"), and
+        # selections can be recorded to a trace file (one per operator) for replay
+        self.prediction = prediction
+        self.record_trace = record_trace
+        self._build_operators(configs, gaze_views)
+        self._setup_controls()
+        if self.root is not None:
+            self._show_instructions()
+
+        # Gaze selection runs off the Tk thread, changes are drained in _update_movement.
+        # It starts picking agents as soon as the gaze thread publishes samples
+        for operator in self.operators:
+            operator.scheduler.start()
+        self.agent_selector = self.operators[0].selector
+        self.selection_scheduler = self.operators[0].scheduler
+
+        # Other processes can drive agents over a local socket. Their commands are applied
+        # in one batch per tick, agent state goes back at most bridge_rate times per second
+        self.bridge: Optional[CommandBridge] = None
+        if bridge is not None:
+            self.bridge = CommandBridge(bridge)
+            self.bridge.start()
+            self.positions.subscribe(self.bridge.send_state, max_rate=bridge_rate, format="snapshot")
+
+        # The breakdown is logged once, when gaze selection is ready (see tick)
+        self._startup_logged = False
 
+        self.running = True
+        self._last_tick = time.perf_counter()
+        self._next_frame = self._last_tick
+        if self.root is not None:
+            self.root.deiconify()
+            self._update_movement()
+
+    def _build_window(self) -> None:
         self.root = tk.Tk()
         self.root.title("Dual Turtle Control")
 
+        # Hidden until gaze is set up, so calibration has the screen to itself
+        self.root.withdraw()
+
         # Get screen dimensions
         self.screen_width = self.root.winfo_screenwidth()
         self.screen_height = self.root.winfo_screenheight()
@@ -53,118 +222,245 @@ class SingleWindowController:
         )
         self.instructions.pack(expand=True, fill="both")
 
-        instructions_text = """
-Arrow keys: Move/rotate selected turtle
-+/-: Adjust speed
-d: Print canvas info
-p/v: eye position/velocity
-Escape: Exit fullscreen"""
-
-        self.instructions.insert(tk.END, instructions_text)
-        self.instructions.config(state="disabled")
-
-        # Initialize turtle screen
-        self.screen = TurtleScreen(self.canvas)
-
         # Store canvas dimensions
         self.canvas_width = self.screen_width
         self.canvas_height = self.screen_height
 
-        # Set coordinate system with (0,0) at top-left
-        self.screen.setworldcoordinates(0, self.screen_height, self.screen_width, 0)
+        # Add escape key binding for exiting fullscreen
+        self.root.bind("<Escape>", lambda e: self.on_escape())
+
+    def _build_agents(self, num_agents: int, renderer: str) -> None:
+        if self.root is None and renderer != "null":
+            raise ValueError(f"Headless runs need the null renderer, not {renderer}")
+
+        if renderer == "turtle":
+            # Initialize turtle screen
+            self.screen = TurtleScreen(self.canvas)
 
-        self.agents: Dict[int, AgentState] = {}
-        self.selected_window: Optional[int] = None
+            # Set coordinate system with (0,0) at top-left
+            self.screen.setworldcoordinates(
+                0, self.screen_height, self.screen_width, 0
+            )
+            self.renderer = TurtleRenderer(self.screen)
+        elif renderer == "canvas":
+            # Canvas coordinates already have (0,0) at top-left
+            self.screen = None
+            self.renderer = CanvasRenderer(self.canvas)
+        elif renderer == "null":
+            self.screen = None
+            self.renderer = NullRenderer()
+        else:
+            raise ValueError(f"Unknown renderer {renderer}")
+
+        self.num_agents = num_agents
+        self.agents = AgentStore(num_agents)
+        self.operators: List[Operator] = []
+        self.recorders: List[TraceRecorder] = []
+        self._agent_operator: Dict[int, Operator] = {}
         self.movement_speed = 20
         self.rotation_speed = 15
 
         self.position_callback: Optional[
             Callable[[Dict[int, Tuple[float, float]]], None]
         ] = None
-
-        # Add escape key binding for exiting fullscreen
-        self.root.bind("<Escape>", lambda e: self.on_escape())
+        self._position_subscription: Optional[PositionSubscription] = None
 
         self._initialize_agents()
-        self._setup_controls()
-        self.agent_selector = AgentSelect(
-            self.agents[0], self.agents[1], "position", 60
-        )
 
-        self.running = True
-        self.background_thread = threading.Thread(
-            target=self._background_agent, daemon=True
+        # Agent state changes go out to position subscribers off the UI thread
+        self.positions = PositionPublisher(self.agents)
+
+        # Agent motion runs on a fixed timestep, the Tk loop only samples it
+        self.simulation = SimulationCore(
+            self.agents, self._get_bounds(), self.rotation_speed
         )
-        self.background_thread.start()
+        self.frame_interval = 1 / 60
+        self._interpolated: Set[int] = set()
+
+    @staticmethod
+    def _is_frame_source(source: Any) -> bool:
+        return source is not None and not isinstance(source, (int, str))
+
+    @staticmethod
+    def _is_gaze_source(source: Any) -> bool:
+        return hasattr(source, "wait_for_sample")
+
+    @staticmethod
+    def _source_key(source: Any) -> Any:
+        # Webcam index, path or the FrameSource object itself
+        if source is None:
+            return 0
+        if isinstance(source, str) and source.isdigit():
+            return int(source)
+        return source
+
+    def _build_operators(self, configs: List[OperatorConfig], gaze_views: List[Any]) -> None:
+        # Agents not claimed by any operator are split between the operators without a list
+        claimed = [agent_id for config in configs if config.agents is not None for agent_id in config.agents]
+        if len(claimed) != len(set(claimed)):
+            raise ValueError("An agent can only be controlled by one operator")
+        unknown = set(claimed) - set(self.agents.ids.tolist())
+        if unknown:
+            raise ValueError(f"Unknown agents {sorted(unknown)}")
+
+        unassigned = [index for index, config in enumerate(configs) if config.agents is None]
+        remaining = [agent_id for agent_id in self.agents.ids.tolist() if agent_id not in set(claimed)]
+        split = split_agents(remaining, len(unassigned)) if unassigned else []
+        groups = {index: agent_ids for index, agent_ids in zip(unassigned, split)}
+
+        for index, (config, gaze) in enumerate(zip(configs, gaze_views)):
+            agent_ids = list(config.agents) if config.agents is not None else groups[index]
+            compensation = None
+            if self.prediction is not None:
+                compensation = LatencyCompensator(self.prediction, display_latency=self.frame_interval)
+            selector = AgentSelect(self.agents, "position", 60, agent_ids=agent_ids, compensation=compensation)
+
+            recorder = None
+            if self.record_trace is not None:
+                root, ext = os.path.splitext(self.record_trace)
+                path = self.record_trace if len(configs) == 1 else f"{root}_{index}{ext}"
+                recorder = TraceRecorder(path, agent_ids, metadata={"prediction": self.prediction})
+                self.recorders.append(recorder)
+
+            operator = Operator(
+                name=config.name or f"Operator {index + 1}",
+                gaze=gaze,
+                agent_ids=agent_ids,
+                keys=config.keys or OPERATOR_KEYS[index % len(OPERATOR_KEYS)],
+                selector=selector,
+                scheduler=SelectionScheduler(gaze, selector, pacing="camera", recorder=recorder),
+            )
+            self.operators.append(operator)
+            for agent_id in agent_ids:
+                self._agent_operator[agent_id] = operator
 
-        self.running = True
-        self._update_movement()
+    @property
+    def selected_window(self) -> Optional[int]:
+        # Selection of the first operator
+        return self.operators[0].selected if self.operators else None
 
     def set_position_callback(
         self, callback: Callable[[Dict[int, Tuple[float, float]]], None]
     ) -> None:
-        """Set a callback function to receive position updates."""
+        """Set a callback function to receive all positions whenever an agent moves."""
+        if self._position_subscription is not None:
+            self._position_subscription.close()
         self.position_callback = callback
+        self._position_subscription = self.positions.subscribe(callback, format="positions")
 
-    def _initialize_agents(self) -> None:
-        # Position turtles relative to screen size
-        left_pos = (self.screen_width * 0.25, self.screen_height * 0.5)
-        right_pos = (self.screen_width * 0.75, self.screen_height * 0.5)
-
-        # Create and configure first turtle
-        turtle1 = RawTurtle(self.screen)
-        turtle1.penup()
-        turtle1.shape("turtle")
-        turtle1.color("red")
-        turtle1.shapesize(3, 3)  # Make turtle 3 times larger
-        turtle1.setpos(*left_pos)
-
-        self.agents[0] = AgentState(
-            turtle=turtle1, position=left_pos, heading=0, speed=self.movement_speed
-        )
+    def subscribe_positions(
+        self, callback: Callable[[Any], None], max_rate: Optional[float] = None, format: str = "delta"
+    ) -> PositionSubscription:
+        """Add a position subscriber, see PositionPublisher.subscribe."""
+        return self.positions.subscribe(callback, max_rate, format)
 
-        # Create and configure second turtle
-        turtle2 = RawTurtle(self.screen)
-        turtle2.penup()
-        turtle2.shape("turtle")
-        turtle2.color("green")
-        turtle2.shapesize(3, 3)  # Make turtle 3 times larger
-        turtle2.setpos(*right_pos)
+    def _initial_positions(self) -> np.ndarray:
+        # Position turtles relative to screen size, spread over an even grid
+        cols = int(np.ceil(np.sqrt(self.num_agents * self.screen_width / self.screen_height)))
+        rows = int(np.ceil(self.num_agents / cols))
+        col, row = np.divmod(np.arange(self.num_agents), rows)
 
-        self.agents[1] = AgentState(
-            turtle=turtle2, position=right_pos, heading=0, speed=self.movement_speed
-        )
+        x = (col + 0.5) / cols * self.screen_width
+        y = (row + 0.5) / rows * self.screen_height
+        return np.column_stack((x, y))
 
-    def _setup_controls(self) -> None:
-        self.root.bind("1", lambda event: self.select_window(0))
-        self.root.bind("2", lambda event: self.select_window(1))
+    def _initialize_agents(self) -> None:
+        # Scale turtles down as more of them share the screen (3x for two turtles)
+        size = max(3 / np.sqrt(max(self.num_agents, 2) / 2), 0.5)
+
+        for agent_id, pos in enumerate(self._initial_positions()):
+            agent = self.agents.add(
+                agent_id,
+                position=pos,
+                heading=0,
+                speed=self.movement_speed,
+                color=self.AGENT_COLORS[agent_id % len(self.AGENT_COLORS)],
+            )
+            self.renderer.add_agent(agent_id, agent, size)
 
-        self.root.bind("<Up>", lambda event: self._start_forward())
-        self.root.bind("<Down>", lambda event: self._start_backward())
-        self.root.bind("<Left>", lambda event: self._start_left())
-        self.root.bind("<Right>", lambda event: self._start_right())
+        self.renderer.render(self.agents)
 
-        self.root.bind("<KeyRelease-Up>", lambda event: self._stop_forward())
-        self.root.bind("<KeyRelease-Down>", lambda event: self._stop_backward())
-        self.root.bind("<KeyRelease-Left>", lambda event: self._stop_left())
-        self.root.bind("<KeyRelease-Right>", lambda event: self._stop_right())
+    def _setup_controls(self) -> None:
+        # Tk key name -> (press, release) actions. Headless runs call them through
+        # press_key/release_key, the window binds them to key events
+        self.key_actions: Dict[str, Tuple[Callable[[], None], Optional[Callable[[], None]]]] = {}
+        for agent_id in range(min(self.num_agents, 9)):
+            self.key_actions[str(agent_id + 1)] = (lambda i=agent_id: self._select_from_key(i), None)
+
+        # Movement keys of each operator drive that operator's selected agent. Speed keys are
+        # shared and apply to the operator whose movement key was pressed last
+        self._speed_operator: Optional[Operator] = self.operators[0] if self.operators else None
+        for operator in self.operators:
+            for flag, key in (
+                ("moving_forward", operator.keys["forward"]),
+                ("moving_backward", operator.keys["backward"]),
+                ("turning_left", operator.keys["left"]),
+                ("turning_right", operator.keys["right"]),
+            ):
+                self.key_actions[key] = (
+                    lambda o=operator, f=flag: self._set_motion(o, f, True),
+                    lambda o=operator, f=flag: self._set_motion(o, f, False),
+                )
+
+        for key in ("equal", "plus", "KP_Add"):
+            self.key_actions[key] = (self._increase_speed, None)
+        for key in ("minus", "KP_Subtract"):
+            self.key_actions[key] = (self._decrease_speed, None)
+
+        self.key_actions["p"] = (lambda: self._set_selection_mode("position"), None)
+        self.key_actions["v"] = (lambda: self._set_selection_mode("velocity"), None)
+
+        self.key_actions["d"] = (self.print_canvas_info, None)
+
+        if self.root is None:
+            return
+        for key, (press, release) in self.key_actions.items():
+            self.root.bind(f"<KeyPress-{key}>", lambda event, action=press: action())
+            if release is not None:
+                self.root.bind(f"<KeyRelease-{key}>", lambda event, action=release: action())
+
+    def _show_instructions(self) -> None:
+        # Movement keys come from the operators, so the text is filled in once they exist
+        lines = []
+        for operator in self.operators:
+            keys = operator.keys
+            names = [keys[name] for name in ("forward", "left", "backward", "right")]
+            if keys == OPERATOR_KEYS[0]:
+                label = "Arrow keys"
+            elif all(name.startswith("KP_") for name in names):
+                label = "KP " + "/".join(name[3:] for name in names)
+            else:
+                label = "/".join(names)
+            lines.append(label if len(self.operators) == 1 else f"{operator.name} - {label}")
+
+        instructions_text = "\n" + "\n".join(f"{line}: Move/rotate selected turtle" for line in lines)
+        instructions_text += """
++/-: Adjust speed of the last moved turtle
+d: Print canvas info
+p/v: eye position/velocity
+Escape: Exit fullscreen"""
 
-        self.root.bind("<equal>", lambda event: self._increase_speed())
-        self.root.bind("<minus>", lambda event: self._decrease_speed())
-        self.root.bind("<plus>", lambda event: self._increase_speed())
-        self.root.bind("<KP_Add>", lambda event: self._increase_speed())
-        self.root.bind("<KP_Subtract>", lambda event: self._decrease_speed())
+        self.instructions.config(state="normal")
+        self.instructions.delete("1.0", tk.END)
+        self.instructions.insert(tk.END, instructions_text)
+        self.instructions.config(state="disabled")
+        self.instructions_frame.place_configure(relheight=min(0.25 + 0.04 * (len(lines) - 1), 0.5))
 
-        self.root.bind("p", lambda event: self.agent_selector.setMode("position"))
-        self.root.bind("v", lambda event: self.agent_selector.setMode("velocity"))
+    def press_key(self, key: str) -> None:
+        """Run the action bound to a Tk key name, as if the key was pressed."""
+        self.key_actions[key][0]()
 
-        self.root.bind("d", lambda event: self.print_canvas_info())
+    def release_key(self, key: str) -> None:
+        """Run the release action bound to a Tk key name, if it has one."""
+        release = self.key_actions[key][1]
+        if release is not None:
+            release()
 
     def get_all_positions(self) -> Dict[int, Tuple[float, float]]:
         """Return current positions of all turtles."""
-        return {
-            agent_id: agent.turtle.position() for agent_id, agent in self.agents.items()
-        }
+        return dict(
+            zip(self.agents.ids.tolist(), map(tuple, self.agents.positions.tolist()))
+        )
 
     def _get_bounds(self) -> Tuple[float, float, float, float]:
         padding = 20
@@ -176,153 +472,320 @@ Escape: Exit fullscreen"""
             self.screen_height - padding,
         )
 
-    def _clamp_position(self, pos: Tuple[float, float]) -> Tuple[float, float]:
-        x, y = pos
-        min_x, max_x, min_y, max_y = self._get_bounds()
-
-        x = max(min_x, min(max_x, x))
-        y = max(min_y, min(max_y, y))
-
-        return (x, y)
-
-    def _calculate_new_position(
-        self, agent: AgentState, forward: bool = True
-    ) -> Tuple[float, float]:
-        heading_rad = np.radians(agent.turtle.heading())
-
-        direction = 1 if forward else -1
-        dx = direction * agent.speed * np.cos(heading_rad)
-        dy = direction * agent.speed * np.sin(heading_rad)
-
-        current_x, current_y = agent.turtle.position()
-        new_x = current_x + dx
-        new_y = current_y + dy
-
-        return self._clamp_position((new_x, new_y))
-
     def _update_movement(self):
+        now = time.perf_counter()
+        self.tick(now - self._last_tick)
+        self._last_tick = now
+
+        if self.running:
+            self._schedule_frame()
+
+    def tick(self, elapsed: float) -> None:
+        """
+        ## Tick
+
+        One UI frame: applies gaze selections, advances the simulation, renders and reports
+        positions. Driven by the Tk loop, or by run_headless without a window
+
+        Parameters
+        ----------
+        elapsed : float
+            Time since the previous tick in seconds
+        """
+        start = metrics.clock()
         try:
-            if self.selected_window is not None:
-                agent = self.agents[self.selected_window]
-
-                if agent.moving_forward or agent.moving_backward:
-                    new_pos = self._calculate_new_position(
-                        agent, forward=agent.moving_forward
-                    )
-
-                    agent.turtle.setposition(new_pos)
-                    agent.position = new_pos
-
-                if agent.turning_left:
-                    agent.turtle.left(-self.rotation_speed)
-                    agent.heading = agent.turtle.heading()
-                if agent.turning_right:
-                    agent.turtle.right(-self.rotation_speed)
-                    agent.heading = agent.turtle.heading()
-
-            # Call position callback if set
-            if self.position_callback:
-                positions = self.get_all_positions()
-                self.position_callback(positions)
-
-            if self.running:
-                self.root.after(16, self._update_movement)
+            # Startup is complete once the first gaze sample arrives, the breakdown then
+            # includes the stages that finished in the background
+            if not self._startup_logged and self.test_gaze.sample_seq:
+                self._startup_logged = True
+                self.startup.log()
+
+            # Apply the latest gaze selection of each operator on the UI thread
+            for operator in self.operators:
+                selection = operator.scheduler.poll()
+                if selection is not None:
+                    self.select_window(selection)
+
+            if self.bridge is not None:
+                # A bad batch must not hold up the frame
+                try:
+                    self._apply_bridge_commands()
+                except Exception as e:
+                    print(f"Error in bridge commands: {e}")
+
+            # Run the simulation steps covered by the time since the last frame
+            moved = self.simulation.advance(elapsed)
+
+            if moved:
+                for operator in self.operators:
+                    operator.selector.sync_positions()
+
+            # Draw moving agents between their last two simulated poses
+            poses = self.simulation.interpolated()
+            self.renderer.render(
+                self.agents, dirty=moved | self._interpolated | poses.keys(), poses=poses
+            )
+            self._interpolated = set(poses)
+
+            # Hand changed agents to the position subscribers
+            self.positions.publish()
         except Exception as e:
             print(f"Error in update movement: {e}")
-            if self.running:
-                self.root.after(16, self._update_movement)
+        metrics.record("tick", start)
+
+    def _apply_bridge_commands(self) -> None:
+        commands = self.bridge.drain()
+        if not len(commands):
+            return
+
+        start = metrics.clock()
+        selections, rejected = apply_commands(self.agents, commands)
+        for agent_id in selections.tolist():
+            # Agents without an operator exist in the store but cannot be selected
+            if not self._select_from_key(agent_id):
+                rejected += 1
+        self.bridge.applied += len(commands) - rejected
+        self.bridge.rejected += rejected
+        metrics.record("bridge commands", start)
+
+    def _schedule_frame(self) -> None:
+        # Aim at fixed frame deadlines so the after() chain does not drift under load
+        now = time.perf_counter()
+        self._next_frame += self.frame_interval
+        if self._next_frame < now:
+            metrics.count("late ticks")
+            self._next_frame = now
+        delay_ms = max(1, round((self._next_frame - now) * 1000))
+        self.root.after(delay_ms, self._update_movement)
 
     def select_window(self, window_id: int) -> bool:
         if window_id not in self.agents:
             return False
 
-        if self.selected_window is not None:
-            prev_agent = self.agents[self.selected_window]
-            if self.selected_window != window_id:
-                prev_agent.selected = False
-                prev_agent.moving_forward = False
-                prev_agent.moving_backward = False
-                prev_agent.turning_left = False
-                prev_agent.turning_right = False
-                prev_agent.turtle.color(prev_agent.turtle.color()[0])
-
-        self.selected_window = window_id
+        # Each operator has one selected agent among their own agents. Agents left out of
+        # every operator's `agents` cannot be selected
+        operator = self._agent_operator.get(window_id)
+        if operator is None:
+            return False
+
+        # Nothing to redraw if the agent is already selected
+        if window_id == operator.selected:
+            return True
+
+        start = metrics.clock()
+
+        if operator.selected is not None:
+            prev_agent = self.agents[operator.selected]
+            prev_agent.selected = False
+            prev_agent.moving_forward = False
+            prev_agent.moving_backward = False
+            prev_agent.turning_left = False
+            prev_agent.turning_right = False
+            self.renderer.highlight(operator.selected, prev_agent, False)
+
+        operator.selected = window_id
         selected_agent = self.agents[window_id]
         selected_agent.selected = True
+        self.renderer.highlight(window_id, selected_agent, True)
+        if self.bridge is not None:
+            self.bridge.send_selection(self.operators.index(operator), window_id)
+        metrics.record("select_window", start)
 
-        original_color = selected_agent.turtle.color()[0]
-        selected_agent.turtle.color(original_color, "white")
+        return True
 
+    def _select_from_key(self, window_id: int) -> bool:
+        if not self.select_window(window_id):
+            return False
+        # Keep gaze selection from immediately switching back
+        self._agent_operator[window_id].scheduler.override(window_id)
         return True
 
+    def _set_selection_mode(self, mode: str) -> None:
+        for operator in self.operators:
+            operator.selector.setMode(mode)
+
     def print_canvas_info(self):
         print(f"\nScreen dimensions: {self.screen_width}x{self.screen_height}")
         bounds = self._get_bounds()
         print(f"Coordinate bounds: {bounds}")
         for agent_id, agent in self.agents.items():
-            print(f"Turtle {agent_id} position: {agent.turtle.position()}")
-
-    def _start_forward(self):
-        if self.selected_window is not None:
-            self.agents[self.selected_window].moving_forward = True
-
-    def _start_backward(self):
-        if self.selected_window is not None:
-            self.agents[self.selected_window].moving_backward = True
-
-    def _start_left(self):
-        if self.selected_window is not None:
-            self.agents[self.selected_window].turning_left = True
+            print(f"Turtle {agent_id} position: {agent.position}")
 
-    def _start_right(self):
-        if self.selected_window is not None:
-            self.agents[self.selected_window].turning_right = True
+    def _set_motion(self, operator: Operator, flag: str, value: bool) -> None:
+        if value:
+            self._speed_operator = operator
+        if operator.selected is not None:
+            setattr(self.agents[operator.selected], flag, value)
 
-    def _stop_forward(self):
-        if self.selected_window is not None:
-            self.agents[self.selected_window].moving_forward = False
-
-    def _stop_backward(self):
-        if self.selected_window is not None:
-            self.agents[self.selected_window].moving_backward = False
-
-    def _stop_left(self):
-        if self.selected_window is not None:
-            self.agents[self.selected_window].turning_left = False
-
-    def _stop_right(self):
-        if self.selected_window is not None:
-            self.agents[self.selected_window].turning_right = False
+    @property
+    def _speed_agent(self) -> Optional[int]:
+        # Selected agent of the operator that moved last
+        return None if self._speed_operator is None else self._speed_operator.selected
 
     def _increase_speed(self) -> None:
-        if self.selected_window is not None:
-            agent = self.agents[self.selected_window]
+        agent_id = self._speed_agent
+        if agent_id is not None:
+            agent = self.agents[agent_id]
             agent.speed = min(agent.speed + 1, 20)
-            print(f"\nTurtle {self.selected_window + 1} Speed: {agent.speed}")
+            print(f"\nTurtle {agent_id + 1} Speed: {agent.speed}")
 
     def _decrease_speed(self) -> None:
-        if self.selected_window is not None:
-            agent = self.agents[self.selected_window]
+        agent_id = self._speed_agent
+        if agent_id is not None:
+            agent = self.agents[agent_id]
             agent.speed = max(agent.speed - 1, 1)
-            print(f"\nTurtle {self.selected_window + 1} Speed: {agent.speed}")
-
-    def _background_agent(self) -> None:
-        while self.running:
-            self.select_window(
-                self.agent_selector.getAgent(self.test_gaze.gaze_location) - 1
-            )
+            print(f"\nTurtle {agent_id + 1} Speed: {agent.speed}")
 
     def on_escape(self):
-        self.running = False  # Signal the background thread to stop
-        self.root.destroy()  # Close the tkinter window
+        self.running = False  # Stop the update loop
+        for operator in self.operators:
+            operator.scheduler.stop()  # Stop gaze selection
+        for gaze in self.gaze_pipelines:
+            gaze.stop()  # Release the webcams
+        for recorder in self.recorders:
+            recorder.close()  # Write out buffered trace records
+        self.positions.close()  # Stop position subscribers
+        if self.bridge is not None:
+            self.bridge.close()  # Disconnect bridge clients
+        if self.metrics_reporter is not None:
+            self.metrics_reporter.stop()  # Final metrics dump
+        if self.root is not None:
+            self.root.destroy()  # Close the tkinter window
 
     def run(self):
-        self.root.mainloop()
+        if self.root is None:
+            self.run_headless()
+        else:
+            self.root.mainloop()
+
+    def run_headless(
+        self,
+        ticks: Optional[int] = None,
+        duration: Optional[float] = None,
+        rate: Optional[float] = None,
+        script: Optional[Callable[["SingleWindowController", int], None]] = None,
+        close: bool = True,
+    ) -> Dict[str, float]:
+        """
+        ## Run Headless
+
+        Runs the control loop without Tk. Without a rate ticks run back to back and each one
+        advances the simulation by one frame interval, so simulated time does not depend on
+        how fast the machine is. With a rate ticks are paced at that many per second and the
+        simulation follows real time, like the windowed loop. Raises if a gaze thread fails, so a
+        run without gaze is never reported as a throughput number
+
+        Parameters
+        ----------
+        ticks : Optional[int]
+            Stop after this many ticks
+        duration : Optional[float]
+            Stop after this many seconds of wall time
+        rate : Optional[float]
+            Ticks per second, as fast as possible when None
+        script : Optional[Callable[[SingleWindowController, int], None]]
+            Called with the controller and tick index before each tick, e.g. to press keys
+        close : bool
+            Shut down gaze, schedulers and recorders (on_escape) when the run ends
+
+        Returns
+        -------
+        Dict[str, float]
+            ticks, elapsed (s), ticks_per_second, simulated (s) and drawn_agents
+        """
+        if ticks is None and duration is None and rate is None:
+            raise ValueError("An unpaced headless run needs ticks or a duration")
+
+        tick = 0
+        simulated = 0.0
+        start = time.perf_counter()
+        self._last_tick = start
+        next_tick = start
+        try:
+            while self.running and (ticks is None or tick < ticks):
+                now = time.perf_counter()
+                if duration is not None and now - start >= duration:
+                    break
+
+                if script is not None:
+                    script(self, tick)
+
+                if rate is None:
+                    elapsed = self.frame_interval
+                else:
+                    elapsed = now - self._last_tick
+                    self._last_tick = now
+                self.tick(elapsed)
+                simulated += elapsed
+                tick += 1
+
+                for gaze in self.gaze_pipelines:
+                    error = getattr(gaze, "error", None)
+                    if error is not None:
+                        raise Exception(f"Gaze thread failed after {tick} ticks: {error!r}") from error
+
+                if rate is not None:
+                    # Fixed deadlines, like _schedule_frame
+                    next_tick += 1 / rate
+                    delay = next_tick - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        metrics.count("late ticks")
+                        next_tick = time.perf_counter()
+        finally:
+            wall = time.perf_counter() - start
+            if close and self.running:
+                self.on_escape()
+
+        return {
+            "ticks": tick,
+            "elapsed": wall,
+            "ticks_per_second": tick / wall if wall > 0 else float("inf"),
+            "simulated": simulated,
+            "drawn_agents": getattr(self.renderer, "drawn_agents", 0),
+        }
 
 
 def main():
-    controller = SingleWindowController()
-    controller.run()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Gaze based multi agent control")
+    parser.add_argument("--agents", type=int, default=2, help="Number of agents")
+    parser.add_argument("--source", default=None, help='Webcam index, video file or "synthetic"')
+    parser.add_argument("--trace", default=None, help="Play back a recorded gaze trace instead of a camera")
+    parser.add_argument("--renderer", default=None, choices=("turtle", "canvas", "null"))
+    parser.add_argument("--headless", action="store_true", help="Run without a window and print throughput")
+    parser.add_argument("--ticks", type=int, default=None, help="Headless ticks to run")
+    parser.add_argument("--duration", type=float, default=None, help="Headless seconds to run")
+    parser.add_argument("--rate", type=float, default=None, help="Headless ticks per second (as fast as possible if unset)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    source = args.source
+    if args.trace is not None:
+        from engine.gaze_trace import TraceGaze
+
+        source = TraceGaze(args.trace, loop=args.headless)
+    controller = SingleWindowController(
+        operators=[OperatorConfig(source=source)],
+        num_agents=args.agents,
+        renderer=args.renderer,
+        headless=args.headless,
+    )
+
+    if not args.headless:
+        controller.run()
+        return
+
+    if args.ticks is None and args.duration is None:
+        args.duration = 10.0
+    stats = controller.run_headless(ticks=args.ticks, duration=args.duration, rate=args.rate)
+    print(
+        f"{stats['ticks']} ticks in {stats['elapsed']:.2f} s: {stats['ticks_per_second']:.1f} ticks/s, "
+        f"{stats['simulated']:.2f} s simulated, {stats['drawn_agents']} agent draws"
+    )
 
 
 if __name__ == "__main__":
@@ -1,166 +1,171 @@
-from engine.agent_state import AgentState
+from engine.agent_state import AgentStore
+from engine.gaze_filter import ConstantVelocityFilter, LatencyCompensator
+from engine.spatial_index import GridIndex
 
+from typing import Optional, Sequence, Tuple
 import numpy as np
+import threading
 import time
-from filterpy.kalman import KalmanFilter
-from filterpy.common import Q_discrete_white_noise
 
 
 class AgentSelect:
     def __init__(
-        self, agent1: AgentState, agent2: AgentState, selection_method="position", hz=60
+        self,
+        agents: AgentStore,
+        selection_method="position",
+        hz=60,
+        cell_size: Optional[float] = None,
+        agent_ids: Optional[Sequence[int]] = None,
+        compensation: Optional[LatencyCompensator] = None,
     ):
-        self.agent1 = agent1
-        self.agent2 = agent2
-        self.last_time = None
-        self.selection_method = selection_method
-        if selection_method == "position":
-            self.__method = self.position
-            self.gaze_location = np.array([0, 0])
-            self.gaze_velocity = None
-        elif selection_method == "velocity":
-            self.__method = self.velocity
-            self.__velo_cutoff = 50
-            self.__angle_difference = 0.785
-            self.gaze_velocity = np.array([0, 0])
-
-            # Kalman filter init coed
-            self.kf = KalmanFilter(dim_x=4, dim_z=2)
-
-            # Initial state [x, vx, y, vy]
-            self.kf.x = np.array([0.0, 0.0, 0.0, 0.0])
-
-            # State transition matrix
-            dt = 1.0  # initial time step
-
-            self.kf.F = np.array(
-                [
-                    [1.0, dt, 0.0, 0.0],
-                    [0.0, 1.0, 0.0, 0.0],
-                    [0.0, 0.0, 1.0, dt],
-                    [0.0, 0.0, 0.0, 1.0],
-                ]
-            )
-
-            # Measurement function
-            self.kf.H = np.array([[1.0, 0.0, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0]])
-
-            # Measurement noise covariance
-            self.kf.R = np.eye(2) * 10
-
-            # Process noise covariance with initial dt
-            self.kf.Q = Q_discrete_white_noise(dim=4, dt=dt, var=0.1)
-
-            # Error covariance matrix
-            self.kf.P *= 1000
+        # Selection can be limited to a group of agents (e.g. one operator's agents)
+        if agent_ids is None:
+            agent_ids = agents.ids.tolist()
+        if not len(agent_ids):
+            raise ValueError("AgentSelect needs at least one agent")
+
+        self.agents = agents
+        self.agent_ids = np.array(agent_ids, dtype=np.int64)
+        self._store_rows = np.array([agents.row(agent_id) for agent_id in agent_ids], dtype=np.intp)
+        self._rows = {int(agent_id): row for row, agent_id in enumerate(agent_ids)}
+
+        # Snapshot of the store positions, so the selection thread never reads a half
+        # written step. Rows follow agent_ids
+        self.positions = agents.positions[self._store_rows]
+
+        if cell_size is None:
+            # Roughly one agent per cell for agents spread over their bounding box
+            extent = np.ptp(self.positions, axis=0).max() if len(agent_ids) > 1 else 0.0
+            cell_size = max(extent / max(np.sqrt(len(agent_ids)), 1.0), 50.0)
+        self.index = GridIndex(self.positions, cell_size)
+
+        # Positions the last selection was made on, copied under the lock by getAgent so a
+        # recorded selection (and the distances of the debouncer) match what was selected on
+        self.selection_positions = self.positions.copy()
+
+        # Positions are written from the UI thread and read from the selection thread
+        self._lock = threading.Lock()
+
+        # Optional gaze prediction to the expected display time, see getAgent
+        self.compensation = compensation
+
+        self.hz = hz
+        self.gaze_location = np.array([0, 0])
+        self.__velo_cutoff = 50
+        self.__angle_difference = 0.785
+        self.kf: Optional[ConstantVelocityFilter] = None
+        self.gaze_velocity: Optional[np.ndarray] = None
+        self.setMode(selection_method)
 
     def setMode(self, mode: str) -> None:
+        # Called from the UI thread while getAgent runs on the selection thread, so the new
+        # mode is built first and swapped in under the lock
+        kf = self.kf
         if mode == "position":
-            self.__method = self.position
-            self.gaze_location = np.array([0, 0])
-            self.gaze_velocity = None
+            method = self.__position
         elif mode == "velocity":
-            self.__method = self.velocity
-            self.__velo_cutoff = 50
-            self.__angle_difference = 0.785
-            self.gaze_velocity = np.array([0, 0])
-
-            # Kalman filter init coed
-            self.kf = KalmanFilter(dim_x=4, dim_z=2)
-
-            # Initial state [x, vx, y, vy]
-            self.kf.x = np.array([0.0, 0.0, 0.0, 0.0])
-
-            # State transition matrix
-            dt = 1.0  # initial time step
-
-            self.kf.F = np.array(
-                [
-                    [1.0, dt, 0.0, 0.0],
-                    [0.0, 1.0, 0.0, 0.0],
-                    [0.0, 0.0, 1.0, dt],
-                    [0.0, 0.0, 0.0, 1.0],
-                ]
+            method = self.__velocity
+
+            # Constant velocity Kalman filter, state [x, vx, y, vy]. The velocity cutoff and
+            # angle check are tuned for this filter, so it is not shared with a latency
+            # compensator (whose filter is much stiffer)
+            kf = ConstantVelocityFilter(
+                measurement_var=10.0, process_var=0.1, initial_var=1000.0
             )
+        else:
+            raise ValueError(f"Unknown selection mode {mode}")
+
+        # The last filter is kept in position mode, so a selection still running in
+        # velocity mode always has a velocity to read
+        with self._lock:
+            self.kf = kf
+            self.gaze_velocity = None if kf is None else kf.velocity
+            self.__method = method
+            self.selection_method = mode
+
+    def update_position(self, agent_id: int, position: Tuple[float, float]) -> None:
+        """Move one agent in the selection index."""
+        row = self._rows[agent_id]
+        with self._lock:
+            self.positions[row] = position
+            self.index.update(row)
+
+    def sync_positions(self) -> None:
+        """Re-read every agent position, re-indexing only the agents that moved."""
+        self.set_positions(self.agents.positions[self._store_rows])
+
+    def set_positions(self, positions: np.ndarray) -> None:
+        """Overwrite the position snapshot, e.g. from a recorded trace, re-indexing moved agents."""
+        moved = np.flatnonzero(np.any(positions != self.positions, axis=1))
+        with self._lock:
+            self.positions[moved] = positions[moved]
+            for row in moved:
+                self.index.update(row)
+
+    def distance(self, agent_id: int) -> float:
+        """Distance from the last gaze location to an agent, at the positions of the last selection."""
+        x, y = self.selection_positions[self._rows[agent_id]]
+        return float(np.hypot(x - self.gaze_location[0], y - self.gaze_location[1]))
 
-            # Measurement function
-            self.kf.H = np.array([[1.0, 0.0, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0]])
+    def position(self) -> int:
+        with self._lock:
+            return self.__position()
 
-            # Measurement noise covariance
-            self.kf.R = np.eye(2) * 10
+    def velocity(self) -> int:
+        with self._lock:
+            return self.__velocity()
 
-            # Process noise covariance with initial dt
-            self.kf.Q = Q_discrete_white_noise(dim=4, dt=dt, var=0.1)
+    # Selection methods below run with the lock held
 
-            # Error covariance matrix
-            self.kf.P *= 1000
+    def __position(self) -> int:
+        # Closest agent to gaze position
+        row = self.index.nearest(self.gaze_location)
+        return int(self.agent_ids[row])
 
-    def position(self) -> int:
-        # Simple comparison for closest agent to gaze position
-        dist1 = np.linalg.norm(self.gaze_location - self.agent1.position)
-        dist2 = np.linalg.norm(self.gaze_location - self.agent2.position)
-        self.current_time = time.time()
-        if dist1 < dist2:
-            # print("Agent 1")
-            return 1
-        # print("Agent 2")
-        return 2
-
-    def velocity(self) -> AgentState:
-        # Calculate vectors from gaze position to agents
-        agent1_vec = self.agent1.position - self.gaze_location
-        agent2_vec = self.agent2.position - self.gaze_location
-        # Calculate angle between gaze velocity and gaze -> agent
+    def __velocity(self) -> int:
         if np.linalg.norm(self.gaze_velocity) < self.__velo_cutoff:
-            return self.position()
+            return self.__position()
 
-        # Normalize the vectors
-        unit_a1 = agent1_vec / np.linalg.norm(agent1_vec)
-        unit_a2 = agent2_vec / np.linalg.norm(agent2_vec)
-        unit_gv = self.gaze_velocity / np.linalg.norm(self.gaze_velocity)
+        # Vectors from gaze position to agents
+        agent_vecs = self.positions - self.gaze_location
 
-        # Calculate the dot product
-        a1_dot_product = np.dot(unit_a1, unit_gv)
-        a2_dot_product = np.dot(unit_a2, unit_gv)
-
-        # Calculate the angle in radians
-        a1_angle_rad = np.arccos(a1_dot_product)
-        a2_angle_rad = np.arccos(a2_dot_product)
-        if (
-            np.abs(a1_angle_rad) < np.abs(a2_angle_rad)
-            and np.abs(a1_angle_rad - a2_angle_rad) < self.__angle_difference
-        ):
-            return 1
-        elif (
-            np.abs(a1_angle_rad) > np.abs(a2_angle_rad)
-            and np.abs(a1_angle_rad - a2_angle_rad) < self.__angle_difference
-        ):
-            return 2
-        return self.position()
-
-    def getAgent(self, gaze_location: tuple):
-        if self.selection_method == "velocity":
-            # Kalman filter to be implemented
-            current_time = time.time()
-            if self.last_time is not None:
-                dt = current_time - self.last_time
-                self.kf.F = np.array(
-                    [
-                        [1.0, dt, 0.0, 0.0],
-                        [0.0, 1.0, 0.0, 0.0],
-                        [0.0, 0.0, 1.0, dt],
-                        [0.0, 0.0, 0.0, 1.0],
-                    ]
-                )
-                self.kf.Q = Q_discrete_white_noise(dim=4, dt=dt, var=0.1)
-                self.kf.predict()
-
-            measurement = np.array([gaze_location[0], gaze_location[1]])
-            self.kf.update(measurement)
-
-            self.last_time = current_time
-            vx, vy = self.kf.x[1], self.kf.x[3]
-            self.gaze_velocity = np.array([vx, vy])
+        # Angle between gaze velocity and gaze -> agent
+        unit_gv = self.gaze_velocity / np.linalg.norm(self.gaze_velocity)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cos_angles = (agent_vecs @ unit_gv) / np.linalg.norm(agent_vecs, axis=1)
+        angles = np.arccos(np.clip(np.nan_to_num(cos_angles, nan=-1.0), -1.0, 1.0))
+
+        if len(angles) < 2:
+            return int(self.agent_ids[0])
+
+        # Best aligned agent wins if it is not ambiguous against the runner-up
+        best, second = np.argpartition(angles, 1)[:2]
+        if np.abs(angles[best] - angles[second]) < self.__angle_difference:
+            return int(self.agent_ids[best])
+        return self.__position()
+
+    def getAgent(self, gaze_location: tuple, sample_time: Optional[float] = None, now: Optional[float] = None) -> int:
+        # Capture time of the gaze sample, so filters see real sample intervals. `now` is
+        # only given when replaying a recorded trace
+        if now is None:
+            now = time.monotonic()
+        if sample_time is None:
+            sample_time = now
+
+        with self._lock:
+            mode, kf = self.selection_method, self.kf
+
+        if mode == "velocity":
+            # Filter updates the velocity buffer (self.gaze_velocity) in place
+            kf.step(gaze_location, sample_time)
+        if self.compensation is not None:
+            # Select on where the gaze will be once the selection is on screen
+            gaze_location = self.compensation.step(gaze_location, sample_time, now)
         self.gaze_location = np.array([gaze_location[0], gaze_location[1]])
 
-        return self.__method()
+        # Selection and position snapshot in one critical section, so sync_positions on the
+        # UI thread cannot move agents in between
+        with self._lock:
+            choice = self.__method()
+            np.copyto(self.selection_positions, self.positions)
+        return choice
@@ -1,16 +1,248 @@
-from dataclasses import dataclass
 from turtle import RawTurtle
-from typing import Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+
+# Movement flag bits
+MOVING_FORWARD = 1
+MOVING_BACKWARD = 2
+TURNING_LEFT = 4
+TURNING_RIGHT = 8
+
+
+def _flag(bit: int) -> property:
+    def getter(self) -> bool:
+        return bool(self._store.flags[self._row] & bit)
+
+    def setter(self, value: bool) -> None:
+        if value:
+            self._store.flags[self._row] |= bit
+        else:
+            self._store.flags[self._row] &= 0xFF ^ bit
+
+    return property(getter, setter)
 
 
-@dataclass
 class AgentState:
-    turtle: RawTurtle
-    position: Tuple[float, float]
-    heading: float
-    speed: float
-    selected: bool = False
-    moving_forward: bool = False
-    moving_backward: bool = False
-    turning_left: bool = False
-    turning_right: bool = False
\ No newline at end of file
+    """
+    ## Agent State
+
+    Lightweight view of one agent in an AgentStore. Attribute access reads and writes the
+    store's arrays, so per-agent code and vectorized code always see the same state
+
+    Parameters
+    ----------
+    store : AgentStore
+        Store holding the agent
+    row : int
+        Row of the agent in the store arrays
+
+    Returns
+    -------
+    None
+    """
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store: "AgentStore", row: int) -> None:
+        self._store = store
+        self._row = row
+
+    @property
+    def row(self) -> int:
+        return self._row
+
+    @property
+    def position(self) -> Tuple[float, float]:
+        x, y = self._store.positions[self._row]
+        return (float(x), float(y))
+
+    @position.setter
+    def position(self, value: Tuple[float, float]) -> None:
+        self._store.positions[self._row] = value
+
+    @property
+    def heading(self) -> float:
+        return float(self._store.headings[self._row])
+
+    @heading.setter
+    def heading(self, value: float) -> None:
+        self._store.headings[self._row] = value
+
+    @property
+    def speed(self) -> float:
+        return float(self._store.speeds[self._row])
+
+    @speed.setter
+    def speed(self, value: float) -> None:
+        self._store.speeds[self._row] = value
+
+    @property
+    def selected(self) -> bool:
+        return bool(self._store.selected[self._row])
+
+    @selected.setter
+    def selected(self, value: bool) -> None:
+        self._store.selected[self._row] = value
+
+    @property
+    def color(self) -> str:
+        return self._store.colors[self._row]
+
+    @property
+    def turtle(self) -> Optional[RawTurtle]:
+        return self._store.turtles[self._row]
+
+    @turtle.setter
+    def turtle(self, value: Optional[RawTurtle]) -> None:
+        self._store.turtles[self._row] = value
+
+    moving_forward = _flag(MOVING_FORWARD)
+    moving_backward = _flag(MOVING_BACKWARD)
+    turning_left = _flag(TURNING_LEFT)
+    turning_right = _flag(TURNING_RIGHT)
+
+    def __repr__(self) -> str:
+        return (
+            f"AgentState(row={self._row}, position={self.position}, heading={self.heading}, "
+            f"speed={self.speed}, color={self.color!r}, selected={self.selected})"
+        )
+
+
+class AgentStore:
+    """
+    ## Agent Store
+
+    Struct-of-arrays registry of agents. Position, heading, speed and movement flags live in
+    contiguous numpy arrays (one row per agent, in insertion order) so movement, clamping and
+    selection can run over every agent at once. Indexing by agent id returns an AgentState
+    view, so the store can be used like a Dict[int, AgentState]
+
+    Parameters
+    ----------
+    capacity : int
+        Initial number of rows, grown as agents are added
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, capacity: int = 16) -> None:
+        capacity = max(capacity, 1)
+        self._positions = np.zeros((capacity, 2), dtype=np.float64)
+        self._headings = np.zeros(capacity, dtype=np.float64)
+        self._speeds = np.zeros(capacity, dtype=np.float64)
+        self._flags = np.zeros(capacity, dtype=np.uint8)
+        self._selected = np.zeros(capacity, dtype=bool)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+
+        self.colors: List[str] = []
+        self.turtles: List[Optional[RawTurtle]] = []
+
+        self._rows: Dict[int, int] = {}
+        self._views: List[AgentState] = []
+        self._count = 0
+
+    def add(self, agent_id: int, position: Tuple[float, float], heading: float = 0.0,
+            speed: float = 0.0, color: str = "black", turtle: Optional[RawTurtle] = None) -> AgentState:
+        """
+        ## Add
+
+        Appends an agent
+
+        Parameters
+        ----------
+        agent_id : int
+            Id of the new agent
+        position : Tuple[float, float]
+            Start position
+        heading : float
+            Start heading in degrees
+        speed : float
+            px per 60 Hz step
+        color : str
+            Draw color
+        turtle : Optional[RawTurtle]
+            Turtle drawing the agent, if any
+
+        Returns
+        -------
+        AgentState
+            View of the new agent
+        """
+        if agent_id in self._rows:
+            raise ValueError(f"Agent {agent_id} already exists")
+
+        row = self._count
+        if row == len(self._ids):
+            self.__grow(2 * row)
+
+        self._positions[row] = position
+        self._headings[row] = heading
+        self._speeds[row] = speed
+        self._flags[row] = 0
+        self._selected[row] = False
+        self._ids[row] = agent_id
+        self.colors.append(color)
+        self.turtles.append(turtle)
+
+        view = AgentState(self, row)
+        self._rows[agent_id] = row
+        self._views.append(view)
+        self._count += 1
+        return view
+
+    def __grow(self, capacity: int) -> None:
+        for name in ("_positions", "_headings", "_speeds", "_flags", "_selected", "_ids"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[: self._count] = old[: self._count]
+            setattr(self, name, new)
+
+    # Live views of the used rows, valid until the next add()
+    @property
+    def positions(self) -> np.ndarray:
+        return self._positions[: self._count]
+
+    @property
+    def headings(self) -> np.ndarray:
+        return self._headings[: self._count]
+
+    @property
+    def speeds(self) -> np.ndarray:
+        return self._speeds[: self._count]
+
+    @property
+    def flags(self) -> np.ndarray:
+        return self._flags[: self._count]
+
+    @property
+    def selected(self) -> np.ndarray:
+        return self._selected[: self._count]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[: self._count]
+
+    def row(self, agent_id: int) -> int:
+        return self._rows[agent_id]
+
+    def __getitem__(self, agent_id: int) -> AgentState:
+        return self._views[self._rows[agent_id]]
+
+    def __contains__(self, agent_id: object) -> bool:
+        return agent_id in self._rows
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._rows)
+
+    def keys(self):
+        return self._rows.keys()
+
+    def values(self) -> List[AgentState]:
+        return list(self._views)
+
+    def items(self) -> Iterator[Tuple[int, AgentState]]:
+        return ((agent_id, self._views[row]) for agent_id, row in self._rows.items())
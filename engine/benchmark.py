@@ -0,0 +1,255 @@
+from _assets.dlib_typing import _dlib_pybind11
+from engine.face_tracking import FaceTracker, eye_corners, load_face_models
+from engine.frame_source import open_source
+
+from typing import Dict, List, Optional, Sequence, Union
+import numpy as np
+import argparse
+import time
+import cv2
+
+
+def collect_frames(source: Union[int, str], count: int) -> List[np.ndarray]:
+    """
+    ## Collect Frames
+
+    Reads grayscale frames from a frame source so every configuration is measured on the same input
+
+    Parameters
+    ----------
+    source : Union[int, str]
+        Webcam index, video file or image directory
+    count : int
+        Maximum number of frames to read
+
+    Returns
+    -------
+    List[np.ndarray]
+        Grayscale frames, unflipped like the live pipeline
+    """
+    cap = open_source(source, realtime=False)
+    frames = []
+
+    while len(frames) < count:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+
+    cap.release()
+    return frames
+
+
+def benchmark_scales(frames: Sequence[np.ndarray], scales: Sequence[float], detector: _dlib_pybind11.fhog_object_detector,
+                     predictor: _dlib_pybind11.shape_predictor) -> List[Dict[str, float]]:
+    """
+    ## Benchmark Scales
+
+    Measures detection speed and landmark accuracy for each detection scale. Accuracy is the eye center
+    distance to the full resolution result, so the first row (scale 1.0) is the reference
+
+    Parameters
+    ----------
+    frames : Sequence[np.ndarray]
+        Grayscale frames
+    scales : Sequence[float]
+        Detection scales to compare
+    detector : _dlib_pybind11.fhog_object_detector
+        Face detector
+    predictor : _dlib_pybind11.shape_predictor
+        Landmark predictor
+
+    Returns
+    -------
+    List[Dict[str, float]]
+        One result row per scale
+    """
+    reference: List[Optional[np.ndarray]] = []
+    results = []
+
+    for scale in [1.0] + [s for s in scales if s != 1.0]:
+        tracker = FaceTracker(detector, predictor, tracking=False, detection_scale=scale)
+        centers: List[Optional[np.ndarray]] = []
+        detect_time = 0.0
+
+        for gray in frames:
+            start = time.perf_counter()
+            faces = tracker.detect(gray)
+            detect_time += time.perf_counter() - start
+
+            if faces:
+                face = max(faces, key=lambda rect: rect.area())
+                centers.append(eye_corners(predictor(gray, face)).mean(axis=0))
+            else:
+                centers.append(None)
+
+        if scale == 1.0:
+            reference = centers
+
+        errors = [np.linalg.norm(c - r) for c, r in zip(centers, reference) if c is not None and r is not None]
+        results.append({
+            "scale": scale,
+            "detect_ms": 1000 * detect_time / len(frames),
+            "fps": len(frames) / detect_time if detect_time else float("inf"),
+            "detection_rate": sum(c is not None for c in centers) / len(frames),
+            "mean_error_px": float(np.mean(errors)) if errors else float("nan"),
+            "max_error_px": float(np.max(errors)) if errors else float("nan"),
+        })
+
+    return results
+
+
+def benchmark_backends(frames: Sequence[np.ndarray], backends: Sequence[str],
+                       detection_scale: float = 1.0) -> List[Dict[str, Union[str, float]]]:
+    """
+    ## Benchmark Backends
+
+    Measures detection time, landmark time and eye center accuracy of each face backend on
+    the same frames. Accuracy is the eye center distance to the first backend, so that
+    backend is the reference. Backends whose models cannot be loaded are skipped
+
+    Parameters
+    ----------
+    frames : Sequence[np.ndarray]
+        Grayscale frames
+    backends : Sequence[str]
+        Backends to compare (see engine.face_backends), reference first
+    detection_scale : float
+        Scale applied to frames before face detection
+
+    Returns
+    -------
+    List[Dict[str, Union[str, float]]]
+        One result row per backend
+    """
+    reference: Optional[List[Optional[np.ndarray]]] = None
+    results = []
+
+    for backend in backends:
+        try:
+            detector, predictor = load_face_models(backend=backend)
+        except Exception as error:
+            print(f"Skipping {backend}: {error}")
+            continue
+
+        tracker = FaceTracker(detector, predictor, tracking=False, detection_scale=detection_scale)
+        centers: List[Optional[np.ndarray]] = []
+        detect_time = 0.0
+        landmark_time = 0.0
+
+        for gray in frames:
+            start = time.perf_counter()
+            faces = tracker.detect(gray)
+            detect_time += time.perf_counter() - start
+
+            if not faces:
+                centers.append(None)
+                continue
+
+            face = max(faces, key=lambda rect: rect.area())
+            start = time.perf_counter()
+            landmarks = predictor(gray, face)
+            landmark_time += time.perf_counter() - start
+            centers.append(eye_corners(landmarks).mean(axis=0))
+
+        if reference is None:
+            reference = centers
+
+        errors = [np.linalg.norm(c - r) for c, r in zip(centers, reference) if c is not None and r is not None]
+        total_time = detect_time + landmark_time
+        results.append({
+            "backend": backend,
+            "detect_ms": 1000 * detect_time / len(frames),
+            "landmark_ms": 1000 * landmark_time / max(sum(c is not None for c in centers), 1),
+            "fps": len(frames) / total_time if total_time else float("inf"),
+            "detection_rate": sum(c is not None for c in centers) / len(frames),
+            "mean_error_px": float(np.mean(errors)) if errors else float("nan"),
+            "max_error_px": float(np.max(errors)) if errors else float("nan"),
+        })
+
+    return results
+
+
+def pick_backend(results: Sequence[Dict[str, Union[str, float]]], max_error: float,
+                 min_detection_rate: float = 0.9) -> Optional[str]:
+    """
+    ## Pick Backend
+
+    Fastest backend within the accuracy bar
+
+    Parameters
+    ----------
+    results : Sequence[Dict[str, Union[str, float]]]
+        Rows from `benchmark_backends`
+    max_error : float
+        Largest acceptable mean eye center error in px
+    min_detection_rate : float
+        Smallest acceptable detection rate, relative to the reference backend
+
+    Returns
+    -------
+    Optional[str]
+        Backend name, None if no backend meets the bar
+    """
+    if not results:
+        return None
+
+    reference_rate = results[0]["detection_rate"]
+    passing = [
+        row for row in results
+        if row["mean_error_px"] <= max_error and row["detection_rate"] >= min_detection_rate * reference_rate
+    ]
+    return max(passing, key=lambda row: row["fps"])["backend"] if passing else None
+
+
+def format_report(results: Sequence[Dict[str, float]], frame_shape: Sequence[int]) -> str:
+    header = f"Detection scale report ({len(results)} scales, frames {frame_shape[1]}x{frame_shape[0]})"
+    lines = [
+        header,
+        f"{'scale':>6} {'detect ms':>10} {'fps':>8} {'detected':>9} {'mean err px':>12} {'max err px':>11}",
+    ]
+    for row in results:
+        lines.append(f"{row['scale']:>6.2f} {row['detect_ms']:>10.2f} {row['fps']:>8.1f} {row['detection_rate']:>8.0%} "
+                     f"{row['mean_error_px']:>12.2f} {row['max_error_px']:>11.2f}")
+    return "\n".join(lines)
+
+
+def format_backend_report(results: Sequence[Dict[str, Union[str, float]]], frame_shape: Sequence[int]) -> str:
+    header = f"Face backend report ({len(results)} backends, frames {frame_shape[1]}x{frame_shape[0]})"
+    lines = [
+        header,
+        f"{'backend':>14} {'detect ms':>10} {'landmark ms':>12} {'fps':>8} {'detected':>9} {'mean err px':>12} {'max err px':>11}",
+    ]
+    for row in results:
+        lines.append(f"{row['backend']:>14} {row['detect_ms']:>10.2f} {row['landmark_ms']:>12.3f} {row['fps']:>8.1f} "
+                     f"{row['detection_rate']:>8.0%} {row['mean_error_px']:>12.2f} {row['max_error_px']:>11.2f}")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Face detection accuracy vs speed benchmark")
+    parser.add_argument("--source", default="0", help="Webcam index, video file or image directory")
+    parser.add_argument("--frames", type=int, default=200, help="Number of frames to measure")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1.0, 0.75, 0.5, 0.33, 0.25])
+    parser.add_argument("--backend", default="dlib", help="Face backend for the scale report")
+    parser.add_argument("--backends", nargs="+", help="Compare these face backends (reference first), e.g. dlib eyes haar")
+    parser.add_argument("--detection-scale", type=float, default=1.0, help="Detection scale for the backend report")
+    parser.add_argument("--max-error", type=float, default=3.0, help="Accuracy bar in px for the recommended backend")
+    args = parser.parse_args()
+
+    frames = collect_frames(args.source, args.frames)
+    if not frames:
+        raise Exception(f"Could not read frames from {args.source}.")
+
+    if args.backends:
+        results = benchmark_backends(frames, args.backends, args.detection_scale)
+        print(format_backend_report(results, frames[0].shape))
+        print(f"Fastest backend within {args.max_error:.1f} px: {pick_backend(results, args.max_error)}")
+        return
+
+    detector, predictor = load_face_models(backend=args.backend)
+    print(format_report(benchmark_scales(frames, args.scales, detector, predictor), frames[0].shape))
+
+
+if __name__ == "__main__":
+    main()
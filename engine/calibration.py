@@ -0,0 +1,280 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+
+# Minimum number of point pairs that determine each model
+MODEL_POINTS = {"affine": 3, "homography": 4, "poly2": 6}
+
+
+def calibration_grid(width: int, height: int, points: int = 5, margin: Optional[int] = None) -> List[Tuple[int, int]]:
+    """
+    ## Calibration Grid
+
+    Screen positions of the calibration dots
+
+    Parameters
+    ----------
+    width : int
+        Screen width in px
+    height : int
+        Screen height in px
+    points : int
+        5 for the corners and center, or a square number (9, 16, ...) for an even grid
+    margin : Optional[int]
+        Distance of the outer dots from the screen edge. Defaults to the dot radius
+
+    Returns
+    -------
+    List[Tuple[int, int]]
+        Dot positions in px, the center dot last for the 5 point layout
+    """
+    if margin is None:
+        margin = round(max(width, height) / 100)
+
+    if points == 5:
+        # Top left, top right, bottom left, bottom right, center
+        return [
+            (margin, margin),
+            (width - margin, margin),
+            (margin, height - margin),
+            (width - margin, height - margin),
+            (width // 2, height // 2),
+        ]
+
+    side = int(round(np.sqrt(points)))
+    if side * side != points or side < 2:
+        raise ValueError(f"Calibration needs 5 or a square number of points, got {points}")
+
+    xs = np.linspace(margin, width - margin, side).round().astype(int)
+    ys = np.linspace(margin, height - margin, side).round().astype(int)
+    return [(int(x), int(y)) for y in ys for x in xs]
+
+
+class CalibrationMap:
+    """
+    ## Calibration Map
+
+    Fitted map from raw gaze (webcam reference frame) to screen px
+
+    Parameters
+    ----------
+    model : str
+        "affine", "homography" or "poly2"
+    params : np.ndarray
+        2 x 3 matrix (affine), 3 x 3 matrix (homography) or 2 x 6 coefficients of
+        [1, x, y, x^2, xy, y^2] in normalized coordinates (poly2)
+    center : Tuple[float, float]
+        Input offset used to normalize poly2 inputs
+    scale : float
+        Input scale used to normalize poly2 inputs
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, model: str, params: np.ndarray, center: Tuple[float, float] = (0.0, 0.0),
+                 scale: float = 1.0) -> None:
+        if model not in MODEL_POINTS:
+            raise ValueError(f"Unknown calibration model {model}")
+
+        self.model = model
+        self.params = np.asarray(params, dtype=np.float64)
+        self.center = (float(center[0]), float(center[1]))
+        self.scale = float(scale)
+
+        # Matrix entries as Python floats, so map_point never touches numpy
+        self._coefficients = tuple(float(value) for value in self.params.ravel())
+
+        # Filled in by fit_calibration
+        self.inliers: Optional[np.ndarray] = None
+        self.rms_error: Optional[float] = None
+
+    @classmethod
+    def from_transform(cls, transform: Sequence[Sequence[float]]) -> "CalibrationMap":
+        """
+        ## From Transform
+
+        Wraps a plain 2 x 3 affine or 3 x 3 homography matrix (e.g. an older calibration file)
+        """
+        transform = np.asarray(transform, dtype=np.float64)
+        if transform.shape == (2, 3):
+            return cls("affine", transform)
+        if transform.shape == (3, 3):
+            return cls("homography", transform)
+        raise ValueError(f"Calibration transform must be 2 x 3 or 3 x 3, got {transform.shape}")
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CalibrationMap":
+        if "model" not in data:
+            return cls.from_transform(data["transform"])
+        return cls(data["model"], data["transform"], data.get("center", (0.0, 0.0)), data.get("scale", 1.0))
+
+    def to_dict(self) -> Dict:
+        data = {"model": self.model, "transform": self.params.tolist()}
+        if self.model == "poly2":
+            data["center"] = list(self.center)
+            data["scale"] = self.scale
+        return data
+
+    def apply(self, points: np.ndarray) -> np.ndarray:
+        """
+        ## Apply
+
+        Maps raw gaze points to the screen
+
+        Parameters
+        ----------
+        points : np.ndarray
+            (..., 2) raw gaze points
+
+        Returns
+        -------
+        np.ndarray
+            (..., 2) screen points in px
+        """
+        points = np.asarray(points, dtype=np.float64)
+        x, y = points[..., 0], points[..., 1]
+        p = self.params
+
+        if self.model == "affine":
+            return np.stack((p[0, 0] * x + p[0, 1] * y + p[0, 2], p[1, 0] * x + p[1, 1] * y + p[1, 2]), axis=-1)
+
+        if self.model == "homography":
+            w = p[2, 0] * x + p[2, 1] * y + p[2, 2]
+            return np.stack(
+                ((p[0, 0] * x + p[0, 1] * y + p[0, 2]) / w, (p[1, 0] * x + p[1, 1] * y + p[1, 2]) / w), axis=-1
+            )
+
+        return _poly_terms(points, self.center, self.scale) @ p.T
+
+    def map_point(self, point: Tuple[float, float]) -> Tuple[float, float]:
+        """
+        ## Map Point
+
+        Maps a single raw gaze point with plain float arithmetic (no array allocation for
+        affine and homography maps)
+        """
+        x, y = point
+        if self.model == "affine":
+            a, b, c, d, e, f = self._coefficients
+            return (a * x + b * y + c, d * x + e * y + f)
+
+        if self.model == "homography":
+            a, b, c, d, e, f, g, h, i = self._coefficients
+            w = g * x + h * y + i
+            return ((a * x + b * y + c) / w, (d * x + e * y + f) / w)
+
+        mapped = self.apply(np.array([x, y], dtype=np.float64))
+        return (float(mapped[0]), float(mapped[1]))
+
+
+def _poly_terms(points: np.ndarray, center: Tuple[float, float], scale: float) -> np.ndarray:
+    x = (points[..., 0] - center[0]) / scale
+    y = (points[..., 1] - center[1]) / scale
+    return np.stack((np.ones_like(x), x, y, x * x, x * y, y * y), axis=-1)
+
+
+def _normalization(points: np.ndarray) -> Tuple[np.ndarray, float]:
+    # Center on the mean and scale the mean distance to sqrt(2) (Hartley normalization)
+    center = points.mean(axis=0)
+    spread = np.sqrt(((points - center) ** 2).sum(axis=1)).mean()
+    return center, (spread / np.sqrt(2.0)) if spread > 0 else 1.0
+
+
+def _fit(model: str, src: np.ndarray, dst: np.ndarray) -> CalibrationMap:
+    center, scale = _normalization(src)
+
+    if model == "poly2":
+        coeffs, *_ = np.linalg.lstsq(_poly_terms(src, center, scale), dst, rcond=None)
+        return CalibrationMap("poly2", coeffs.T, center, scale)
+
+    # Fit in normalized input coordinates, then fold the normalization into the matrix
+    norm = np.array([[1 / scale, 0, -center[0] / scale], [0, 1 / scale, -center[1] / scale], [0, 0, 1]])
+    xn = (src - center) / scale
+
+    if model == "affine":
+        design = np.column_stack((xn, np.ones(len(xn))))
+        coeffs, *_ = np.linalg.lstsq(design, dst, rcond=None)
+        return CalibrationMap("affine", coeffs.T @ norm)
+
+    # Homography by direct linear transform, outputs normalized as well
+    dst_center, dst_scale = _normalization(dst)
+    yn = (dst - dst_center) / dst_scale
+    zeros, ones = np.zeros(len(xn)), np.ones(len(xn))
+    rows_x = np.column_stack((xn, ones, zeros, zeros, zeros, -yn[:, :1] * xn, -yn[:, 0]))
+    rows_y = np.column_stack((zeros, zeros, zeros, xn, ones, -yn[:, 1:] * xn, -yn[:, 1]))
+    _, _, vt = np.linalg.svd(np.vstack((rows_x, rows_y)))
+    h = vt[-1].reshape(3, 3)
+
+    denorm = np.array([[dst_scale, 0, dst_center[0]], [0, dst_scale, dst_center[1]], [0, 0, 1]])
+    h = denorm @ h @ norm
+    return CalibrationMap("homography", h / h[2, 2])
+
+
+def fit_calibration(gaze_points: Sequence[Tuple[float, float]], screen_points: Sequence[Tuple[float, float]],
+                    model: str = "affine", ransac_threshold: Optional[float] = None, iterations: int = 200,
+                    seed: Optional[int] = 0) -> CalibrationMap:
+    """
+    ## Fit Calibration
+
+    Least squares fit of a raw gaze to screen map over all calibration samples, optionally
+    rejecting outliers with RANSAC first. Cost grows linearly with the number of samples
+
+    Parameters
+    ----------
+    gaze_points : Sequence[Tuple[float, float]]
+        Raw gaze samples
+    screen_points : Sequence[Tuple[float, float]]
+        Screen position of the dot shown for each sample
+    model : str
+        "affine", "homography" or "poly2"
+    ransac_threshold : Optional[float]
+        Screen distance in px beyond which a sample counts as an outlier. No outlier
+        rejection when None
+    iterations : int
+        RANSAC hypotheses to try
+    seed : Optional[int]
+        Seed for RANSAC sampling
+
+    Returns
+    -------
+    CalibrationMap
+        Fitted map, with `inliers` and `rms_error` of the final fit
+    """
+    if model not in MODEL_POINTS:
+        raise ValueError(f"Unknown calibration model {model}")
+
+    src = np.asarray(gaze_points, dtype=np.float64).reshape(-1, 2)
+    dst = np.asarray(screen_points, dtype=np.float64).reshape(-1, 2)
+    if len(src) != len(dst):
+        raise ValueError("Every gaze sample needs a screen point")
+
+    minimum = MODEL_POINTS[model]
+    if len(np.unique(dst, axis=0)) < minimum or len(src) < minimum:
+        raise Exception("Please check your lighting. There was an issue extracting facial features.")
+
+    inliers = np.ones(len(src), dtype=bool)
+    if ransac_threshold is not None and len(src) > minimum:
+        rng = np.random.default_rng(seed)
+        best_count = 0
+        for _ in range(iterations):
+            sample = rng.choice(len(src), minimum, replace=False)
+            try:
+                candidate = _fit(model, src[sample], dst[sample])
+            except np.linalg.LinAlgError:
+                continue
+
+            with np.errstate(invalid="ignore", divide="ignore"):
+                errors = np.linalg.norm(candidate.apply(src) - dst, axis=1)
+            mask = errors < ransac_threshold
+            count = int(mask.sum())
+            if count > best_count:
+                best_count, inliers = count, mask
+
+        if best_count < minimum:
+            inliers = np.ones(len(src), dtype=bool)
+
+    calibration = _fit(model, src[inliers], dst[inliers])
+    calibration.inliers = inliers
+    calibration.rms_error = float(np.sqrt(np.mean(np.sum((calibration.apply(src[inliers]) - dst[inliers]) ** 2, axis=1))))
+    return calibration
@@ -0,0 +1,578 @@
+from engine.agent_state import AgentStore, MOVING_BACKWARD, MOVING_FORWARD, TURNING_LEFT, TURNING_RIGHT
+from engine.position_publisher import PositionSnapshot
+
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+import numpy as np
+import selectors
+import threading
+import logging
+import socket
+import struct
+import time
+import os
+
+
+logger = logging.getLogger(__name__)
+
+# Every message is a header (message type, payload length) followed by the payload
+MESSAGE_HEADER = struct.Struct("<BI")
+MAX_PAYLOAD = 1 << 20
+
+# Client -> controller
+COMMANDS = 1
+# Controller -> client
+STATE = 2
+SELECTION = 3
+
+# Command operations. MOVE: value > 0 forward, < 0 backward, 0 stop. TURN: value > 0 left,
+# < 0 right, 0 stop. SPEED: px per 60 Hz step. SELECT: make the agent its operator's selection
+MOVE = 1
+TURN = 2
+SPEED = 3
+SELECT = 4
+
+COMMAND_DTYPE = np.dtype([("op", "<u4"), ("agent", "<i4"), ("value", "<f4")])
+STATE_DTYPE = np.dtype([("agent", "<i4"), ("x", "<f4"), ("y", "<f4"), ("heading", "<f4")])
+
+# STATE payload: publish seq and time, then STATE_DTYPE records of the changed agents
+STATE_PREFIX = struct.Struct("<Id")
+# SELECTION payload: operator index, agent (-1 for none), time
+SELECTION_RECORD = struct.Struct("<Iid")
+
+Address = Union[Tuple[str, int], str]
+
+
+class BridgeState(NamedTuple):
+    seq: int
+    timestamp: float
+    records: np.ndarray
+
+
+class BridgeSelection(NamedTuple):
+    operator: int
+    agent: int
+    timestamp: float
+
+
+def make_commands(commands: Sequence[Tuple[int, int, float]]) -> np.ndarray:
+    """
+    ## Make Commands
+
+    Packs (op, agent, value) tuples into a COMMAND_DTYPE array
+    """
+    return np.array([tuple(command) for command in commands], dtype=COMMAND_DTYPE)
+
+
+def encode_message(kind: int, payload: bytes) -> bytes:
+    return MESSAGE_HEADER.pack(kind, len(payload)) + payload
+
+
+def encode_state(seq: int, timestamp: float, ids: np.ndarray, positions: np.ndarray,
+                 headings: np.ndarray) -> bytes:
+    records = np.empty(len(ids), dtype=STATE_DTYPE)
+    records["agent"] = ids
+    records["x"] = positions[:, 0]
+    records["y"] = positions[:, 1]
+    records["heading"] = headings
+    return encode_message(STATE, STATE_PREFIX.pack(seq, timestamp) + records.tobytes())
+
+
+def decode_message(kind: int, payload: bytes) -> Union[np.ndarray, BridgeState, BridgeSelection]:
+    """
+    ## Decode Message
+
+    Turns a message payload into a COMMAND_DTYPE array, BridgeState or BridgeSelection
+    """
+    if kind == COMMANDS:
+        if len(payload) % COMMAND_DTYPE.itemsize:
+            raise ValueError(f"Command payload of {len(payload)} bytes is not a whole number of commands")
+        return np.frombuffer(payload, dtype=COMMAND_DTYPE)
+    if kind == STATE:
+        seq, timestamp = STATE_PREFIX.unpack_from(payload)
+        return BridgeState(seq, timestamp, np.frombuffer(payload, dtype=STATE_DTYPE, offset=STATE_PREFIX.size))
+    if kind == SELECTION:
+        return BridgeSelection(*SELECTION_RECORD.unpack(payload))
+    raise ValueError(f"Unknown message type {kind}")
+
+
+def _split_messages(buffer: bytearray) -> List[Tuple[int, bytes]]:
+    # Removes every complete message from the front of the buffer
+    messages = []
+    offset = 0
+    while len(buffer) - offset >= MESSAGE_HEADER.size:
+        kind, length = MESSAGE_HEADER.unpack_from(buffer, offset)
+        if length > MAX_PAYLOAD:
+            raise ValueError(f"Message of {length} bytes exceeds the {MAX_PAYLOAD} byte limit")
+        end = offset + MESSAGE_HEADER.size + length
+        if len(buffer) < end:
+            break
+        messages.append((kind, bytes(buffer[offset + MESSAGE_HEADER.size:end])))
+        offset = end
+    del buffer[:offset]
+    return messages
+
+
+def _open_socket(address: Address) -> socket.socket:
+    if isinstance(address, str):
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def apply_commands(agents: AgentStore, commands: np.ndarray, max_speed: float = 20,
+                   min_speed: float = 1) -> Tuple[np.ndarray, int]:
+    """
+    ## Apply Commands
+
+    Applies a batch of MOVE, TURN and SPEED commands to the store as array operations. When
+    an agent gets several commands of the same kind in one batch the last one wins
+
+    Parameters
+    ----------
+    agents : AgentStore
+        Agents to update
+    commands : np.ndarray
+        COMMAND_DTYPE commands in arrival order
+    max_speed : float
+        Highest speed a SPEED command can set
+    min_speed : float
+        Lowest speed a SPEED command can set
+
+    Returns
+    -------
+    Tuple[np.ndarray, int]
+        Agents of the SELECT commands in order, and the number of rejected commands
+    """
+    rows = np.array(
+        [agents.row(agent_id) if agent_id in agents else -1 for agent_id in commands["agent"].tolist()], dtype=np.intp
+    )
+    valid = (rows >= 0) & np.isin(commands["op"], (MOVE, TURN, SPEED, SELECT))
+    rejected = int(len(commands) - np.count_nonzero(valid))
+
+    for op, clear, positive, negative in (
+        (MOVE, MOVING_FORWARD | MOVING_BACKWARD, MOVING_FORWARD, MOVING_BACKWARD),
+        (TURN, TURNING_LEFT | TURNING_RIGHT, TURNING_LEFT, TURNING_RIGHT),
+        (SPEED, 0, 0, 0),
+    ):
+        mask = valid & (commands["op"] == op)
+        if not mask.any():
+            continue
+
+        # Last command per agent: first occurrence in the reversed batch
+        op_rows = rows[mask][::-1]
+        values = commands["value"][mask][::-1]
+        op_rows, first = np.unique(op_rows, return_index=True)
+        values = values[first]
+
+        if op == SPEED:
+            agents.speeds[op_rows] = np.clip(values, min_speed, max_speed)
+            continue
+        flags = agents.flags[op_rows] & (0xFF ^ clear)
+        flags[values > 0] |= positive
+        flags[values < 0] |= negative
+        agents.flags[op_rows] = flags
+
+    select = valid & (commands["op"] == SELECT)
+    return commands["agent"][select], rejected
+
+
+class _Connection:
+    __slots__ = ("sock", "incoming", "outgoing", "resync", "writing")
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.incoming = bytearray()
+        self.outgoing = bytearray()
+        # Needs every agent in the next state message (new client, or state was dropped)
+        self.resync = True
+        self.writing = False
+
+
+class CommandBridge:
+    """
+    ## Command Bridge
+
+    Local TCP or Unix socket server that lets other processes drive agents. Clients send
+    batches of COMMAND_DTYPE commands; the network thread only decodes them and queues the
+    arrays, and the controller takes everything queued once per tick with `drain`. Agent
+    state (from a "snapshot" PositionPublisher subscription) and selections are streamed
+    back. A client that does not keep up has state messages dropped until its buffer empties,
+    then gets one message with every agent
+
+    Parameters
+    ----------
+    address : Address
+        (host, port) for TCP or a path for a Unix socket. Port 0 picks a free port
+    max_buffer : int
+        Bytes of unsent telemetry kept per client before state messages are dropped
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, address: Address = ("127.0.0.1", 7800), max_buffer: int = 1 << 20) -> None:
+        self.max_buffer = max_buffer
+
+        self.received = 0
+        self.applied = 0
+        self.rejected = 0
+        self.dropped_states = 0
+
+        if isinstance(address, str) and os.path.exists(address):
+            os.unlink(address)
+        self._server = _open_socket(address)
+        if not isinstance(address, str):
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(address)
+        self._server.listen()
+        self._server.setblocking(False)
+        self.address: Address = address if isinstance(address, str) else self._server.getsockname()
+
+        # Wakes the network thread when telemetry is queued
+        self._wake_recv, self._wake_send = socket.socketpair()
+        self._wake_recv.setblocking(False)
+        self._wake_send.setblocking(False)
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._server, selectors.EVENT_READ, "accept")
+        self._selector.register(self._wake_recv, selectors.EVENT_READ, "wake")
+
+        self._lock = threading.Lock()
+        self._connections: List[_Connection] = []
+        self._pending: List[np.ndarray] = []
+        self._snapshot: Optional[PositionSnapshot] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self.__run, name="command-bridge", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    @property
+    def clients(self) -> int:
+        return len(self._connections)
+
+    def drain(self) -> np.ndarray:
+        """
+        ## Drain
+
+        Takes every command received since the last call, in arrival order. Called once per tick
+
+        Returns
+        -------
+        np.ndarray
+            COMMAND_DTYPE commands
+        """
+        if not self._pending:
+            return np.zeros(0, dtype=COMMAND_DTYPE)
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending[0] if len(pending) == 1 else np.concatenate(pending)
+
+    def send_state(self, snapshot: PositionSnapshot) -> None:
+        """
+        ## Send State
+
+        Queues the changed agents of a snapshot for every client. Used as a PositionPublisher
+        "snapshot" subscriber
+        """
+        changed = None
+        full = None
+        with self._lock:
+            self._snapshot = snapshot
+            for connection in self._connections:
+                if len(connection.outgoing) > self.max_buffer:
+                    connection.resync = True
+                    self.dropped_states += 1
+                    continue
+                if connection.resync:
+                    if full is None:
+                        full = encode_state(snapshot.seq, snapshot.timestamp, snapshot.ids, snapshot.positions,
+                                            snapshot.headings)
+                    connection.outgoing += full
+                    connection.resync = False
+                else:
+                    if changed is None:
+                        mask = snapshot.changed
+                        changed = encode_state(snapshot.seq, snapshot.timestamp, snapshot.ids[mask],
+                                               snapshot.positions[mask], snapshot.headings[mask])
+                    connection.outgoing += changed
+        self.__wake()
+
+    def send_selection(self, operator: int, agent: Optional[int], timestamp: Optional[float] = None) -> None:
+        """
+        ## Send Selection
+
+        Queues a selection change for every client
+        """
+        message = encode_message(SELECTION, SELECTION_RECORD.pack(
+            operator, -1 if agent is None else agent, time.monotonic() if timestamp is None else timestamp
+        ))
+        with self._lock:
+            for connection in self._connections:
+                connection.outgoing += message
+        self.__wake()
+
+    def __wake(self) -> None:
+        try:
+            self._wake_send.send(b"\0")
+        except (BlockingIOError, OSError):
+            # Already woken, or closing
+            pass
+
+    def __run(self) -> None:
+        while not self._closed:
+            for key, events in self._selector.select(timeout=0.5):
+                if key.data == "accept":
+                    self.__accept()
+                elif key.data == "wake":
+                    try:
+                        while self._wake_recv.recv(4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                else:
+                    if events & selectors.EVENT_READ:
+                        self.__read(key.data)
+                    if events & selectors.EVENT_WRITE:
+                        self.__write(key.data)
+
+            # Only ask for write readiness while there is something to send
+            with self._lock:
+                connections = list(self._connections)
+                wanted = [bool(connection.outgoing) for connection in connections]
+            for connection, writing in zip(connections, wanted):
+                if writing != connection.writing and connection.sock.fileno() >= 0:
+                    events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+                    self._selector.modify(connection.sock, events, connection)
+                    connection.writing = writing
+
+    def __accept(self) -> None:
+        try:
+            sock, _ = self._server.accept()
+        except (BlockingIOError, OSError):
+            return
+        sock.setblocking(False)
+        connection = _Connection(sock)
+        self._selector.register(sock, selectors.EVENT_READ, connection)
+        with self._lock:
+            self._connections.append(connection)
+            snapshot = self._snapshot
+            if snapshot is not None:
+                # Current state right away, instead of waiting for something to move
+                connection.outgoing += encode_state(snapshot.seq, snapshot.timestamp, snapshot.ids,
+                                                    snapshot.positions, snapshot.headings)
+                connection.resync = False
+
+    def __read(self, connection: _Connection) -> None:
+        try:
+            data = connection.sock.recv(1 << 16)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.__drop(connection)
+            return
+
+        connection.incoming += data
+        try:
+            messages = _split_messages(connection.incoming)
+            batches = [decode_message(kind, payload) for kind, payload in messages]
+        except (ValueError, struct.error) as error:
+            logger.warning(f"Closing bridge client: {error}")
+            self.__drop(connection)
+            return
+
+        batches = [batch for batch in batches if isinstance(batch, np.ndarray) and len(batch)]
+        if batches:
+            with self._lock:
+                self._pending.extend(batches)
+                self.received += sum(len(batch) for batch in batches)
+
+    def __write(self, connection: _Connection) -> None:
+        with self._lock:
+            data = bytes(connection.outgoing[: 1 << 18])
+        try:
+            sent = connection.sock.send(data)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.__drop(connection)
+            return
+        with self._lock:
+            del connection.outgoing[:sent]
+
+    def __drop(self, connection: _Connection) -> None:
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+        try:
+            self._selector.unregister(connection.sock)
+        except (KeyError, ValueError):
+            pass
+        connection.sock.close()
+
+    def close(self) -> None:
+        """
+        ## Close
+
+        Stops the network thread and closes every connection
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self.__wake()
+        if self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+
+        for connection in list(self._connections):
+            self.__drop(connection)
+        self._selector.close()
+        self._server.close()
+        self._wake_recv.close()
+        self._wake_send.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+class BridgeClient:
+    """
+    ## Bridge Client
+
+    Blocking client for a CommandBridge, e.g. for test harnesses. Commands are buffered by
+    `move`, `turn`, `speed` and `select` and sent as one batch by `flush`
+
+    Parameters
+    ----------
+    address : Address
+        Address the bridge listens on
+    timeout : float
+        Connect timeout in seconds
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, address: Address = ("127.0.0.1", 7800), timeout: float = 5.0) -> None:
+        self.sock = _open_socket(address)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        self._incoming = bytearray()
+        self._messages: List[Tuple[int, bytes]] = []
+        self._batch: List[Tuple[int, int, float]] = []
+
+    def send(self, commands: np.ndarray) -> None:
+        self.sock.sendall(encode_message(COMMANDS, np.ascontiguousarray(commands, dtype=COMMAND_DTYPE).tobytes()))
+
+    def move(self, agent: int, direction: float) -> None:
+        self._batch.append((MOVE, agent, direction))
+
+    def turn(self, agent: int, direction: float) -> None:
+        self._batch.append((TURN, agent, direction))
+
+    def speed(self, agent: int, speed: float) -> None:
+        self._batch.append((SPEED, agent, speed))
+
+    def select(self, agent: int) -> None:
+        self._batch.append((SELECT, agent, 0.0))
+
+    def flush(self) -> None:
+        if self._batch:
+            self.send(make_commands(self._batch))
+            self._batch = []
+
+    def receive(self, timeout: Optional[float] = None) -> Optional[Union[BridgeState, BridgeSelection]]:
+        """
+        ## Receive
+
+        Next telemetry message
+
+        Parameters
+        ----------
+        timeout : Optional[float]
+            Maximum time to wait in seconds, blocks when None
+
+        Returns
+        -------
+        Optional[Union[BridgeState, BridgeSelection]]
+            Message, or None on timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._messages:
+            self.sock.settimeout(None if deadline is None else max(deadline - time.monotonic(), 0.0))
+            try:
+                data = self.sock.recv(1 << 16)
+            except (socket.timeout, BlockingIOError):
+                return None
+            if not data:
+                raise ConnectionError("Bridge closed the connection")
+            self._incoming += data
+            self._messages = _split_messages(self._incoming)
+        kind, payload = self._messages.pop(0)
+        return decode_message(kind, payload)
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def __enter__(self) -> "BridgeClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def parse_address(spec: str) -> Address:
+    """
+    ## Parse Address
+
+    "host:port" or a Unix socket path
+    """
+    host, separator, port = spec.rpartition(":")
+    if separator and port.isdigit():
+        return (host or "127.0.0.1", int(port))
+    return spec
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stand-in bridge client: sends random agent commands and counts telemetry")
+    parser.add_argument("--address", default="127.0.0.1:7800", help="host:port or Unix socket path")
+    parser.add_argument("--agents", type=int, default=2, help="Agents to command (ids 0 to agents - 1)")
+    parser.add_argument("--rate", type=float, default=1000.0, help="Commands per second")
+    parser.add_argument("--batch", type=int, default=50, help="Commands per message")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng()
+    states = selections = sent = 0
+    with BridgeClient(parse_address(args.address)) as client:
+        start = time.monotonic()
+        next_batch = start
+        while time.monotonic() - start < args.duration:
+            commands = np.empty(args.batch, dtype=COMMAND_DTYPE)
+            commands["op"] = rng.choice((MOVE, TURN, SPEED), args.batch)
+            commands["agent"] = rng.integers(0, args.agents, args.batch)
+            commands["value"] = np.where(commands["op"] == SPEED, rng.uniform(1, 20, args.batch),
+                                         rng.integers(-1, 2, args.batch))
+            client.send(commands)
+            sent += args.batch
+
+            # Read telemetry until the next batch is due
+            next_batch += args.batch / args.rate
+            while True:
+                message = client.receive(timeout=max(next_batch - time.monotonic(), 0.0))
+                if message is None:
+                    break
+                if isinstance(message, BridgeState):
+                    states += 1
+                else:
+                    selections += 1
+        elapsed = time.monotonic() - start
+
+    print(f"Sent {sent} commands ({sent / elapsed:.0f}/s), received {states} state and {selections} selection messages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+from engine.face_tracking import FaceTracker, eye_center, load_face_models, mirror_box
+from engine.instrumentation import metrics
+
+from typing import List, NamedTuple, Optional, Tuple
+from multiprocessing import shared_memory
+import multiprocessing as mp
+import numpy as np
+import threading
+import queue
+import cv2
+
+
+class DetectionResult(NamedTuple):
+    """
+    ## Detection Result
+
+    Compact result sent back by a detection worker
+
+    Parameters
+    ----------
+    seq : int
+        Frame sequence number
+    timestamp : float
+        Frame capture time
+    center : Optional[Tuple[float, float]]
+        Eye center as a fraction of frame width and height (mirrored frame), None if no face was found
+    face : Optional[Tuple[int, int, int, int]]
+        Face box (left, top, right, bottom) in the mirrored frame
+    confidence : float
+        Face tracker confidence
+    worker : int
+        Worker that produced the result
+    """
+    seq: int
+    timestamp: float
+    center: Optional[Tuple[float, float]]
+    face: Optional[Tuple[int, int, int, int]]
+    confidence: float
+    worker: int
+
+
+class SharedFrameRing:
+    """
+    ## Shared Frame Ring
+
+    Fixed size frame slots in one shared memory block. Worker processes attach to the block
+    by name and read frames in place, so frames are never pickled
+
+    Parameters
+    ----------
+    slots : int
+        Number of frame slots
+    shape : Tuple[int, ...]
+        Frame shape, e.g. (height, width, 3)
+    dtype : np.dtype
+        Frame dtype
+    name : Optional[str]
+        Attach to an existing block instead of creating one
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, slots: int, shape: Tuple[int, ...], dtype=np.uint8, name: Optional[str] = None) -> None:
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+
+        size = slots * int(np.prod(self.shape)) * self.dtype.itemsize
+        self.memory = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=self.dtype, buffer=self.memory.buf)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    def close(self) -> None:
+        # Views into the buffer must be gone before the block can close
+        del self.frames
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def _worker_main(index: int, ring_name: str, slots: int, shape: Tuple[int, ...], tasks, results,
+                 predictor_path: Optional[str], tracking: bool, detection_scale: float, backend: str) -> None:
+    """
+    ## Worker Main
+
+    Body of a detection process. Takes (slot, seq, timestamp) tasks until it gets None
+    """
+    ring = SharedFrameRing(slots, shape, name=ring_name)
+    detector, predictor = load_face_models(predictor_path, backend)
+    face_tracker = FaceTracker(detector, predictor, tracking=tracking, detection_scale=detection_scale)
+
+    gray = np.empty(shape[:2], dtype=np.uint8)
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            slot, seq, timestamp = task
+
+            cv2.cvtColor(ring.frames[slot], cv2.COLOR_BGR2GRAY, dst=gray)
+
+            # Slot can be reused as soon as the frame has been copied out
+            results.put(("free", slot))
+
+            located = face_tracker.locate(gray)
+            if located is None:
+                results.put(DetectionResult(seq, timestamp, None, None, 0.0, index))
+                continue
+
+            # Faces are found in the unflipped frame, results are mirrored
+            face, landmarks = located
+            center_x, center_y = eye_center(landmarks)
+            results.put(DetectionResult(
+                seq, timestamp, ((shape[1] - 1 - center_x) / shape[1], center_y / shape[0]),
+                mirror_box(face, shape[1]), float(face_tracker.confidence), index,
+            ))
+    finally:
+        ring.close()
+
+
+class DetectionPool:
+    """
+    ## Detection Pool
+
+    Runs face detection and landmark prediction in worker processes, outside of the GIL the
+    UI uses. Frames are copied into shared memory slots and handed to the workers round-robin,
+    and only DetectionResult tuples come back. A frame is dropped when every slot is busy
+
+    Parameters
+    ----------
+    frame_shape : Tuple[int, int, int]
+        (height, width, 3) of the BGR frames
+    workers : int
+        Number of worker processes
+    slots_per_worker : int
+        Frames that may be queued or in flight per worker
+    predictor_path : Optional[str]
+        Landmark model, defaults to the backend's model in _assets
+    tracking : bool
+        Track the face between detections within each worker
+    detection_scale : float
+        Scale applied to frames before face detection
+    backend : str
+        Face backend loaded by every worker, see `load_face_models`
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, frame_shape: Tuple[int, int, int], workers: int = 2, slots_per_worker: int = 2,
+                 predictor_path: Optional[str] = None, tracking: bool = True, detection_scale: float = 1.0,
+                 backend: str = "dlib") -> None:
+        if workers < 1:
+            raise ValueError("DetectionPool needs at least one worker")
+
+        self.frame_shape = tuple(frame_shape)
+        self.workers = workers
+        self.ring = SharedFrameRing(workers * slots_per_worker, self.frame_shape)
+
+        self.submitted = 0
+        self.dropped = 0
+
+        self._free: List[int] = list(range(self.ring.slots))
+        self._free_lock = threading.Lock()
+        self._next_worker = 0
+
+        # Spawned rather than forked, the parent already runs capture and UI threads
+        context = mp.get_context("spawn")
+        self._results = context.Queue()
+        self._tasks = [context.Queue() for _ in range(workers)]
+        self._processes = [
+            context.Process(
+                target=_worker_main,
+                args=(index, self.ring.name, self.ring.slots, self.frame_shape, self._tasks[index], self._results,
+                      predictor_path, tracking, detection_scale, backend),
+                name=f"detection-worker-{index}",
+                daemon=True,
+            )
+            for index in range(workers)
+        ]
+        for process in self._processes:
+            process.start()
+
+    def submit(self, frame: np.ndarray, seq: int, timestamp: float) -> bool:
+        """
+        ## Submit
+
+        Copies a frame into a free slot and queues it on the next worker
+
+        Parameters
+        ----------
+        frame : np.ndarray
+            BGR frame as read from the source
+        seq : int
+            Frame sequence number
+        timestamp : float
+            Frame capture time
+
+        Returns
+        -------
+        bool
+            False if the frame was dropped because every slot was busy
+        """
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match the pool's {self.frame_shape}")
+
+        with self._free_lock:
+            slot = self._free.pop() if self._free else None
+        if slot is None:
+            self.dropped += 1
+            metrics.count("dropped frames")
+            return False
+
+        np.copyto(self.ring.frames[slot], frame)
+        self._tasks[self._next_worker].put((slot, seq, timestamp))
+        self._next_worker = (self._next_worker + 1) % self.workers
+        self.submitted += 1
+        return True
+
+    def result(self, timeout: Optional[float] = None) -> Optional[DetectionResult]:
+        """
+        ## Result
+
+        Next detection result from any worker. Results can arrive out of frame order
+
+        Parameters
+        ----------
+        timeout : Optional[float]
+            Maximum time to wait in seconds
+
+        Returns
+        -------
+        Optional[DetectionResult]
+            Result, or None on timeout
+        """
+        while True:
+            try:
+                message = self._results.get(timeout=timeout)
+            except queue.Empty:
+                return None
+
+            if isinstance(message, DetectionResult):
+                return message
+
+            # Slot released by a worker
+            with self._free_lock:
+                self._free.append(message[1])
+
+    def close(self) -> None:
+        """
+        ## Close
+
+        Stops the workers and frees the shared memory
+        """
+        for tasks in self._tasks:
+            tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+
+        self._results.close()
+        for tasks in self._tasks:
+            tasks.close()
+        self.ring.close()
@@ -0,0 +1,292 @@
+from _assets.dlib_typing import _dlib_pybind11
+from engine.face_tracking import EYE_CORNERS
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+import cv2
+import os
+
+
+class Point(NamedTuple):
+    x: float
+    y: float
+
+
+class EyeLandmarks:
+    """
+    ## Eye Landmarks
+
+    Eye corners only, indexed like the 68 point landmarks they stand in for (`part(36)`,
+    `part(39)`, `part(42)`, `part(45)`)
+
+    Parameters
+    ----------
+    corners : np.ndarray
+        4 x 2 array of eye corners
+    ordered : bool
+        Corners are already in the 68 point order (e.g. from a shape predictor) and are kept
+        as given, so FaceTracker.landmarks_valid can reject crossed corners. Otherwise they
+        are sorted left to right
+
+    Returns
+    -------
+    None
+    """
+    __slots__ = ("corners", "_parts")
+
+    def __init__(self, corners: np.ndarray, ordered: bool = False) -> None:
+        # Left to right in the image, matching the 68 point order 36, 39, 42, 45
+        corners = np.asarray(corners, dtype=np.float64)
+        self.corners = corners if ordered else corners[np.argsort(corners[:, 0], kind="stable")]
+        self._parts = {index: Point(float(x), float(y)) for index, (x, y) in zip(EYE_CORNERS, self.corners)}
+
+    def part(self, index: int) -> Point:
+        try:
+            return self._parts[index]
+        except KeyError:
+            raise ValueError(f"Eye landmarks only have the eye corners {EYE_CORNERS}, not {index}") from None
+
+    def num_parts(self) -> int:
+        return len(self._parts)
+
+
+class HaarFaceDetector:
+    """
+    ## Haar Face Detector
+
+    OpenCV Haar cascade face detector with the dlib detector's call signature
+
+    Parameters
+    ----------
+    cascade : str
+        Cascade file name in cv2.data.haarcascades
+    scale_factor : float
+        Image pyramid step
+    min_neighbors : int
+        Overlapping detections needed to accept a face
+    min_size : int
+        Smallest face in px
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, cascade: str = "haarcascade_frontalface_default.xml", scale_factor: float = 1.1,
+                 min_neighbors: int = 5, min_size: int = 60) -> None:
+        self.cascade = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, cascade))
+        if self.cascade.empty():
+            raise Exception(f"Could not load the Haar cascade {cascade}.")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+
+    def __call__(self, gray: Sequence) -> List[_dlib_pybind11.rectangle]:
+        import dlib
+
+        # Scaled detection can shrink faces below min_size
+        min_size = max(round(self.min_size * min(gray.shape[:2]) / 480), 20)
+        faces = self.cascade.detectMultiScale(gray, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors,
+                                              minSize=(min_size, min_size))
+        return [dlib.rectangle(int(x), int(y), int(x + w), int(y + h)) for x, y, w, h in faces]
+
+
+class HaarEyePredictor:
+    """
+    ## Haar Eye Predictor
+
+    Eye corners from OpenCV's Haar eye cascade, run in the upper half of the face. The corners
+    are the left and right edges of each eye box at its vertical center. When fewer than two
+    eyes are found the corners are placed at their average position in the face box
+
+    Parameters
+    ----------
+    cascade : str
+        Cascade file name in cv2.data.haarcascades
+
+    Returns
+    -------
+    None
+    """
+    # Average eye corner positions as a fraction of the dlib face box (x, y)
+    TYPICAL_CORNERS = np.array([[0.19, 0.36], [0.40, 0.37], [0.60, 0.37], [0.81, 0.36]])
+
+    def __init__(self, cascade: str = "haarcascade_eye.xml") -> None:
+        self.cascade = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, cascade))
+        if self.cascade.empty():
+            raise Exception(f"Could not load the Haar cascade {cascade}.")
+
+    def __call__(self, gray: Sequence, face: _dlib_pybind11.rectangle) -> EyeLandmarks:
+        left, top = max(face.left(), 0), max(face.top(), 0)
+        right, bottom = min(face.right(), gray.shape[1]), min(face.bottom(), gray.shape[0])
+        middle = top + (bottom - top) // 2
+
+        eyes = []
+        if right - left > 0 and middle - top > 0:
+            min_size = max((right - left) // 8, 10)
+            eyes = self.cascade.detectMultiScale(gray[top:middle, left:right], scaleFactor=1.1, minNeighbors=3,
+                                                 minSize=(min_size, min_size))
+
+        if len(eyes) >= 2:
+            # Two largest boxes, one on each side of the face
+            eyes = sorted(eyes, key=lambda box: box[2] * box[3], reverse=True)[:2]
+            corners = np.array([
+                corner
+                for x, y, w, h in eyes
+                for corner in ((left + x, top + y + h / 2), (left + x + w, top + y + h / 2))
+            ])
+            return EyeLandmarks(corners)
+
+        box = np.array([face.width(), face.height()], dtype=np.float64)
+        return EyeLandmarks(np.array([face.left(), face.top()]) + self.TYPICAL_CORNERS * box)
+
+
+class EyeCornerPredictor:
+    """
+    ## Eye Corner Predictor
+
+    dlib's 5 point shape predictor, which only regresses the four eye corners and the nose.
+    Much smaller and faster than the 68 point cascade, and the eye corners are all the gaze
+    estimate uses
+
+    Parameters
+    ----------
+    predictor : _dlib_pybind11.shape_predictor
+        5 point shape predictor
+
+    Returns
+    -------
+    None
+    """
+    # 5 point parts in the 68 point order 36, 39, 42, 45 (outer and inner corner of the eye on
+    # the image left, then inner and outer corner of the other eye)
+    PARTS = (2, 3, 1, 0)
+
+    def __init__(self, predictor: _dlib_pybind11.shape_predictor) -> None:
+        self.predictor = predictor
+
+    def __call__(self, gray: Sequence, face: _dlib_pybind11.rectangle) -> EyeLandmarks:
+        shape = self.predictor(gray, face)
+        corners = np.array([(shape.part(i).x, shape.part(i).y) for i in self.PARTS], dtype=np.float64)
+        return EyeLandmarks(corners, ordered=True)
+
+
+# name -> loader for face detectors and landmark predictors. Landmark loaders take an
+# optional model path, every predictor returns objects with the dlib `part(i)` interface
+FACE_DETECTORS: Dict[str, Callable[[], Any]] = {}
+LANDMARK_PREDICTORS: Dict[str, Callable[[Optional[str]], Any]] = {}
+
+# Named detector and landmark pairs
+FACE_BACKENDS: Dict[str, Tuple[str, str]] = {
+    "dlib": ("hog", "dlib68"),
+    "eyes": ("hog", "eyes"),
+    "haar": ("haar", "haar_eyes"),
+}
+
+
+def register_detector(name: str) -> Callable[[Callable[[], Any]], Callable[[], Any]]:
+    """
+    ## Register Detector
+
+    Decorator adding a face detector loader to FACE_DETECTORS
+    """
+    def register(loader: Callable[[], Any]) -> Callable[[], Any]:
+        FACE_DETECTORS[name] = loader
+        return loader
+    return register
+
+
+def register_landmarks(name: str) -> Callable[[Callable[[Optional[str]], Any]], Callable[[Optional[str]], Any]]:
+    """
+    ## Register Landmarks
+
+    Decorator adding a landmark predictor loader to LANDMARK_PREDICTORS
+    """
+    def register(loader: Callable[[Optional[str]], Any]) -> Callable[[Optional[str]], Any]:
+        LANDMARK_PREDICTORS[name] = loader
+        return loader
+    return register
+
+
+@register_detector("hog")
+def _hog_detector() -> _dlib_pybind11.fhog_object_detector:
+    import dlib
+
+    return dlib.get_frontal_face_detector()
+
+
+@register_detector("haar")
+def _haar_detector() -> HaarFaceDetector:
+    return HaarFaceDetector()
+
+
+@register_landmarks("dlib68")
+def _dlib68_predictor(predictor_path: Optional[str] = None) -> _dlib_pybind11.shape_predictor:
+    import dlib
+
+    if predictor_path is None:
+        predictor_path = os.path.join(os.getcwd(), '_assets/shape_predictor.dat')
+    return dlib.shape_predictor(predictor_path)
+
+
+@register_landmarks("eyes")
+def _eye_corner_predictor(predictor_path: Optional[str] = None) -> EyeCornerPredictor:
+    import dlib
+
+    if predictor_path is None:
+        predictor_path = os.path.join(os.getcwd(), '_assets/shape_predictor_5.dat')
+    return EyeCornerPredictor(dlib.shape_predictor(predictor_path))
+
+
+@register_landmarks("haar_eyes")
+def _haar_eye_predictor(predictor_path: Optional[str] = None) -> HaarEyePredictor:
+    return HaarEyePredictor()
+
+
+def resolve_backend(backend: str) -> Tuple[str, str]:
+    """
+    ## Resolve Backend
+
+    Detector and landmark predictor names of a backend
+
+    Parameters
+    ----------
+    backend : str
+        Name in FACE_BACKENDS, or "detector+landmarks" such as "haar+dlib68"
+
+    Returns
+    -------
+    Tuple[str, str]
+        Detector and landmark predictor names
+    """
+    if backend in FACE_BACKENDS:
+        return FACE_BACKENDS[backend]
+
+    detector, _, landmarks = backend.partition("+")
+    if detector not in FACE_DETECTORS or landmarks not in LANDMARK_PREDICTORS:
+        raise ValueError(
+            f"Unknown face backend {backend}. Use one of {sorted(FACE_BACKENDS)} or detector+landmarks with "
+            f"detectors {sorted(FACE_DETECTORS)} and landmarks {sorted(LANDMARK_PREDICTORS)}"
+        )
+    return detector, landmarks
+
+
+def load_backend(backend: str = "dlib", predictor_path: Optional[str] = None) -> Tuple[Any, Any]:
+    """
+    ## Load Backend
+
+    Loads the face detector and landmark predictor of a backend
+
+    Parameters
+    ----------
+    backend : str
+        Backend name, see `resolve_backend`
+    predictor_path : Optional[str]
+        Landmark model file, defaults to the backend's file in _assets
+
+    Returns
+    -------
+    Tuple[Any, Any]
+        Face detector and landmark predictor
+    """
+    detector, landmarks = resolve_backend(backend)
+    return FACE_DETECTORS[detector](), LANDMARK_PREDICTORS[landmarks](predictor_path)
@@ -0,0 +1,401 @@
+from _assets.dlib_typing import _dlib_pybind11
+from engine.instrumentation import metrics
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import cv2
+
+
+# dlib landmark indices of the outer and inner corner of each eye
+EYE_CORNERS = (36, 39, 42, 45)
+
+
+def load_face_models(predictor_path: Optional[str] = None, backend: str = "dlib") -> Tuple[Any, Any]:
+    """
+    ## Load Face Models
+
+    Loads the face detector and the landmark predictor of a face backend (see
+    engine.face_backends). dlib is only imported here, so callers can run this on a
+    background thread while the rest of the app starts
+
+    Parameters
+    ----------
+    predictor_path : Optional[str]
+        Path of the landmark model. Defaults to the backend's model in _assets
+    backend : str
+        "dlib" (HOG and 68 landmarks), "eyes" (HOG and eye corners only), "haar" (OpenCV
+        cascades) or "detector+landmarks"
+
+    Returns
+    -------
+    Tuple[Any, Any]
+        Face detector and landmark predictor
+    """
+    from engine.face_backends import load_backend
+
+    return load_backend(backend, predictor_path)
+
+
+def eye_corners(landmarks: Any) -> np.ndarray:
+    """
+    ## Eye Corners
+
+    Extracts the eye corners from a dlib landmark prediction
+
+    Parameters
+    ----------
+    landmarks : Any
+        68 point or eye-only landmarks
+
+    Returns
+    -------
+    np.ndarray
+        4 x 2 array of eye corner coordinates
+    """
+    # Eye-only backends already hold the corners as an array
+    corners = getattr(landmarks, "corners", None)
+    if corners is not None:
+        return corners.copy()
+    return np.array([(landmarks.part(i).x, landmarks.part(i).y) for i in EYE_CORNERS], dtype=np.float64)
+
+
+def eye_center(landmarks: Any) -> Tuple[float, float]:
+    """
+    ## Eye Center
+
+    Mean of the four eye corners, computed without building an array
+
+    Parameters
+    ----------
+    landmarks : Any
+        68 point or eye-only landmarks
+
+    Returns
+    -------
+    Tuple[float, float]
+        Eye center in frame coordinates
+    """
+    x = y = 0.0
+    for i in EYE_CORNERS:
+        point = landmarks.part(i)
+        x += point.x
+        y += point.y
+    return x / len(EYE_CORNERS), y / len(EYE_CORNERS)
+
+
+def mirror_box(face: Any, width: int) -> Tuple[int, int, int, int]:
+    """
+    ## Mirror Box
+
+    (left, top, right, bottom) of a face rectangle after flipping a frame of `width` px horizontally
+    """
+    return (width - 1 - face.right(), face.top(), width - 1 - face.left(), face.bottom())
+
+
+class FaceTracker:
+    """
+    ## Face Tracker
+
+    Detect-once, track-many face locator. Runs the full-frame face detector only on
+    startup or when tracking is lost, and follows the face with a correlation tracker
+    in between. Every tracked face is checked against its landmarks, a bad fit forces
+    a new detection
+
+    Parameters
+    ----------
+    detector : _dlib_pybind11.fhog_object_detector
+        Full-frame face detector
+    predictor : _dlib_pybind11.shape_predictor
+        68 point landmark predictor
+    tracking : bool
+        Follow the face between detections. When False every frame is detected
+    min_confidence : float
+        Minimum correlation tracker peak-to-sidelobe ratio before the track is dropped
+    redetect_interval : int
+        Forces a full detection after this many tracked frames (0 disables)
+    detection_scale : float
+        Scale applied to the frame before face detection. Landmarks are always predicted at full resolution
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, detector: _dlib_pybind11.fhog_object_detector, predictor: _dlib_pybind11.shape_predictor,
+                 tracking: bool = True, min_confidence: float = 7.0, redetect_interval: int = 120,
+                 detection_scale: float = 1.0) -> None:
+        if not 0.0 < detection_scale <= 1.0:
+            raise ValueError("detection_scale must be in (0, 1]")
+
+        self.detector = detector
+        self.predictor = predictor
+        self.tracking = tracking
+        self.min_confidence = min_confidence
+        self.redetect_interval = redetect_interval
+        self.detection_scale = detection_scale
+
+        self._tracker: Optional[Any] = None
+        self._tracked_frames = 0
+
+        # Face found in the last located frame
+        self.face: Optional[_dlib_pybind11.rectangle] = None
+
+        # Statistics
+        self.confidence = 0.0
+        self.detections = 0
+        self.tracked = 0
+        self.lost = 0
+
+    def reset(self) -> None:
+        """
+        ## Reset
+
+        Drops the current track so the next frame runs a full detection
+        """
+        if self._tracker is not None:
+            self.lost += 1
+        self._tracker = None
+        self._tracked_frames = 0
+
+    def locate(self, gray: Sequence) -> Optional[Tuple[_dlib_pybind11.rectangle, Any]]:
+        """
+        ## Locate
+
+        Finds the face in a grayscale frame and predicts its landmarks
+
+        Parameters
+        ----------
+        gray : Sequence
+            Normalized frame
+
+        Returns
+        -------
+        Optional[Tuple[_dlib_pybind11.rectangle, Any]]
+            Face rectangle and landmarks, or None if no face was found
+        """
+        if self.tracking and self._tracker is not None:
+            result = self.__track(gray)
+            if result is not None:
+                self.face = result[0]
+                return result
+            self.reset()
+
+        result = self.__detect(gray)
+        self.face = result[0] if result is not None else None
+        return result
+
+    def __track(self, gray: Sequence) -> Optional[Tuple[_dlib_pybind11.rectangle, Any]]:
+        if self.redetect_interval and self._tracked_frames >= self.redetect_interval:
+            return None
+
+        start = metrics.clock()
+        self.confidence = self._tracker.update(gray)
+        metrics.record("track", start)
+        if self.confidence < self.min_confidence:
+            return None
+
+        face = self.__to_rectangle(self._tracker.get_position())
+        start = metrics.clock()
+        landmarks = self.predictor(gray, face)
+        metrics.record("predictor", start)
+        if not self.landmarks_valid(face, landmarks):
+            return None
+
+        self._tracked_frames += 1
+        self.tracked += 1
+        return face, landmarks
+
+    def __detect(self, gray: Sequence) -> Optional[Tuple[_dlib_pybind11.rectangle, Any]]:
+        self.detections += 1
+        start = metrics.clock()
+        faces = self.detect(gray)
+        metrics.record("detect", start)
+        if not faces:
+            return None
+
+        # Follow the largest (closest) face
+        face = max(faces, key=lambda rect: rect.area())
+        start = metrics.clock()
+        landmarks = self.predictor(gray, face)
+        metrics.record("predictor", start)
+        self.confidence = float("inf")
+
+        if self.tracking:
+            import dlib
+
+            self._tracker = dlib.correlation_tracker()
+            self._tracker.start_track(gray, face)
+            self._tracked_frames = 0
+
+        return face, landmarks
+
+    def detect(self, gray: Sequence) -> Sequence[_dlib_pybind11.rectangle]:
+        """
+        ## Detect
+
+        Runs the face detector on a downscaled copy of the frame and maps the faces back to full resolution
+
+        Parameters
+        ----------
+        gray : Sequence
+            Normalized frame
+
+        Returns
+        -------
+        Sequence[_dlib_pybind11.rectangle]
+            Detected faces in full resolution coordinates
+        """
+        if self.detection_scale == 1.0:
+            return list(self.detector(gray))
+
+        small = cv2.resize(gray, None, fx=self.detection_scale, fy=self.detection_scale, interpolation=cv2.INTER_AREA)
+        return [self.__scale_rectangle(face, 1.0 / self.detection_scale) for face in self.detector(small)]
+
+    @staticmethod
+    def __scale_rectangle(face: _dlib_pybind11.rectangle, factor: float) -> _dlib_pybind11.rectangle:
+        import dlib
+
+        return dlib.rectangle(round(face.left() * factor), round(face.top() * factor),
+                              round(face.right() * factor), round(face.bottom() * factor))
+
+    @staticmethod
+    def __to_rectangle(position: Any) -> _dlib_pybind11.rectangle:
+        import dlib
+
+        return dlib.rectangle(round(position.left()), round(position.top()),
+                              round(position.right()), round(position.bottom()))
+
+    @staticmethod
+    def landmarks_valid(face: _dlib_pybind11.rectangle, landmarks: Any) -> bool:
+        """
+        ## Landmarks Valid
+
+        Sanity check that the eye corners form a plausible face inside the tracked box
+
+        Parameters
+        ----------
+        face : _dlib_pybind11.rectangle
+            Tracked face rectangle
+        landmarks : Any
+            Landmarks predicted inside the rectangle
+
+        Returns
+        -------
+        bool
+            True if the landmarks look like a face
+        """
+        corners = [landmarks.part(i) for i in EYE_CORNERS]
+        width = face.width()
+        if width <= 0:
+            return False
+
+        # Eye corners inside the box, in order from left to right. Haar eye corners are
+        # sorted when they are built, so the order check only rejects predictor output
+        for corner in corners:
+            if not (face.left() <= corner.x <= face.right() and face.top() <= corner.y <= face.bottom()):
+                return False
+        if not corners[0].x < corners[1].x <= corners[2].x < corners[3].x:
+            return False
+
+        # Outer eye corners span a typical fraction of the face width
+        eye_span = (corners[3].x - corners[0].x) / width
+        return 0.35 < eye_span < 0.95
+
+
+class MultiFaceTracker:
+    """
+    ## Multi Face Tracker
+
+    Locates several faces per frame and gives each one a stable track id. Faces are detected
+    every frame and matched to the previous frame's tracks by center distance, so a person
+    keeps their id while they stay in view. A track is dropped after `max_missed` frames
+    without a match
+
+    Parameters
+    ----------
+    detector : _dlib_pybind11.fhog_object_detector
+        Full-frame face detector
+    predictor : _dlib_pybind11.shape_predictor
+        68 point landmark predictor
+    max_faces : int
+        Most faces located per frame (largest first)
+    max_distance : float
+        Largest center movement between frames, as a fraction of the face width, that still counts as the same face
+    max_missed : int
+        Frames a track survives without a matching face
+    detection_scale : float
+        Scale applied to the frame before face detection
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, detector: _dlib_pybind11.fhog_object_detector, predictor: _dlib_pybind11.shape_predictor,
+                 max_faces: int = 2, max_distance: float = 0.5, max_missed: int = 15, detection_scale: float = 1.0) -> None:
+        self.predictor = predictor
+        self.max_faces = max_faces
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+
+        # Only used for its downscaled detection
+        self._faces = FaceTracker(detector, predictor, tracking=False, detection_scale=detection_scale)
+
+        # track id -> (center x, center y, face width, missed frames)
+        self.tracks: Dict[int, Tuple[float, float, float, int]] = {}
+        self._next_id = 0
+
+    def locate(self, gray: Sequence) -> List[Tuple[int, _dlib_pybind11.rectangle, Any]]:
+        """
+        ## Locate
+
+        Finds the faces in a grayscale frame and predicts their landmarks
+
+        Parameters
+        ----------
+        gray : Sequence
+            Normalized frame
+
+        Returns
+        -------
+        List[Tuple[int, _dlib_pybind11.rectangle, Any]]
+            Track id, face rectangle and landmarks of every face found
+        """
+        start = metrics.clock()
+        faces = sorted(self._faces.detect(gray), key=lambda rect: rect.area(), reverse=True)[: self.max_faces]
+        metrics.record("detect", start)
+
+        centers = [((face.left() + face.right()) / 2, (face.top() + face.bottom()) / 2, face.width()) for face in faces]
+
+        # Greedy matching, closest face and track pairs first
+        pairs = []
+        for track_id, (tx, ty, width, _) in self.tracks.items():
+            for index, (x, y, _) in enumerate(centers):
+                distance = np.hypot(x - tx, y - ty)
+                if distance <= self.max_distance * width:
+                    pairs.append((distance, track_id, index))
+
+        assigned: Dict[int, int] = {}
+        for _, track_id, index in sorted(pairs):
+            if track_id not in assigned.values() and index not in assigned:
+                assigned[index] = track_id
+
+        for track_id, (tx, ty, width, missed) in list(self.tracks.items()):
+            if track_id not in assigned.values():
+                if missed + 1 > self.max_missed:
+                    del self.tracks[track_id]
+                else:
+                    self.tracks[track_id] = (tx, ty, width, missed + 1)
+
+        located = []
+        for index, face in enumerate(faces):
+            track_id = assigned.get(index)
+            if track_id is None:
+                track_id = self._next_id
+                self._next_id += 1
+            self.tracks[track_id] = (centers[index][0], centers[index][1], centers[index][2], 0)
+
+            start = metrics.clock()
+            landmarks = self.predictor(gray, face)
+            metrics.record("predictor", start)
+            located.append((track_id, face, landmarks))
+
+        return located
@@ -0,0 +1,183 @@
+from engine.instrumentation import metrics
+
+from typing import Optional, Tuple
+import numpy as np
+import threading
+import time
+
+
+class FrameBuffer:
+    """
+    ## Frame Buffer
+
+    Small ring buffer holding the newest webcam frames. Writers never block and
+    older frames are simply overwritten (latest frame wins)
+
+    Parameters
+    ----------
+    capacity : int
+        Number of frame slots kept in the ring
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, capacity: int = 3) -> None:
+        if capacity < 1:
+            raise ValueError("FrameBuffer capacity must be at least 1")
+
+        self.capacity = capacity
+        self._frames: list = [None] * capacity
+        self._stamps: list = [0.0] * capacity
+        self._landmarks: list = [None] * capacity
+        self._seq = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def push(self, frame: np.ndarray, timestamp: float, landmarks: Optional[np.ndarray] = None) -> int:
+        """
+        ## Push
+
+        Stores a frame in the next ring slot and wakes any waiting readers
+
+        Parameters
+        ----------
+        frame : np.ndarray
+            Captured frame
+        timestamp : float
+            Monotonic capture time in seconds
+        landmarks : Optional[np.ndarray]
+            Eye corners supplied by the frame source, if any
+
+        Returns
+        -------
+        int
+            Sequence number of the stored frame
+        """
+        with self._cond:
+            self._seq += 1
+            slot = self._seq % self.capacity
+            self._frames[slot] = frame
+            self._stamps[slot] = timestamp
+            self._landmarks[slot] = landmarks
+            self._cond.notify_all()
+            return self._seq
+
+    def latest(self) -> Tuple[int, Optional[np.ndarray], float, Optional[np.ndarray]]:
+        """
+        ## Latest
+
+        Newest frame without blocking
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        Tuple[int, Optional[np.ndarray], float, Optional[np.ndarray]]
+            Sequence number, frame, capture timestamp and landmarks (sequence 0 means no frame yet)
+        """
+        with self._cond:
+            slot = self._seq % self.capacity
+            return self._seq, self._frames[slot], self._stamps[slot], self._landmarks[slot]
+
+    def wait(self, after_seq: int, timeout: Optional[float] = None) -> Tuple[int, Optional[np.ndarray], float, Optional[np.ndarray]]:
+        """
+        ## Wait
+
+        Blocks until a frame newer than `after_seq` is available. Intermediate frames are skipped
+
+        Parameters
+        ----------
+        after_seq : int
+            Sequence number of the last frame the caller consumed
+        timeout : Optional[float]
+            Maximum time to wait in seconds
+
+        Returns
+        -------
+        Tuple[int, Optional[np.ndarray], float, Optional[np.ndarray]]
+            Sequence number, frame, capture timestamp and landmarks. The sequence number is unchanged on timeout or close
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq or self._closed, timeout=timeout)
+            slot = self._seq % self.capacity
+            return self._seq, self._frames[slot], self._stamps[slot], self._landmarks[slot]
+
+    def close(self) -> None:
+        """
+        ## Close
+
+        Releases every reader blocked in `wait`
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+
+class CaptureThread:
+    """
+    ## Capture Thread
+
+    Owns a frame source and reads it on a dedicated thread, publishing each frame
+    into a FrameBuffer so consumers are never stuck behind camera I/O
+
+    Parameters
+    ----------
+    source : FrameSource
+        Frame source (anything with VideoCapture style `read()` and `release()` methods)
+    buffer : FrameBuffer
+        Destination buffer for captured frames
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, source, buffer: FrameBuffer) -> None:
+        self.source = source
+        self.buffer = buffer
+        self.failed_reads = 0
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="frame-capture", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            start = metrics.clock()
+            ok, frame = self.source.read()
+            timestamp = time.monotonic()
+            metrics.record("capture", start)
+
+            if not ok or frame is None:
+                self.failed_reads += 1
+                metrics.count("failed reads")
+                # Avoid spinning when the device is gone
+                self._stop.wait(0.01)
+                continue
+
+            landmarks = self.source.landmarks() if getattr(self.source, "provides_landmarks", False) else None
+            self.buffer.push(frame, timestamp, landmarks)
+
+    def stop(self) -> None:
+        """
+        ## Stop
+
+        Stops the capture loop and releases the frame source
+        """
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self.buffer.close()
+        self.source.release()
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
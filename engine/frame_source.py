@@ -0,0 +1,352 @@
+from abc import ABC, abstractmethod
+from typing import Callable, List, Optional, Tuple, Union
+import numpy as np
+import math
+import time
+import cv2
+import os
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+class FrameSource(ABC):
+    """
+    ## Frame Source
+
+    Interface for anything that produces webcam-like frames. Mirrors the `read()` / `release()`
+    methods of OpenCV's VideoCapture so sources can be used wherever a capture device is expected
+
+    Sources that already know where the eyes are (synthetic replay) set `provides_landmarks` and
+    return the eye corners of the last frame from `landmarks()`, letting the gaze pipeline skip detection
+    """
+    provides_landmarks: bool = False
+
+    @abstractmethod
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        ## Read
+
+        Returns the next frame
+
+        Returns
+        -------
+        Tuple[bool, Optional[np.ndarray]]
+            Success flag and BGR frame
+        """
+
+    @property
+    @abstractmethod
+    def size(self) -> Tuple[int, int]:
+        """
+        ## Size
+
+        Frame width and height in px
+        """
+
+    @property
+    def frame_rate(self) -> Optional[float]:
+        """
+        ## Frame Rate
+
+        Nominal frames per second, None if unknown
+        """
+        return None
+
+    def landmarks(self) -> Optional[np.ndarray]:
+        """
+        ## Landmarks
+
+        Eye corners (dlib points 36, 39, 42, 45) of the last frame read, as a 4 x 2 array in frame coordinates
+
+        Returns
+        -------
+        Optional[np.ndarray]
+            Eye corners, or None if the source does not provide landmarks
+        """
+        return None
+
+    def release(self) -> None:
+        """
+        ## Release
+
+        Frees the underlying device or file
+        """
+
+
+class CameraSource(FrameSource):
+    """
+    ## Camera Source
+
+    Live webcam
+
+    Parameters
+    ----------
+    index : int
+        OpenCV camera index
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, index: int = 0) -> None:
+        self.index = index
+        self.cap = cv2.VideoCapture(index)
+        self._size: Optional[Tuple[int, int]] = None
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        ok, frame = self.cap.read()
+        if ok and self._size is None:
+            self._size = (frame.shape[1], frame.shape[0])
+        return ok, frame
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        if self._size is None:
+            width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            if width and height:
+                self._size = (width, height)
+            else:
+                # Some backends only report a size after the first frame
+                self.read()
+        if self._size is None:
+            raise Exception(f"Could not read from webcam {self.index}.")
+        return self._size
+
+    @property
+    def frame_rate(self) -> Optional[float]:
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        return fps if fps > 0 else None
+
+    def release(self) -> None:
+        self.cap.release()
+
+
+class VideoFileSource(FrameSource):
+    """
+    ## Video File Source
+
+    Recorded video file or directory of images, played at native speed or as fast as possible
+
+    Parameters
+    ----------
+    path : str
+        Video file or directory of images (played in file name order)
+    realtime : bool
+        Pace frames at the native frame rate. When False frames are returned as fast as they are read
+    loop : bool
+        Restart from the first frame at the end of the recording
+    frame_rate : Optional[float]
+        Playback rate for image directories, or to override the video's own rate
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, path: str, realtime: bool = True, loop: bool = False, frame_rate: Optional[float] = None) -> None:
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+
+        self._images: Optional[List[str]] = None
+        self._cap = None
+        self._index = 0
+        self._start: Optional[float] = None
+
+        if os.path.isdir(path):
+            self._images = sorted(os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS))
+            if not self._images:
+                raise Exception(f"No images found in {path}.")
+            first = cv2.imread(self._images[0])
+            self._size = (first.shape[1], first.shape[0])
+            self._rate = frame_rate or 30.0
+        else:
+            self._cap = cv2.VideoCapture(path)
+            if not self._cap.isOpened():
+                raise Exception(f"Could not open video {path}.")
+            self._size = (int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            fps = self._cap.get(cv2.CAP_PROP_FPS)
+            self._rate = frame_rate or (fps if fps > 0 else 30.0)
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        ok, frame = self.__read_next()
+        if not ok and self.loop and self._index > 0:
+            self.__rewind()
+            ok, frame = self.__read_next()
+        if not ok:
+            return False, None
+
+        if self.realtime:
+            if self._start is None:
+                self._start = time.monotonic()
+            delay = self._start + (self._index - 1) / self._rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        return True, frame
+
+    def __read_next(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if self._images is not None:
+            if self._index >= len(self._images):
+                return False, None
+            frame = cv2.imread(self._images[self._index])
+            ok = frame is not None
+        else:
+            ok, frame = self._cap.read()
+
+        if ok:
+            self._index += 1
+        return ok, frame
+
+    def __rewind(self) -> None:
+        if self._cap is not None:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self._index = 0
+        self._start = None
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self._size
+
+    @property
+    def frame_rate(self) -> Optional[float]:
+        return self._rate
+
+    def release(self) -> None:
+        if self._cap is not None:
+            self._cap.release()
+
+
+def circle_trajectory(period: float = 4.0, radius: float = 0.25) -> Callable[[float], Tuple[float, float]]:
+    """
+    ## Circle Trajectory
+
+    Gaze trajectory moving around the frame center
+
+    Parameters
+    ----------
+    period : float
+        Seconds per revolution
+    radius : float
+        Radius as a fraction of the frame size
+
+    Returns
+    -------
+    Callable[[float], Tuple[float, float]]
+        Maps time in seconds to normalized (0 to 1) frame coordinates
+    """
+    def trajectory(t: float) -> Tuple[float, float]:
+        angle = 2 * math.pi * t / period
+        return (0.5 + radius * math.cos(angle), 0.5 + radius * math.sin(angle))
+
+    return trajectory
+
+
+class SyntheticSource(FrameSource):
+    """
+    ## Synthetic Source
+
+    Emits frames with known eye positions along a chosen trajectory. Time advances by one
+    frame period per read, so replays are deterministic regardless of how fast frames are consumed
+
+    Parameters
+    ----------
+    size : Tuple[int, int]
+        Frame width and height in px
+    trajectory : Optional[Callable[[float], Tuple[float, float]]]
+        Maps time in seconds to the normalized (0 to 1) eye center. Defaults to a circle
+    frame_rate : float
+        Simulated frames per second
+    frames : Optional[int]
+        Number of frames before the source runs out (None for endless)
+    realtime : bool
+        Pace frames at `frame_rate`. When False frames are returned as fast as possible
+    render : bool
+        Draw the eyes into each frame. When False a blank frame is returned and only landmarks are meaningful
+
+    Returns
+    -------
+    None
+    """
+    provides_landmarks = True
+
+    def __init__(self, size: Tuple[int, int] = (640, 480), trajectory: Optional[Callable[[float], Tuple[float, float]]] = None,
+                 frame_rate: float = 30.0, frames: Optional[int] = None, realtime: bool = False, render: bool = True) -> None:
+        self._size = size
+        self.trajectory = trajectory or circle_trajectory()
+        self._rate = frame_rate
+        self.frames = frames
+        self.realtime = realtime
+        self.render = render
+
+        self._index = 0
+        self._start: Optional[float] = None
+        self._landmarks = np.zeros((4, 2))
+        self._blank = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+
+        # Eye corner offsets from the eye center, as a fraction of frame width
+        self._offsets = np.array([[-0.09, 0.0], [-0.03, 0.0], [0.03, 0.0], [0.09, 0.0]]) * size[0]
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if self.frames is not None and self._index >= self.frames:
+            return False, None
+
+        t = self._index / self._rate
+        self._index += 1
+
+        u, v = self.trajectory(t)
+        center = np.array([u * self._size[0], v * self._size[1]])
+        self._landmarks = center + self._offsets
+
+        if self.realtime:
+            if self._start is None:
+                self._start = time.monotonic()
+            delay = self._start + t - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        if not self.render:
+            return True, self._blank
+
+        frame = np.zeros_like(self._blank)
+        eye_radius = max(2, round(0.02 * self._size[0]))
+        for eye in (self._landmarks[:2].mean(axis=0), self._landmarks[2:].mean(axis=0)):
+            cv2.circle(frame, (round(eye[0]), round(eye[1])), eye_radius, (255, 255, 255), -1)
+        return True, frame
+
+    def landmarks(self) -> Optional[np.ndarray]:
+        return self._landmarks.copy()
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self._size
+
+    @property
+    def frame_rate(self) -> Optional[float]:
+        return self._rate
+
+
+def open_source(spec: Union[int, str], realtime: bool = True) -> FrameSource:
+    """
+    ## Open Source
+
+    Creates a frame source from a command line style specification
+
+    Parameters
+    ----------
+    spec : Union[int, str]
+        Webcam index, video file, image directory or "synthetic"
+    realtime : bool
+        Pace recorded and synthetic sources at their native rate
+
+    Returns
+    -------
+    FrameSource
+        Opened source
+    """
+    if isinstance(spec, int) or str(spec).isdigit():
+        return CameraSource(int(spec))
+    if spec == "synthetic":
+        return SyntheticSource(realtime=realtime)
+    return VideoFileSource(spec, realtime=realtime)
@@ -1,17 +1,32 @@
 from _assets.dlib_typing import _dlib_pybind11
-
-from typing import Sequence, Tuple, Any
-from itertools import combinations
+from engine.frame_capture import CaptureThread, FrameBuffer
+from engine.frame_source import CameraSource, FrameSource
+from engine.face_tracking import FaceTracker, MultiFaceTracker, eye_center, load_face_models, mirror_box
+from engine.calibration import CalibrationMap, calibration_grid, fit_calibration
+from engine.startup import StartupProfile
+from engine.instrumentation import metrics
+from engine.gaze_stream import GazeSample, GazeStream
+from engine.gaze_export import GazeExport
+from engine.detection_workers import DetectionPool
+from engine.operators import OperatorGaze
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+from concurrent.futures import Future
+import asyncio
 from screeninfo import Monitor
-from cv2 import VideoCapture
 import numpy as np
 import screeninfo
-import dlib
+import threading
+import logging
+import time
 import json
 import cv2
 import os
 
 
+logger = logging.getLogger(__name__)
+
+
 class GazeOTS:
     """
     ## Gaze Off-the-Shelf
@@ -20,46 +35,147 @@ class GazeOTS:
 
     Parameters
     ----------
-    None
+    source : Optional[FrameSource]
+        Where frames come from. Defaults to the first webcam
+    screen_size : Optional[Tuple[int, int]]
+        Screen width and height in px. Defaults to the first monitor
+    transform : Optional[Union[CalibrationMap, Sequence[Sequence[float]]]]
+        Precomputed calibration map, or a 2 x 3 affine / 3 x 3 homography matrix. Skips calibration when given
+    tracking : bool
+        Track the face between full-frame detections instead of detecting every frame
+    detection_scale : float
+        Scale applied to webcam frames before face detection (see `python -m engine.benchmark`)
+    calibration_size : int
+        Number of calibration dots, 5 (corners and center) or a square grid such as 9 or 16
+    calibration_model : str
+        Calibration map to fit, "affine", "homography" or "poly2"
+    calibration_dwell : float
+        Seconds of frames recorded per calibration dot
+    ransac_threshold : Optional[float]
+        Reject calibration samples further than this many px from the fitted map. Off when None
+    face_models : Optional[Future]
+        Pending `load_face_models` result, e.g. started before the UI was built. Loaded on a
+        background thread when None
+    startup : Optional[StartupProfile]
+        Profile recording the startup stages
+    workers : int
+        Run face detection in this many worker processes instead of the gaze thread (0 keeps
+        it in process). More than one worker spreads frames round-robin for multi-core scaling
+    max_faces : int
+        Faces followed at once. Each face track gets an operator slot, see `operator()`
+    name : Optional[str]
+        Camera name, keeps calibration files of several cameras apart
+    face_backend : str
+        Face detector and landmark predictor, see `load_face_models`. Only used when face_models is None
 
     Returns
     -------
     None
     """
-    def __init__(self) -> None:
-        self.cwd = os.getcwd()
-        self.cap: VideoCapture = cv2.VideoCapture(0)
+    def __init__(self, source: Optional[FrameSource] = None, screen_size: Optional[Tuple[int, int]] = None,
+                 transform: Optional[Union[CalibrationMap, Sequence[Sequence[float]]]] = None, tracking: bool = True,
+                 detection_scale: float = 1.0, calibration_size: int = 5, calibration_model: str = "affine",
+                 calibration_dwell: float = 1.0, ransac_threshold: Optional[float] = None,
+                 face_models: Optional[Future] = None, startup: Optional[StartupProfile] = None,
+                 workers: int = 0, max_faces: int = 1, name: Optional[str] = None, face_backend: str = "dlib") -> None:
+        if max_faces > 1 and workers:
+            raise ValueError("Multiple faces are only supported with in-process detection (workers=0)")
 
-        self.detector: _dlib_pybind11.fhog_object_detector = dlib.get_frontal_face_detector()
-        self.predictor: _dlib_pybind11.shape_predictor = dlib.shape_predictor(os.path.join(self.cwd, '_assets/shape_predictor.dat'))
+        self.cwd = os.getcwd()
+        self.name = name
+        self.startup = startup if startup is not None else StartupProfile()
+
+        # Open the camera and load the face models concurrently, they are only waited on when needed
+        camera = self.startup.background("camera", CameraSource, 0) if source is None else None
+        if face_models is None and (source is None or not source.provides_landmarks):
+            face_models = self.startup.background("face models", load_face_models, None, face_backend)
+        self._face_models = face_models
+        self.face_backend = face_backend
+
+        # Full detection only on startup or when the face is lost, tracked in between
+        self.tracking = tracking
+        self.detection_scale = detection_scale
+        self.detector: Optional[_dlib_pybind11.fhog_object_detector] = None
+        self.predictor: Optional[_dlib_pybind11.shape_predictor] = None
+        self.face_tracker: Optional[FaceTracker] = None
+        self._face_models_lock = threading.Lock()
 
         # Screen properties
-        screen: Monitor = screeninfo.get_monitors()[0]
-        self.width: int = screen.width
-        self.height: int = screen.height
+        with self.startup.stage("screen info"):
+            if screen_size is None:
+                screen: Monitor = screeninfo.get_monitors()[0]
+                screen_size = (screen.width, screen.height)
+        self.width: int = screen_size[0]
+        self.height: int = screen_size[1]
+
+        if camera is not None:
+            with self.startup.stage("wait camera"):
+                source = camera.result()
+        self.source: FrameSource = source
 
         # Webcam properties
-        webcam: Tuple[bool, Sequence] = self.cap.read()
-        self.webcam_width: int = webcam[1].shape[1]
-        self.webcam_height: int = webcam[1].shape[0]
+        self.webcam_width, self.webcam_height = self.source.size
+
+        # Source is read on its own thread, only the newest frames are kept
+        self.frames = FrameBuffer()
+        self.capture = CaptureThread(self.source, self.frames)
+        self.capture.start()
+        self._frame_seq = 0
 
         # Calibration dot
         self.dot_radius = round(max([self.width, self.height]) / 100)
 
-        # Top left, top right, bottom left, bottom right, center points on screen (in px)
-        self.calibration_points: Sequence[Tuple[int, int]] = [
-            (self.dot_radius, self.dot_radius), 
-            (self.width - self.dot_radius, self.dot_radius), 
-            (self.dot_radius, self.height - self.dot_radius), 
-            (self.width - self.dot_radius, self.height - self.dot_radius), 
-            (self.width // 2, self.height // 2)
-        ]
+        # Calibration dots on screen (in px), e.g. the corners and center for 5 points
+        self.calibration_points: Sequence[Tuple[int, int]] = calibration_grid(
+            self.width, self.height, calibration_size, margin=self.dot_radius
+        )
+        self.calibration_model = calibration_model
+        self.calibration_dwell = calibration_dwell
+        self.ransac_threshold = ransac_threshold
 
         # Initial gaze locatino
         self.gaze_x = 0
         self.gaze_y = 0
 
-        self.run()
+        # Latest gaze sample, published by the gaze thread
+        self.sample_seq = 0
+        self.sample_time = 0.0
+        self._sample_cond = threading.Condition()
+        self._gaze_thread: Optional[threading.Thread] = None
+        self._collect_thread: Optional[threading.Thread] = None
+        self._running = False
+
+        # Exception that ended the gaze thread, None while it is healthy
+        self.error: Optional[BaseException] = None
+
+        # Detection worker processes, started with the gaze thread
+        self.workers = workers
+        self.detection_pool: Optional[DetectionPool] = None
+
+        # Raw gaze, face box and confidence of the latest sample, see latest_sample
+        self._sample_detail: Tuple[Tuple[float, float], Optional[Tuple[int, int, int, int]], Optional[float]] = ((0, 0), None, None)
+
+        # Latest (seq, x, y, timestamp) per operator slot, slot 0 mirrors gaze_location
+        self.max_faces = max_faces
+        self.operator_samples: List[Tuple[int, float, float, float]] = [(0, 0.0, 0.0, 0.0)] * max_faces
+        self._operator_slots: Dict[int, int] = {}
+
+        # Async consumers, see stream()
+        self._streams: List[GazeStream] = []
+        self._streams_lock = threading.Lock()
+
+        # Shared memory exports for other processes, see export()
+        self._exports: List[GazeExport] = []
+
+        if transform is None:
+            self.run()
+        else:
+            self.gaze_points = []
+            if isinstance(transform, CalibrationMap):
+                self.calibration = transform
+            else:
+                self.calibration = CalibrationMap.from_transform(transform)
+        self.start()
     
     def run(self) -> None:
         """
@@ -77,7 +193,8 @@ class GazeOTS:
             Runs method to display gaze tracking
         """
         calibration_files = os.listdir(os.path.join(self.cwd, '_assets/calibration_files'))
-        predicted_file = f"s{self.width}_s{self.height}_w{self.webcam_width}_w{self.webcam_height}.json"
+        suffix = f"_{self.name}" if self.name else ""
+        predicted_file = f"s{self.width}_s{self.height}_w{self.webcam_width}_w{self.webcam_height}{suffix}.json"
 
         if predicted_file in calibration_files:
             recalibrate = input("Do you want to recalibrate? (y/n): ")
@@ -92,26 +209,33 @@ class GazeOTS:
             with open(f"{os.path.join(self.cwd, '_assets/calibration_files/')}{predicted_file}", "r") as infile:
                 calibration_dict = json.load(fp=infile)
 
-            self.gaze_points = calibration_dict["gaze_points"]
-            self.transform = np.array(calibration_dict["transform"])
+            # Older files hold one gaze point per dot
+            self.gaze_points = [
+                points if np.ndim(points) == 2 else [points] for points in calibration_dict["gaze_points"]
+            ]
+            self.calibration = CalibrationMap.from_dict(calibration_dict)
+
+            # Refit from the recorded samples if a different model was asked for
+            if self.calibration.model != self.calibration_model:
+                self.calibration = self.__fit_calibration(calibration_dict["calibration_points"], self.gaze_points)
 
         else:
             self.gaze_points = self.__calibrate()
-            self.transform = self.average_trans
+            self.calibration = self.__fit_calibration(self.calibration_points, self.gaze_points)
             calibration_dict = {
                 "calibration_points": self.calibration_points,
                 "gaze_points": self.gaze_points,
-                "transform": [[float(x) for x in self.transform[0]], [float(x) for x in self.transform[1]]]
+                **self.calibration.to_dict()
             }
 
-            with open(f"{os.path.join(self.cwd, '_assets/calibration_files/')}s{self.width}_s{self.height}_w{self.webcam_width}_w{self.webcam_height}.json", "w") as outfile:
+            with open(f"{os.path.join(self.cwd, '_assets/calibration_files/')}{predicted_file}", "w") as outfile:
                 json.dump(obj=calibration_dict, fp=outfile)
 
-    def __calibrate(self) -> Sequence[Tuple[int, int]]:
+    def __calibrate(self) -> List[List[Tuple[int, int]]]:
         """
         ## Calibrate
 
-        Calibrates for a given screen and webcam
+        Calibrates for a given screen and webcam. Every frame of a dwell on a dot is recorded
 
         Parameters
         ----------
@@ -119,19 +243,19 @@ class GazeOTS:
 
         Returns
         -------
-        Sequence[Tuple[int, int]]
-            Recorded gaze points for known screen positions
+        List[List[Tuple[int, int]]]
+            Recorded gaze samples for each calibration point
         """
-        # Black screen
-        frame = np.zeros((self.height, self.width, 3))
+        # One black uint8 canvas for the whole calibration, only the dot is redrawn
+        frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
 
         # Calibration window
         cv2.namedWindow("Calibration", cv2.WND_PROP_FULLSCREEN)
         cv2.setWindowProperty("Calibration", cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
 
         # Calculate scaling for display text (accounts for different display resolutions)
-        line1_text = "Turn your head to stare at each dot for two seconds."
-        line2_text = "Press spacebar to record calibration point."
+        line1_text = "Turn your head to stare at each dot."
+        line2_text = "Press spacebar and hold still while it is yellow."
         font = cv2.FONT_HERSHEY_SIMPLEX
         font_scale = 2
         font_thickness = font_scale * 2
@@ -151,51 +275,65 @@ class GazeOTS:
         line1_size = cv2.getTextSize(text=line1_text, fontFace=font, fontScale=font_scale, thickness=font_thickness)[0]
         line2_size = cv2.getTextSize(text=line2_text, fontFace=font, fontScale=font_scale, thickness=font_thickness)[0]
 
-        line1_origin = (round(self.calibration_points[-1][0] - line1_size[0] / 2),
-                        round(self.calibration_points[-1][1] - line1_size[1]))
-        line2_origin = (round(self.calibration_points[-1][0] - line2_size[0] / 2),
-                        round(self.calibration_points[-1][1] + line2_size[1]))
+        line1_origin = (round(self.width / 2 - line1_size[0] / 2),
+                        round(self.height / 2 - line1_size[1]))
+        line2_origin = (round(self.width / 2 - line2_size[0] / 2),
+                        round(self.height / 2 + line2_size[1]))
     
-        # Collect points
-        gaze_points = []
-        for point in self.calibration_points:
-            x, y = point
-            frame = np.zeros((self.height, self.width, 3))
-
+        def draw_text() -> None:
             cv2.putText(img=frame, text=line1_text, org=line1_origin, fontFace=font, fontScale=font_scale, 
                         color=(255, 255, 255), thickness=font_thickness, lineType=cv2.FILLED)
             cv2.putText(img=frame, text=line2_text, org=line2_origin, fontFace=font, fontScale=font_scale, 
                         color=(255, 255, 255), thickness=font_thickness, lineType=cv2.FILLED)
-            
-            cv2.circle(img=frame, center=(x, y), radius=self.dot_radius, color=(0, 255, 0), thickness=-1)            
-            cv2.imshow("Calibration", frame)
-
-            # Wait for user to capture image (spacebar)
-            while True:
-                _, webcam_frame = self.cap.read()
-                webcam_frame = cv2.flip(webcam_frame, 1)
-
-                key = cv2.waitKey(1) & 0xFF
-                if key == 32:  # Spacebar
-                    # Detect faces and eyes for gaze tracking
-                    gray = cv2.cvtColor(webcam_frame, cv2.COLOR_BGR2GRAY)
-                    faces = self.detector(gray)
 
-                    for face in faces:
-                        gaze_x, gaze_y = self.__gaze_location(frame=webcam_frame, gray=gray, face=face)
+        draw_text()
 
-                        # Clamp bounds on screen
-                        gaze_x = max(0, min(self.width - 1, gaze_x))
-                        gaze_y = max(0, min(self.height - 1, gaze_y))
+        # Collect points (frames during a dwell are consecutive, so the face can be tracked)
+        self.__load_face_models()
+        face_tracker = FaceTracker(self.detector, self.predictor, tracking=self.tracking, detection_scale=self.detection_scale)
+        gray = np.empty((self.webcam_height, self.webcam_width), dtype=np.uint8)
+        gaze_points = []
+        for point in self.calibration_points:
+            x, y = point
+            samples: List[Tuple[int, int]] = []
+            recording_since: Optional[float] = None
 
-                        # Store gaze point
-                        gaze_points.append((gaze_x, gaze_y))
-                    break
-                
-                frame = np.zeros((self.height, self.width, 3))
+            while True:
+                # Dot turns yellow while frames are being recorded
+                dot_color = (0, 255, 0) if recording_since is None else (0, 255, 255)
+                cv2.circle(img=frame, center=(x, y), radius=self.dot_radius, color=dot_color, thickness=-1)
+                cv2.imshow("Calibration", frame)
 
-            # Clear screen
-            frame = np.zeros((self.height, self.width, 3))
+                key = cv2.waitKey(1) & 0xFF
+                if key == 32 and recording_since is None:  # Spacebar
+                    recording_since = time.monotonic()
+                    face_tracker.reset()
+
+                next_frame = self.__next_frame(timeout=0.1)
+                if next_frame is None or recording_since is None:
+                    continue
+
+                # Detect faces and eyes for gaze tracking
+                raw_gaze = self.__raw_gaze(*next_frame, face_tracker, gray)
+                if raw_gaze is not None:
+                    gaze_x, gaze_y = raw_gaze
+
+                    # Clamp bounds on screen
+                    gaze_x = max(0, min(self.width - 1, gaze_x))
+                    gaze_y = max(0, min(self.height - 1, gaze_y))
+                    samples.append((gaze_x, gaze_y))
+
+                if time.monotonic() - recording_since >= self.calibration_dwell:
+                    if samples:
+                        break
+                    # No face seen during the dwell, ask for the dot again
+                    recording_since = None
+
+            gaze_points.append(samples)
+
+            # Clear the dot (and restore any text under it)
+            cv2.circle(img=frame, center=(x, y), radius=self.dot_radius, color=(0, 0, 0), thickness=-1)
+            draw_text()
             cv2.imshow("Calibration", frame)
 
         # Remove window
@@ -216,30 +354,32 @@ class GazeOTS:
         -------
         None
         """
-        # Create a black screen
-        gaze_screen = np.zeros((self.height, self.width, 3))
+        # Black uint8 canvas, reused for every frame
+        gaze_screen = np.zeros((self.height, self.width, 3), dtype=np.uint8)
 
         # Show gaze tracking
         cv2.namedWindow("Gaze Tracking", cv2.WND_PROP_FULLSCREEN)
         cv2.setWindowProperty("Gaze Tracking", cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
 
-        while True:
-            _, webcam_frame = self.cap.read()
-            webcam_frame = cv2.flip(webcam_frame, 1)
+        gaze_x, gaze_y = self.gaze_x, self.gaze_y
+        self.__load_face_models()
+        face_tracker = FaceTracker(self.detector, self.predictor, tracking=self.tracking, detection_scale=self.detection_scale)
+        gray = np.empty((self.webcam_height, self.webcam_width), dtype=np.uint8)
+        dot: Optional[Tuple[int, int]] = None
 
-            # Detect faces
-            gray = cv2.cvtColor(webcam_frame, cv2.COLOR_BGR2GRAY)
-            faces = self.detector(gray)
+        while True:
+            next_frame = self.__next_frame(timeout=0.1)
+            if next_frame is not None:
+                raw_gaze = self.__raw_gaze(*next_frame, face_tracker, gray)
 
-            for face in faces:
-                transformed_point = cv2.transform(np.array([[self.__gaze_location(frame=webcam_frame, gray=gray, face=face)]], \
-                                                           dtype=np.float32), self.transform)
-                gaze_x, gaze_y = transformed_point[0][0]
-            
-            gaze_screen = np.zeros((self.height, self.width, 3))
+                if raw_gaze is not None:
+                    gaze_x, gaze_y = self.calibration.map_point(raw_gaze)
 
-            # Draw dot at gaze location
-            cv2.circle(gaze_screen, (round(gaze_x), round(gaze_y)), self.dot_radius, (0, 255, 0), -1)
+            # Move the dot to the gaze location, erasing the old one
+            if dot is not None:
+                cv2.circle(gaze_screen, dot, self.dot_radius, (0, 0, 0), -1)
+            dot = (round(gaze_x), round(gaze_y))
+            cv2.circle(gaze_screen, dot, self.dot_radius, (0, 255, 0), -1)
 
             # Display gaze screen
             cv2.imshow("Gaze Tracking", gaze_screen)
@@ -249,78 +389,478 @@ class GazeOTS:
 
         cv2.destroyAllWindows()
 
-    def __gaze_location(self, frame: Sequence, gray: Sequence, face: Any) -> Tuple[int, int]:
+    def __raw_gaze(self, webcam_frame: Sequence, landmarks: Optional[np.ndarray], face_tracker: FaceTracker,
+                   gray: Optional[np.ndarray] = None) -> Optional[Tuple[int, int]]:
+        """
+        ## Raw Gaze
+
+        Gaze location of an unflipped webcam frame, before calibration is applied. The face is
+        found in the unflipped frame and only the eye center is mirrored, so the frame itself
+        is never flipped
+
+        Parameters
+        ----------
+        webcam_frame : Sequence
+            Frame as read from the source
+        landmarks : Optional[np.ndarray]
+            Eye corners supplied by the source, detected from the frame when None
+        face_tracker : FaceTracker
+            Face locator to use for this frame
+        gray : Optional[np.ndarray]
+            Preallocated grayscale buffer the size of the frame, reused across frames
+
+        Returns
+        -------
+        Optional[Tuple[int, int]]
+            Gaze location in webcam reference frame, None if no face was found
+        """
+        width = webcam_frame.shape[1]
+
+        if landmarks is not None:
+            center_x, center_y = landmarks.mean(axis=0)
+            return self.__gaze_location(webcam_frame.shape, width - 1 - center_x, center_y)
+
+        # Detect or track face
+        start = metrics.clock()
+        gray = cv2.cvtColor(webcam_frame, cv2.COLOR_BGR2GRAY, dst=gray)
+        metrics.record("cvtColor", start)
+        located = face_tracker.locate(gray)
+        if located is None:
+            return None
+
+        center_x, center_y = eye_center(located[1])
+        return self.__gaze_location(webcam_frame.shape, width - 1 - center_x, center_y)
+
+    def __gaze_location(self, frame_shape: Tuple[int, ...], center_x: float, center_y: float) -> Tuple[int, int]:
         """
         ## Gaze Location
 
-        Calculates gaze location from a frame, normalized frame, and face object
+        Calculates gaze location from the eye center of a face in the mirrored frame
 
         Parameters
         ----------
-        frame : Sequence
-            Captured frame
-        gray : Sequence
-            Normalized frame
-        face : Any
-            Face object
+        frame_shape : Tuple[int, ...]
+            Shape of the captured frame
+        center_x, center_y : float
+            Mean of the eye corners (dlib points 36, 39, 42, 45), mirrored horizontally
 
         Returns
         -------
         Tuple[int, int]
             Gaze location in webcam reference frame
         """
-        landmarks = self.predictor(gray, face)
+        # Map the eye center position to screen space
+        gaze_x = round((center_x / frame_shape[1]) * self.width)
+        gaze_y = round((center_y / frame_shape[0]) * self.height)
 
-        # Eye landmarks from dlib
-        left_eye = landmarks.part(36), landmarks.part(39)
-        right_eye = landmarks.part(42), landmarks.part(45)
+        return (gaze_x, gaze_y)
 
-        # Center of each eye
-        left_eye_center = (((left_eye[0].x + left_eye[1].x) / 2), ((left_eye[0].y + left_eye[1].y) / 2))
-        right_eye_center = (((right_eye[0].x + right_eye[1].x) / 2), ((right_eye[0].y + right_eye[1].y) / 2))
+    def start(self) -> None:
+        """
+        ## Start
 
-        # Average of centers
-        face_center_x = ((left_eye_center[0] + right_eye_center[0]) / 2)
-        face_center_y = ((left_eye_center[1] + right_eye_center[1]) / 2)
+        Starts the gaze thread, which turns each new webcam frame into a gaze sample
 
-        # Map the eye center position to screen space
-        gaze_x = round((face_center_x / frame.shape[1]) * self.width)
-        gaze_y = round((face_center_y / frame.shape[0]) * self.height)
+        Parameters
+        ----------
+        None
 
-        return (gaze_x, gaze_y)
+        Returns
+        -------
+        None
+        """
+        if self._gaze_thread is not None and self._gaze_thread.is_alive():
+            return
+
+        self._running = True
+
+        # Detection in worker processes, only frames and compact results cross the process boundary
+        if self.workers and not self.source.provides_landmarks:
+            self.detection_pool = DetectionPool((self.webcam_height, self.webcam_width, 3), self.workers,
+                                                tracking=self.tracking, detection_scale=self.detection_scale,
+                                                backend=self.face_backend)
+            self._collect_thread = threading.Thread(target=self.__guarded, args=(self.__collect_loop,),
+                                                    name="gaze-collect", daemon=True)
+            self._collect_thread.start()
+            loop = self.__dispatch_loop
+        elif self.max_faces > 1 and not self.source.provides_landmarks:
+            loop = self.__multi_face_loop
+        else:
+            loop = self.__gaze_loop
+        self._gaze_thread = threading.Thread(target=self.__guarded, args=(loop,),
+                                             name="gaze-dispatch" if self.detection_pool else "gaze-detection", daemon=True)
+        self._gaze_thread.start()
 
-    def __calculate_transformation_matrix(self, calibration_points: Sequence[Tuple[int, int]], gaze_points: Sequence[Tuple[int, int]]) -> Sequence[Sequence[float]]:
+    def __guarded(self, loop: Callable[[], None]) -> None:
+        # A failing gaze thread is reported through `error` instead of leaving gaze frozen unnoticed
+        try:
+            loop()
+        except Exception as error:
+            logger.exception("Gaze thread failed")
+            self.error = error
+            self._running = False
+            with self._sample_cond:
+                self._sample_cond.notify_all()
+
+    def stop(self) -> None:
         """
-        ## Calculate Transformation Matrix
+        ## Stop
 
-        Creates transformation matrix to map inputs to outputs.
-        Note that inputs must be a matrix of shape 2 x 3.
+        Stops the gaze thread and releases the webcam
 
         Parameters
         ----------
-        calibration_points : Sequence[Tuple[int, int]]
-            Known points displayed on screen
-        gaze_points : Sequence[Tuple[int, int]]
-            Known points from calibration sequence
+        None
+
+        Returns
+        -------
+        None
+        """
+        self._running = False
+        self.capture.stop()
+
+        # Ends every stream and releases a gaze thread blocked on a slow consumer
+        with self._streams_lock:
+            streams = list(self._streams)
+        for stream in streams:
+            stream.close()
+
+        for thread in (self._gaze_thread, self._collect_thread):
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(timeout=1.0)
+
+        if self.detection_pool is not None:
+            self.detection_pool.close()
+            self.detection_pool = None
+
+        exports, self._exports = self._exports, []
+        for export in exports:
+            export.close()
+
+        with self._sample_cond:
+            self._sample_cond.notify_all()
+
+    def __load_face_models(self) -> None:
+        """
+        ## Load Face Models
+
+        Waits for the face models loading in the background and creates the face tracker. Does
+        nothing after the first call
+        """
+        with self._face_models_lock:
+            if self.face_tracker is not None:
+                return
+
+            if self._face_models is not None:
+                with self.startup.stage("wait face models"):
+                    self.detector, self.predictor = self._face_models.result()
+
+            self.face_tracker = FaceTracker(self.detector, self.predictor, tracking=self.tracking, detection_scale=self.detection_scale)
+
+    def __next_frame(self, timeout: Optional[float] = None) -> Optional[Tuple[Sequence, Optional[np.ndarray]]]:
+        """
+        ## Next Frame
+
+        Waits for a webcam frame newer than the last one consumed
+
+        Parameters
+        ----------
+        timeout : Optional[float]
+            Maximum time to wait in seconds
 
         Returns
         -------
-        Sequence[Sequence[float]]
-            Transformation matrix
+        Optional[Tuple[Sequence, Optional[np.ndarray]]]
+            Newest frame and its source landmarks, or None if no new frame arrived in time
+        """
+        seq, frame, _, landmarks = self.frames.wait(self._frame_seq, timeout=timeout)
+        if seq == self._frame_seq:
+            return None
+
+        self._frame_seq = seq
+        return frame, landmarks
+
+    def __gaze_loop(self) -> None:
         """
-        src_pts = np.array([list(x) for x in gaze_points], dtype=np.float32)
-        dst_pts = np.array([list(x) for x in calibration_points], dtype=np.float32)
+        ## Gaze Loop
 
-        # Affine transformation matrix
-        matrix = cv2.getAffineTransform(src_pts, dst_pts)
-        return matrix
+        Body of the gaze thread. Frames that arrive while a frame is being processed are skipped
+        """
+        # Gaze samples start as soon as the face models are ready. Sources with landmarks need none
+        if not self.source.provides_landmarks:
+            self.__load_face_models()
+        frame_seq = self._frame_seq
+        gray = np.empty((self.webcam_height, self.webcam_width), dtype=np.uint8)
+
+        while self._running:
+            seq, webcam_frame, timestamp, landmarks = self.frames.wait(frame_seq, timeout=0.5)
+            if seq == frame_seq:
+                if self.frames.closed:
+                    break
+                continue
+
+            # Frames published while the last one was processed are never seen
+            if seq - frame_seq > 1:
+                metrics.count("dropped frames", seq - frame_seq - 1)
+            frame_seq = seq
+
+            raw_gaze = self.__raw_gaze(webcam_frame, landmarks, self.face_tracker, gray)
+
+            if raw_gaze is not None:
+                face, confidence = None, None
+                if landmarks is None and self.face_tracker.face is not None:
+                    face = mirror_box(self.face_tracker.face, webcam_frame.shape[1])
+                    confidence = float(self.face_tracker.confidence)
+
+                self.__publish_sample(raw_gaze, timestamp, face, confidence)
+
+    def __multi_face_loop(self) -> None:
+        """
+        ## Multi Face Loop
+
+        Body of the gaze thread when several faces are followed. Each face track holds an
+        operator slot until the track is dropped, new tracks take the lowest free slot
+        """
+        self.__load_face_models()
+        face_tracker = MultiFaceTracker(self.detector, self.predictor, max_faces=self.max_faces,
+                                        detection_scale=self.detection_scale)
+        frame_seq = self._frame_seq
+        gray = np.empty((self.webcam_height, self.webcam_width), dtype=np.uint8)
+
+        while self._running:
+            seq, webcam_frame, timestamp, _ = self.frames.wait(frame_seq, timeout=0.5)
+            if seq == frame_seq:
+                if self.frames.closed:
+                    break
+                continue
+
+            if seq - frame_seq > 1:
+                metrics.count("dropped frames", seq - frame_seq - 1)
+            frame_seq = seq
+
+            gray = cv2.cvtColor(webcam_frame, cv2.COLOR_BGR2GRAY, dst=gray)
+            faces = face_tracker.locate(gray)
+            width = webcam_frame.shape[1]
+
+            for track_id in [track_id for track_id in self._operator_slots if track_id not in face_tracker.tracks]:
+                del self._operator_slots[track_id]
+
+            for track_id, rect, landmarks in faces:
+                slot = self._operator_slots.get(track_id)
+                if slot is None:
+                    free = sorted(set(range(self.max_faces)) - set(self._operator_slots.values()))
+                    if not free:
+                        continue
+                    slot = self._operator_slots[track_id] = free[0]
+
+                center_x, center_y = eye_center(landmarks)
+                raw_gaze = self.__gaze_location(webcam_frame.shape, width - 1 - center_x, center_y)
+                if slot == 0:
+                    self.__publish_sample(raw_gaze, timestamp, mirror_box(rect, width), None)
+                    continue
+
+                gaze_x, gaze_y = self.calibration.map_point(raw_gaze)
+                with self._sample_cond:
+                    self.operator_samples[slot] = (self.operator_samples[slot][0] + 1, gaze_x, gaze_y, timestamp)
+                    self._sample_cond.notify_all()
+
+    def __dispatch_loop(self) -> None:
+        """
+        ## Dispatch Loop
+
+        Body of the gaze thread when detection runs in worker processes. Hands every new
+        frame to the detection pool, which drops frames while all workers are busy
+        """
+        frame_seq = self._frame_seq
+
+        while self._running:
+            seq, webcam_frame, timestamp, _ = self.frames.wait(frame_seq, timeout=0.5)
+            if seq == frame_seq:
+                if self.frames.closed:
+                    break
+                continue
+
+            if seq - frame_seq > 1:
+                metrics.count("dropped frames", seq - frame_seq - 1)
+            frame_seq = seq
+
+            self.detection_pool.submit(webcam_frame, seq, timestamp)
+
+    def __collect_loop(self) -> None:
+        """
+        ## Collect Loop
+
+        Turns detection pool results into gaze samples. Results can arrive out of order from
+        different workers, so results older than the newest published one are discarded
+        """
+        newest_seq = 0
+
+        while self._running:
+            result = self.detection_pool.result(timeout=0.5)
+            if result is None or result.center is None or result.seq <= newest_seq:
+                continue
+            newest_seq = result.seq
+
+            # Same mapping as __gaze_location
+            raw_gaze = (round(result.center[0] * self.width), round(result.center[1] * self.height))
+            self.__publish_sample(raw_gaze, result.timestamp, result.face, result.confidence)
+
+    def __publish_sample(self, raw_gaze: Tuple[int, int], timestamp: float,
+                         face: Optional[Tuple[int, int, int, int]], confidence: Optional[float]) -> None:
+        """
+        ## Publish Sample
+
+        Calibrates a raw gaze point and publishes it to `gaze_location` readers and async streams
+        """
+        start = metrics.clock()
+        gaze_x, gaze_y = self.calibration.map_point(raw_gaze)
+        metrics.record("transform", start)
+
+        with self._sample_cond:
+            self.gaze_x = gaze_x
+            self.gaze_y = gaze_y
+            self.sample_time = timestamp
+            self.sample_seq += 1
+            seq = self.sample_seq
+            self.operator_samples[0] = (seq, gaze_x, gaze_y, timestamp)
+            self._sample_detail = (raw_gaze, face, confidence)
+            self._sample_cond.notify_all()
+
+        if self._streams:
+            sample = GazeSample(seq, timestamp, (float(raw_gaze[0]), float(raw_gaze[1])),
+                                (float(gaze_x), float(gaze_y)), face, confidence)
+
+            with self._streams_lock:
+                streams = list(self._streams)
+            for stream in streams:
+                stream.publish(sample)
+
+        for export in self._exports:
+            export.write(seq, timestamp, raw_gaze, (gaze_x, gaze_y), face, confidence)
+
+        if seq == 1:
+            self.startup.mark("first gaze sample")
+
+    def stream(self, maxsize: int = 1, policy: str = "drop_oldest") -> GazeStream:
+        """
+        ## Stream
+
+        Async iterator over new gaze samples, for use inside a running event loop:
+
+            async with gaze.stream() as samples:
+                async for sample in samples:
+                    ...
+
+        Parameters
+        ----------
+        maxsize : int
+            Samples buffered while the consumer is busy
+        policy : str
+            What to do when the buffer is full: "drop_oldest" (always see the newest
+            samples), "drop_newest" or "block" (stall the gaze thread)
+
+        Returns
+        -------
+        GazeStream
+            Stream of GazeSample objects, ending when it is closed or the gaze thread stops
+        """
+        stream = GazeStream(asyncio.get_running_loop(), maxsize, policy, on_close=self.__unsubscribe)
+        with self._streams_lock:
+            self._streams.append(stream)
+        return stream
+
+    def export(self, name: str = "gaze", capacity: int = 1024) -> GazeExport:
+        """
+        ## Export
+
+        Publishes every new gaze sample to a shared memory ring that other processes read
+        with GazeReader, without opening the camera themselves
+
+        Parameters
+        ----------
+        name : str
+            Shared memory block name
+        capacity : int
+            Samples kept for readers of recent history
+
+        Returns
+        -------
+        GazeExport
+            Export, closed when the gaze thread stops
+        """
+        export = GazeExport(name, capacity, (self.width, self.height))
+        self._exports = self._exports + [export]
+        return export
+
+    def __unsubscribe(self, stream: GazeStream) -> None:
+        with self._streams_lock:
+            if stream in self._streams:
+                self._streams.remove(stream)
+
+    def operator(self, slot: int) -> OperatorGaze:
+        """
+        ## Operator
+
+        Gaze of one followed face, with the same interface as GazeOTS for selection
+
+        Parameters
+        ----------
+        slot : int
+            Operator slot, below `max_faces`. Slot 0 is the first face seen
+
+        Returns
+        -------
+        OperatorGaze
+            View of the slot's samples
+        """
+        if not 0 <= slot < self.max_faces:
+            raise ValueError(f"Operator slot {slot} is outside of max_faces={self.max_faces}")
+        return OperatorGaze(self, slot)
+
+    def wait_for_operator_sample(self, slot: int, after_seq: int, timeout: Optional[float] = None) -> int:
+        """
+        ## Wait For Operator Sample
+
+        Blocks until operator `slot` has a sample newer than `after_seq`, see `wait_for_sample`
+        """
+        with self._sample_cond:
+            self._sample_cond.wait_for(lambda: self.operator_samples[slot][0] > after_seq or not self._running,
+                                       timeout=timeout)
+            return self.operator_samples[slot][0]
+
+    def operator_location(self, slot: int) -> Tuple[float, float]:
+        with self._sample_cond:
+            _, gaze_x, gaze_y, _ = self.operator_samples[slot]
+            return (gaze_x, gaze_y)
+
+    def wait_for_sample(self, after_seq: int, timeout: Optional[float] = None) -> int:
+        """
+        ## Wait For Sample
+
+        Blocks until a gaze sample newer than `after_seq` is published
+
+        Parameters
+        ----------
+        after_seq : int
+            Sequence number of the last sample the caller consumed
+        timeout : Optional[float]
+            Maximum time to wait in seconds
+
+        Returns
+        -------
+        int
+            Sequence number of the newest sample (unchanged on timeout)
+        """
+        with self._sample_cond:
+            self._sample_cond.wait_for(lambda: self.sample_seq > after_seq or not self._running, timeout=timeout)
+            return self.sample_seq
 
     @property
     def gaze_location(self) -> Tuple[int, int]:
         """
         ## Gaze Location
 
-        Attribute giving current gaze location
+        Attribute giving the latest gaze location. Never blocks on the webcam
 
         Parameters
         ----------
@@ -331,57 +871,74 @@ class GazeOTS:
         Tuple[int, int]
             Current gaze location in px
         """
-        _, webcam_frame = self.cap.read()
-        webcam_frame = cv2.flip(webcam_frame, 1)
+        with self._sample_cond:
+            return (self.gaze_x, self.gaze_y)
+    
+    @property
+    def gaze_sample(self) -> Tuple[float, float, float]:
+        """
+        ## Gaze Sample
+
+        Latest gaze location together with the capture time of its frame (time.monotonic)
+        """
+        with self._sample_cond:
+            return (self.gaze_x, self.gaze_y, self.sample_time)
 
-        # Detect faces
-        gray = cv2.cvtColor(webcam_frame, cv2.COLOR_BGR2GRAY)
-        faces = self.detector(gray)
+    @property
+    def latest_sample(self) -> GazeSample:
+        """
+        ## Latest Sample
 
-        for face in faces:
-            transformed_point = cv2.transform(np.array([[self.__gaze_location(frame=webcam_frame, gray=gray, face=face)]], \
-                                                        dtype=np.float32), self.transform)
-            gaze_x, gaze_y = transformed_point[0][0]
+        Everything known about the latest gaze sample (sequence 0 before the first sample)
+        """
+        with self._sample_cond:
+            (raw_x, raw_y), face, confidence = self._sample_detail
+            return GazeSample(self.sample_seq, self.sample_time, (float(raw_x), float(raw_y)),
+                              (float(self.gaze_x), float(self.gaze_y)), face, confidence)
 
-        if faces:
-            self.gaze_x = gaze_x
-            self.gaze_y = gaze_y
-            return (gaze_x, gaze_y)
-        
-        else:
-            return (self.gaze_x, self.gaze_y)
-    
     @property
-    def average_trans(self) -> Sequence:
+    def transform(self) -> np.ndarray:
         """
-        ## Average Transformation Matrix
+        ## Transform
 
-        Average transformation matrix for converting from snapshot resolution to display resolution
+        Parameters of the calibration map (2 x 3 matrix for the affine model)
 
         Returns
         -------
-        Sequence
-            Average transformation matrix
+        np.ndarray
+            Calibration map parameters
         """
-        # Converts from screen webcam snapshots to screen position
-        calib_comb = list(combinations(iterable=self.calibration_points, r=3))
-        gaze_comb = list(combinations(iterable=self.gaze_points, r=3))
+        return self.calibration.params
 
-        trans_mats = []
-        
-        try:
-            for i in range(len(calib_comb)):
-                trans_mat = self.__calculate_transformation_matrix(calibration_points=calib_comb[i], gaze_points=gaze_comb[i])
-                trans_mats.append(trans_mat)
+    def __fit_calibration(self, calibration_points: Sequence[Tuple[int, int]],
+                          gaze_points: Sequence[Sequence[Tuple[int, int]]]) -> CalibrationMap:
+        """
+        ## Fit Calibration
 
-            average_trans_mat = sum(trans_mats) / len(trans_mats)
-        except IndexError:
-            raise Exception("Please check your lighting. There was an issue extracting facial features.")
+        Least squares calibration map over every recorded sample, replacing the average of
+        affine transforms over all triples of calibration points
+
+        Parameters
+        ----------
+        calibration_points : Sequence[Tuple[int, int]]
+            Known points displayed on screen
+        gaze_points : Sequence[Sequence[Tuple[int, int]]]
+            Gaze samples recorded for each calibration point
+
+        Returns
+        -------
+        CalibrationMap
+            Map from raw gaze to screen px
+        """
+        src = [sample for samples in gaze_points for sample in samples]
+        dst = [point for point, samples in zip(calibration_points, gaze_points) for _ in samples]
+
+        return fit_calibration(src, dst, model=self.calibration_model, ransac_threshold=self.ransac_threshold)
 
-        return average_trans_mat
-    
 if __name__ == "__main__":
     test_gaze = GazeOTS()
     test_gaze.track_gaze()
+    sample_seq = 0
     while True:
+        sample_seq = test_gaze.wait_for_sample(sample_seq)
         print(test_gaze.gaze_location, end="\r")
\ No newline at end of file
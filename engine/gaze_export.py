@@ -0,0 +1,387 @@
+from engine.gaze_stream import GazeSample
+
+from typing import Optional, Set, Tuple
+from multiprocessing import shared_memory
+import numpy as np
+import sys
+import time
+
+
+EXPORT_MAGIC = b"GAZESHM1"
+
+# 64 byte header, `head` counts the samples written so far and `open` is cleared when the
+# writer closes the export
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"),
+    ("capacity", "<u4"),
+    ("width", "<u4"),
+    ("height", "<u4"),
+    ("open", "<u4"),
+    ("head", "<u8"),
+    ("reserved", "u1", (32,)),
+])
+
+# One ring slot. `lock` is the slot's seqlock (odd while the writer is inside it) and `index`
+# is the position of the sample in the export, used by readers to spot a lapped slot
+RECORD_DTYPE = np.dtype([
+    ("lock", "<u8"),
+    ("index", "<u8"),
+    ("seq", "<u8"),
+    ("timestamp", "<f8"),
+    ("raw", "<f8", (2,)),
+    ("point", "<f8", (2,)),
+    ("face", "<i4", (4,)),
+    ("confidence", "<f8"),
+])
+
+
+# Exports created by this process, whose blocks the resource tracker has to keep
+_WRITERS: Set[str] = set()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # Readers must not unlink the block when they exit, which the resource tracker
+    # does for every attached block before Python 3.13
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    from multiprocessing import resource_tracker
+
+    memory = shared_memory.SharedMemory(name=name)
+    if memory.name not in _WRITERS:
+        resource_tracker.unregister(memory._name, "shared_memory")
+    return memory
+
+
+class _ExportLayout:
+    # Field views over a shared memory block, shared by the writer and the readers
+    def _map(self, memory: shared_memory.SharedMemory, capacity: int) -> None:
+        self.memory = memory
+        self.capacity = capacity
+        self.header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=memory.buf)
+        self.records = np.ndarray((capacity,), dtype=RECORD_DTYPE, buffer=memory.buf, offset=HEADER_DTYPE.itemsize)
+
+        self._head = self.header["head"]
+        self._locks = self.records["lock"]
+        self._index = self.records["index"]
+        self._seq = self.records["seq"]
+        self._timestamp = self.records["timestamp"]
+        self._raw = self.records["raw"]
+        self._point = self.records["point"]
+        self._face = self.records["face"]
+        self._confidence = self.records["confidence"]
+
+    def _unmap(self) -> None:
+        # Views into the buffer must be gone before the block can close
+        for name in ("header", "records", "_head", "_locks", "_index", "_seq", "_timestamp", "_raw", "_point",
+                     "_face", "_confidence"):
+            self.__dict__.pop(name, None)
+        self.memory.close()
+
+
+class GazeExport(_ExportLayout):
+    """
+    ## Gaze Export
+
+    Writes gaze samples into a named shared memory ring for other processes on the host, see
+    GazeReader. Every slot has its own seqlock, so a reader never waits for the writer and
+    only retries in the rare case that it read a slot while it was being rewritten. There
+    must be a single writer
+
+    Parameters
+    ----------
+    name : str
+        Shared memory block name. A stale block of the same name is replaced
+    capacity : int
+        Samples kept in the ring
+    screen_size : Tuple[int, int]
+        Screen width and height in px the gaze points refer to
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, name: str = "gaze", capacity: int = 1024, screen_size: Tuple[int, int] = (0, 0)) -> None:
+        if capacity < 1:
+            raise ValueError("Gaze export needs at least one slot")
+
+        size = HEADER_DTYPE.itemsize + capacity * RECORD_DTYPE.itemsize
+        try:
+            memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a writer that did not close
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        _WRITERS.add(memory.name)
+        self._map(memory, capacity)
+        self.records[:] = np.zeros(capacity, dtype=RECORD_DTYPE)
+        self.header[0] = (EXPORT_MAGIC, capacity, screen_size[0], screen_size[1], 1, 0, np.zeros(32, np.uint8))
+        self._written = 0
+        self._closed = False
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    def write(self, seq: int, timestamp: float, raw: Tuple[float, float], point: Tuple[float, float],
+              face: Optional[Tuple[int, int, int, int]] = None, confidence: Optional[float] = None) -> None:
+        """
+        ## Write
+
+        Publishes one sample. Called from the gaze thread
+
+        Parameters
+        ----------
+        seq : int
+            Sample sequence number of the gaze source
+        timestamp : float
+            Capture time (time.monotonic, comparable between processes)
+        raw : Tuple[float, float]
+            Gaze location before calibration
+        point : Tuple[float, float]
+            Calibrated gaze location in screen px
+        face : Optional[Tuple[int, int, int, int]]
+            Face box, written as -1s when None
+        confidence : Optional[float]
+            Face tracker confidence, written as nan when None
+        """
+        if self._closed:
+            return
+
+        index = self._written
+        slot = index % self.capacity
+
+        self._locks[slot] += 1
+        self._index[slot] = index
+        self._seq[slot] = seq
+        self._timestamp[slot] = timestamp
+        self._raw[slot] = raw
+        self._point[slot] = point
+        self._face[slot] = (-1, -1, -1, -1) if face is None else face
+        self._confidence[slot] = np.nan if confidence is None else confidence
+        self._locks[slot] += 1
+
+        # Readers find the newest sample through head, so it moves last
+        self._written = index + 1
+        self._head[0] = self._written
+
+    def write_sample(self, sample: GazeSample) -> None:
+        self.write(sample.seq, sample.timestamp, sample.raw, sample.point, sample.face, sample.confidence)
+
+    def close(self) -> None:
+        """
+        ## Close
+
+        Marks the export closed and removes the block. Attached readers keep their mapping
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self.header["open"] = 0
+        self._unmap()
+        self.memory.unlink()
+        _WRITERS.discard(self.memory.name)
+
+
+class GazeReader(_ExportLayout):
+    """
+    ## Gaze Reader
+
+    Reads a GazeExport from any process on the host. Reads are plain memory loads from the
+    shared block (no syscalls and no camera access), validated with the slot seqlock. Also a
+    gaze source for SingleWindowController (`gaze_location`, `gaze_sample`, `latest_sample`,
+    `wait_for_sample`, `sample_seq`, `stop`), so a second controller can share one camera
+
+    Parameters
+    ----------
+    name : str
+        Shared memory block name of the export
+    poll_interval : float
+        Sleep between checks in `wait_for_sample`
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, name: str = "gaze", poll_interval: float = 0.001) -> None:
+        memory = _attach(name)
+        header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=memory.buf)
+        if header["magic"][0] != EXPORT_MAGIC:
+            del header
+            memory.close()
+            raise ValueError(f"Shared memory block {name} is not a gaze export")
+        capacity = int(header["capacity"][0])
+        del header
+
+        self._map(memory, capacity)
+        self.screen_size = (int(self.header["width"][0]), int(self.header["height"][0]))
+        self.poll_interval = poll_interval
+        self._closed = False
+
+    @property
+    def live(self) -> bool:
+        # False once the writer closed the export
+        return not self._closed and bool(self.header["open"][0])
+
+    @property
+    def sample_seq(self) -> int:
+        # Samples exported so far
+        return int(self._head[0])
+
+    def latest(self, retries: int = 100) -> Optional[Tuple[int, float, float, float]]:
+        """
+        ## Latest
+
+        Newest sample as plain numbers, without building a GazeSample
+
+        Parameters
+        ----------
+        retries : int
+            Attempts before giving up on a slot the writer keeps rewriting
+
+        Returns
+        -------
+        Optional[Tuple[int, float, float, float]]
+            (seq, x, y, timestamp), None before the first sample
+        """
+        for _ in range(retries):
+            head = int(self._head[0])
+            if head == 0:
+                return None
+            slot = (head - 1) % self.capacity
+
+            before = int(self._locks[slot])
+            if before & 1:
+                continue
+            seq = int(self._seq[slot])
+            point_x, point_y = self._point[slot].tolist()
+            timestamp = float(self._timestamp[slot])
+            if int(self._locks[slot]) == before and int(self._index[slot]) == head - 1:
+                return (seq, point_x, point_y, timestamp)
+        return None
+
+    def last(self, count: int, retries: int = 100) -> np.ndarray:
+        """
+        ## Last
+
+        Copy of the newest samples, oldest first. Slots rewritten during the copy are read again
+
+        Parameters
+        ----------
+        count : int
+            Samples wanted, at most the ring capacity
+        retries : int
+            Attempts before returning only the consistent samples
+
+        Returns
+        -------
+        np.ndarray
+            RECORD_DTYPE records
+        """
+        for _ in range(retries):
+            head = int(self._head[0])
+            count = min(count, head, self.capacity)
+            slots = np.arange(head - count, head) % self.capacity
+
+            before = self._locks[slots]
+            records = self.records[slots]
+            valid = (before == self._locks[slots]) & (before % 2 == 0)
+            valid &= records["index"] == np.arange(head - count, head)
+            if valid.all():
+                return records
+        return records[valid]
+
+    @property
+    def latest_sample(self) -> GazeSample:
+        for _ in range(100):
+            head = int(self._head[0])
+            if head == 0:
+                break
+            slot = (head - 1) % self.capacity
+
+            before = int(self._locks[slot])
+            if before & 1:
+                continue
+            record = self.records[slot].copy()
+            if int(self._locks[slot]) == before and int(record["index"]) == head - 1:
+                face = tuple(record["face"].tolist())
+                confidence = float(record["confidence"])
+                return GazeSample(
+                    int(record["seq"]), float(record["timestamp"]), tuple(record["raw"].tolist()),
+                    tuple(record["point"].tolist()), None if face[0] < 0 else face,
+                    None if np.isnan(confidence) else confidence,
+                )
+        return GazeSample(0, 0.0, (0.0, 0.0), (0.0, 0.0))
+
+    @property
+    def gaze_sample(self) -> Tuple[float, float, float]:
+        latest = self.latest()
+        return (0.0, 0.0, 0.0) if latest is None else latest[1:]
+
+    @property
+    def gaze_location(self) -> Tuple[int, int]:
+        gaze_x, gaze_y, _ = self.gaze_sample
+        return (int(gaze_x), int(gaze_y))
+
+    def wait_for_sample(self, after_seq: int, timeout: Optional[float] = None) -> int:
+        """
+        ## Wait For Sample
+
+        Polls until more than `after_seq` samples were exported, the writer closes or the timeout passes
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._closed:
+            head = int(self._head[0])
+            if head > after_seq or not self.header["open"][0]:
+                return head
+            if deadline is not None and time.monotonic() >= deadline:
+                return head
+            time.sleep(self.poll_interval)
+        return after_seq
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._unmap()
+
+    def stop(self) -> None:
+        self.close()
+
+    def __enter__(self) -> "GazeReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print gaze samples exported by another process")
+    parser.add_argument("name", nargs="?", default="gaze", help="Shared memory name of the export")
+    parser.add_argument("--last", type=int, default=0, help="Print the newest N samples and exit")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to follow the export")
+    args = parser.parse_args()
+
+    with GazeReader(args.name) as reader:
+        print(f"Gaze export {args.name}: {reader.capacity} slots, screen {reader.screen_size[0]}x{reader.screen_size[1]}")
+        if args.last:
+            for record in reader.last(args.last):
+                print(f"{record['seq']:8d} {record['timestamp']:.4f} ({record['point'][0]:7.1f}, {record['point'][1]:7.1f})")
+            return
+
+        start = time.monotonic()
+        seq = reader.sample_seq
+        while reader.live and time.monotonic() - start < args.duration:
+            seq = reader.wait_for_sample(seq, timeout=0.5)
+            latest = reader.latest()
+            if latest is not None:
+                print(f"{latest[0]:8d} ({latest[1]:7.1f}, {latest[2]:7.1f}) {1000 * (time.monotonic() - latest[3]):5.1f} ms old")
+
+
+if __name__ == "__main__":
+    main()
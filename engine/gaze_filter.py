@@ -0,0 +1,486 @@
+from typing import Optional, Tuple, Union
+import numpy as np
+
+
+class ConstantVelocityFilter:
+    """
+    ## Constant Velocity Filter
+
+    2-D constant velocity Kalman filter for gaze samples. The x and y axes are independent
+    and share the same noise model, so the filter runs as two 2 x 2 problems with a single
+    shared covariance. All state lives in preallocated buffers that are updated in place
+
+    When the sample interval is stable the gain converges, and the filter switches to a
+    steady-state fast path that skips the covariance update entirely
+
+    Parameters
+    ----------
+    measurement_var : float
+        Gaze measurement noise variance (px^2)
+    process_var : float
+        White noise acceleration variance
+    initial_var : float
+        Initial position and velocity variance
+    dt_tolerance : float
+        Relative change in sample interval still treated as stable
+    gain_tolerance : float
+        Gain change below which the filter is considered converged
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, measurement_var: float = 10.0, process_var: float = 0.1, initial_var: float = 1000.0,
+                 dt_tolerance: float = 0.05, gain_tolerance: float = 1e-6) -> None:
+        self.measurement_var = measurement_var
+        self.process_var = process_var
+        self.initial_var = initial_var
+        self.dt_tolerance = dt_tolerance
+        self.gain_tolerance = gain_tolerance
+
+        # State [x, vx, y, vy], covariance shared by both axes, gain [position, velocity]
+        self.x = np.zeros(4)
+        self.P = np.zeros((2, 2))
+        self.K = np.zeros(2)
+
+        self.position = self.x[0::2]
+        self.velocity = self.x[1::2]
+
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        ## Reset
+
+        Returns the filter to its initial, uninformed state
+        """
+        self.x.fill(0.0)
+        self.P[:] = ((self.initial_var, 0.0), (0.0, self.initial_var))
+        self.K.fill(0.0)
+
+        self.last_time: Optional[float] = None
+        self.steady = False
+        self._steady_dt = 0.0
+        self._k0 = self._k1 = 0.0
+
+    def step(self, measurement: Tuple[float, float], timestamp: float) -> np.ndarray:
+        """
+        ## Step
+
+        Predicts to `timestamp` and updates with one gaze measurement
+
+        Parameters
+        ----------
+        measurement : Tuple[float, float]
+            Measured gaze location in px
+        timestamp : float
+            Sample time in seconds
+
+        Returns
+        -------
+        np.ndarray
+            State [x, vx, y, vy] (the filter's own buffer, not a copy)
+        """
+        x = self.x
+        zx, zy = float(measurement[0]), float(measurement[1])
+
+        if self.last_time is None:
+            dt = 0.0
+        else:
+            dt = timestamp - self.last_time
+        self.last_time = timestamp
+
+        # Steady state only holds while the sample interval stays put
+        if self.steady and abs(dt - self._steady_dt) > self.dt_tolerance * self._steady_dt:
+            self.steady = False
+
+        if self.steady:
+            k0, k1 = self._k0, self._k1
+        else:
+            k0, k1 = self.__update_covariance(dt)
+
+        # Predict and correct both axes
+        px = x[0] + dt * x[1]
+        py = x[2] + dt * x[3]
+        innov_x = zx - px
+        innov_y = zy - py
+        x[0] = px + k0 * innov_x
+        x[1] += k1 * innov_x
+        x[2] = py + k0 * innov_y
+        x[3] += k1 * innov_y
+
+        return x
+
+    def __update_covariance(self, dt: float) -> Tuple[float, float]:
+        P = self.P
+        a, b, c = P[0, 0], P[0, 1], P[1, 1]
+
+        if dt > 0.0:
+            # P = F P F^T + Q with discrete white noise acceleration
+            q = self.process_var
+            dt2 = dt * dt
+            a = a + 2.0 * dt * b + dt2 * c + q * dt2 * dt2 / 4.0
+            b = b + dt * c + q * dt2 * dt / 2.0
+            c = c + q * dt2
+
+        s = a + self.measurement_var
+        k0 = a / s
+        k1 = b / s
+
+        # P = (I - K H) P
+        P[0, 0] = (1.0 - k0) * a
+        P[0, 1] = P[1, 0] = (1.0 - k0) * b
+        P[1, 1] = c - k1 * b
+
+        converged = (dt > 0.0 and abs(k0 - self.K[0]) < self.gain_tolerance
+                     and abs(k1 - self.K[1]) < self.gain_tolerance)
+        self.K[0], self.K[1] = k0, k1
+        self._k0, self._k1 = k0, k1
+
+        if converged:
+            self.steady = True
+            self._steady_dt = dt
+
+        return k0, k1
+
+    def filter_trace(self, timestamps: np.ndarray, measurements: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        ## Filter Trace
+
+        Filters a whole recorded trace starting from the initial state, in one vectorized call.
+        The gains only depend on the timestamps, so they are computed first (in blocks while the
+        filter is in steady state). Each sample is then an affine map of the previous state, and
+        the maps are combined with a parallel prefix scan instead of a per-sample loop. Several
+        traces sharing timestamps can be filtered together by stacking them along the middle axes
+
+        Parameters
+        ----------
+        timestamps : np.ndarray
+            (T,) sample times in seconds
+        measurements : np.ndarray
+            (T, ..., 2) gaze measurements in px
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray]
+            Filtered positions and velocities, both shaped like `measurements`
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        measurements = np.asarray(measurements, dtype=np.float64)
+        if len(timestamps) != len(measurements):
+            raise ValueError("timestamps and measurements must have the same length")
+
+        n = len(timestamps)
+        dts = np.diff(timestamps, prepend=timestamps[:1])
+        gains = self.__gain_sequence(dts)
+
+        # Sample k maps the previous state s to M_k s + K_k z_k, with M_k = (I - K_k H) F_k
+        k0, k1 = gains[:, 0], gains[:, 1]
+        m00 = 1.0 - k0
+        m01 = m00 * dts
+        m10 = -k1
+        m11 = 1.0 - k1 * dts
+
+        # Offsets per column (every axis of every stacked trace), state [position, velocity]
+        z = measurements.reshape(n, -1)
+        pos = k0[:, None] * z
+        vel = k1[:, None] * z
+
+        # Inclusive scan: afterwards (pos[k], vel[k]) is the state after sample k starting from zero
+        step = 1
+        while step < n:
+            a00, a01, a10, a11 = m00[step:, None], m01[step:, None], m10[step:, None], m11[step:, None]
+            prev_pos, prev_vel = pos[:-step].copy(), vel[:-step]
+            pos[step:] += a00 * prev_pos + a01 * prev_vel
+            vel[step:] += a10 * prev_pos + a11 * prev_vel
+
+            b00, b01, b10, b11 = m00[:-step], m01[:-step], m10[:-step], m11[:-step]
+            m00[step:], m01[step:], m10[step:], m11[step:] = (
+                m00[step:] * b00 + m01[step:] * b10, m00[step:] * b01 + m01[step:] * b11,
+                m10[step:] * b00 + m11[step:] * b10, m10[step:] * b01 + m11[step:] * b11,
+            )
+            step *= 2
+
+        positions = pos.reshape(measurements.shape)
+        velocities = vel.reshape(measurements.shape)
+
+        # Leave the filter in the state of the last sample so it can continue live
+        if measurements.ndim == 2 and n:
+            self.x[0::2] = positions[-1]
+            self.x[1::2] = velocities[-1]
+            self.last_time = float(timestamps[-1])
+
+        return positions, velocities
+
+    def __gain_sequence(self, dts: np.ndarray) -> np.ndarray:
+        self.reset()
+        gains = np.empty((len(dts), 2))
+
+        i = 0
+        while i < len(dts):
+            if self.steady:
+                # Fill the whole run of stable sample intervals at once
+                unstable = np.flatnonzero(np.abs(dts[i:] - self._steady_dt) > self.dt_tolerance * self._steady_dt)
+                end = i + unstable[0] if len(unstable) else len(dts)
+                gains[i:end] = self._k0, self._k1
+                i = end
+                self.steady = False
+                continue
+
+            gains[i] = self.__update_covariance(float(dts[i]))
+            i += 1
+
+        return gains
+
+
+class OneEuroFilter:
+    """
+    ## One Euro Filter
+
+    Adaptive low-pass filter for gaze samples (Casiez et al., CHI 2012). The cutoff frequency
+    rises with gaze speed, so a still gaze is smoothed heavily (low jitter) while fast head
+    movements pass with little lag. Both axes share the cutoff, taken from the 2-D speed
+
+    Parameters
+    ----------
+    min_cutoff : float
+        Cutoff frequency in Hz when the gaze is still. Lower means less jitter
+    beta : float
+        Cutoff increase per px/s of gaze speed. Higher means less lag
+    d_cutoff : float
+        Cutoff frequency in Hz of the speed estimate
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, min_cutoff: float = 1.0, beta: float = 0.007, d_cutoff: float = 1.0) -> None:
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+
+        # Filtered [x, y] and speed [vx, vy] in px and px/s
+        self.position = np.zeros(2)
+        self.velocity = np.zeros(2)
+
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        ## Reset
+
+        Forgets the previous samples
+        """
+        self.position.fill(0.0)
+        self.velocity.fill(0.0)
+        self.last_time: Optional[float] = None
+
+    @staticmethod
+    def _alpha(cutoff: float, dt: float) -> float:
+        tau = 1.0 / (2.0 * np.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def step(self, measurement: Tuple[float, float], timestamp: float) -> np.ndarray:
+        """
+        ## Step
+
+        Filters one gaze measurement
+
+        Parameters
+        ----------
+        measurement : Tuple[float, float]
+            Measured gaze location in px
+        timestamp : float
+            Sample time in seconds
+
+        Returns
+        -------
+        np.ndarray
+            Filtered [x, y] (the filter's own buffer, not a copy)
+        """
+        zx, zy = float(measurement[0]), float(measurement[1])
+        position, velocity = self.position, self.velocity
+
+        if self.last_time is None:
+            position[0], position[1] = zx, zy
+            self.last_time = timestamp
+            return position
+
+        dt = timestamp - self.last_time
+        if dt <= 0.0:
+            return position
+        self.last_time = timestamp
+
+        # Smoothed speed sets the cutoff of the position filter
+        a = self._alpha(self.d_cutoff, dt)
+        velocity[0] += a * ((zx - position[0]) / dt - velocity[0])
+        velocity[1] += a * ((zy - position[1]) / dt - velocity[1])
+        speed = float(np.hypot(velocity[0], velocity[1]))
+
+        a = self._alpha(self.min_cutoff + self.beta * speed, dt)
+        position[0] += a * (zx - position[0])
+        position[1] += a * (zy - position[1])
+        return position
+
+
+# Smoothers the latency compensator can run on
+PREDICTION_FILTERS = ("kalman", "one_euro")
+
+
+class LatencyCompensator:
+    """
+    ## Latency Compensator
+
+    Extrapolates the gaze to the time the resulting selection reaches the screen. Each sample
+    is filtered at its capture time, and the filtered gaze is moved along the estimated gaze
+    velocity by the measured sample age (capture to now) plus the expected display delay
+
+    Parameters
+    ----------
+    smoother : str
+        "kalman" (ConstantVelocityFilter) or "one_euro" (OneEuroFilter)
+    display_latency : float
+        Expected seconds from selection to the selection being drawn, e.g. one UI frame
+    max_horizon : float
+        Longest extrapolation in seconds, guards against stale samples
+    latency_smoothing : float
+        Weight of each new sample age in the running `latency` estimate (for reporting)
+    gaze_filter : Optional[Union[ConstantVelocityFilter, OneEuroFilter]]
+        Filter to use instead of a default one of the `smoother` kind
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, smoother: str = "kalman", display_latency: float = 1 / 60, max_horizon: float = 0.15,
+                 latency_smoothing: float = 0.1,
+                 gaze_filter: Optional[Union[ConstantVelocityFilter, OneEuroFilter]] = None) -> None:
+        if smoother not in PREDICTION_FILTERS:
+            raise ValueError(f"Unknown smoother {smoother}")
+
+        if gaze_filter is None:
+            if smoother == "kalman":
+                # Head driven gaze accelerates at thousands of px/s^2, a stiffer model would lag
+                gaze_filter = ConstantVelocityFilter(measurement_var=10.0, process_var=1e6, initial_var=1000.0)
+            else:
+                gaze_filter = OneEuroFilter()
+
+        self.smoother = smoother
+        self.filter = gaze_filter
+        self.display_latency = display_latency
+        self.max_horizon = max_horizon
+        self.latency_smoothing = latency_smoothing
+
+        # Running mean of the sample age when it is used, and the last extrapolation in seconds
+        self.latency: Optional[float] = None
+        self.horizon = 0.0
+
+    @property
+    def position(self) -> np.ndarray:
+        return self.filter.position
+
+    @property
+    def velocity(self) -> np.ndarray:
+        return self.filter.velocity
+
+    def reset(self) -> None:
+        self.filter.reset()
+        self.latency = None
+        self.horizon = 0.0
+
+    def step(self, measurement: Tuple[float, float], sample_time: float, now: float) -> Tuple[float, float]:
+        """
+        ## Step
+
+        Filters a gaze sample and predicts where the gaze will be when it is displayed
+
+        Parameters
+        ----------
+        measurement : Tuple[float, float]
+            Calibrated gaze location in px
+        sample_time : float
+            Capture time of the sample's frame (time.monotonic)
+        now : float
+            Current time (time.monotonic)
+
+        Returns
+        -------
+        Tuple[float, float]
+            Predicted gaze location in px
+        """
+        self.filter.step(measurement, sample_time)
+
+        age = max(now - sample_time, 0.0)
+        if self.latency is None:
+            self.latency = age
+        else:
+            self.latency += self.latency_smoothing * (age - self.latency)
+
+        self.horizon = min(age + self.display_latency, self.max_horizon)
+        position, velocity = self.filter.position, self.filter.velocity
+        return (position[0] + velocity[0] * self.horizon, position[1] + velocity[1] * self.horizon)
+
+
+def compensation_error(smoother: Optional[str], latency: float = 0.08, rate: float = 30.0, noise: float = 3.0,
+                       display_latency: float = 1 / 60, duration: float = 20.0, seed: int = 0) -> float:
+    """
+    ## Compensation Error
+
+    Mean distance (px) between the gaze used for selection and the true gaze when the
+    selection is displayed, for a simulated gaze sweeping a 1000 x 600 px ellipse every 2 s
+
+    Parameters
+    ----------
+    smoother : Optional[str]
+        "kalman" or "one_euro" for a LatencyCompensator, None to use the raw samples
+    latency : float
+        Seconds from capture to selection
+    rate : float
+        Gaze samples per second
+    noise : float
+        Standard deviation of the measurement noise in px
+    display_latency : float
+        Seconds from selection to display
+    duration : float
+        Simulated seconds, the first 2 s are not scored
+    seed : int
+        Noise seed
+
+    Returns
+    -------
+    float
+        Mean error in px
+    """
+    rng = np.random.default_rng(seed)
+    compensator = None if smoother is None else LatencyCompensator(smoother, display_latency=display_latency)
+
+    def truth(t: float) -> Tuple[float, float]:
+        return (960 + 500 * np.sin(np.pi * t), 540 + 300 * np.cos(np.pi * t))
+
+    errors = []
+    for index in range(int(duration * rate)):
+        sample_time = index / rate
+        now = sample_time + latency
+        measurement = np.array(truth(sample_time)) + rng.normal(0.0, noise, 2)
+        used = measurement if compensator is None else compensator.step(measurement, sample_time, now)
+        if sample_time >= 2.0:
+            errors.append(np.hypot(*(np.array(used) - truth(now + display_latency))))
+    return float(np.mean(errors))
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Latency compensation error on a simulated gaze sweep")
+    parser.add_argument("--latency", type=float, default=0.08, help="Seconds from capture to selection")
+    parser.add_argument("--rate", type=float, default=30.0, help="Gaze samples per second")
+    parser.add_argument("--noise", type=float, default=3.0, help="Measurement noise in px")
+    args = parser.parse_args()
+
+    for smoother in (None,) + PREDICTION_FILTERS:
+        error = compensation_error(smoother, args.latency, args.rate, args.noise)
+        print(f"{smoother or 'none':>9}: {error:6.1f} px mean error")
+
+
+if __name__ == "__main__":
+    main()
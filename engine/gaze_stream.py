@@ -0,0 +1,165 @@
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+from collections import deque
+import threading
+import asyncio
+
+
+@dataclass(frozen=True)
+class GazeSample:
+    """
+    ## Gaze Sample
+
+    One gaze measurement
+
+    Parameters
+    ----------
+    seq : int
+        Sample sequence number
+    timestamp : float
+        Capture time of the frame (time.monotonic)
+    raw : Tuple[float, float]
+        Gaze location before calibration
+    point : Tuple[float, float]
+        Calibrated gaze location in screen px
+    face : Optional[Tuple[int, int, int, int]]
+        Face box (left, top, right, bottom) in the mirrored frame, None when the source supplied landmarks
+    confidence : Optional[float]
+        Face tracker confidence (inf right after a full detection), None when the source supplied landmarks
+    """
+    seq: int
+    timestamp: float
+    raw: Tuple[float, float]
+    point: Tuple[float, float]
+    face: Optional[Tuple[int, int, int, int]] = None
+    confidence: Optional[float] = None
+
+
+# What a stream does with a new sample when its buffer is full
+DROP_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class GazeStream:
+    """
+    ## Gaze Stream
+
+    Async iterator over gaze samples, fed from the gaze thread. Samples wait in a bounded
+    buffer until the consumer takes them. When the buffer is full, "drop_oldest" replaces
+    the oldest waiting sample, "drop_newest" discards the new sample and "block" holds the
+    gaze thread until the consumer catches up (which also delays every other consumer)
+
+    Parameters
+    ----------
+    loop : asyncio.AbstractEventLoop
+        Loop of the consumer
+    maxsize : int
+        Samples buffered for the consumer
+    policy : str
+        "drop_oldest", "drop_newest" or "block"
+    on_close : Optional[Callable[[GazeStream], None]]
+        Called once when the stream closes, e.g. to unsubscribe it
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int = 1, policy: str = "drop_oldest",
+                 on_close: Optional[Callable[["GazeStream"], None]] = None) -> None:
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy {policy}")
+        if maxsize < 1:
+            raise ValueError("Stream buffer needs room for at least one sample")
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+
+        self._loop = loop
+        self._buffer: deque = deque()
+        self._cond = threading.Condition()
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._on_close = on_close
+
+    def publish(self, sample: GazeSample) -> None:
+        """
+        ## Publish
+
+        Offers a sample to the consumer. Called from the gaze thread
+
+        Parameters
+        ----------
+        sample : GazeSample
+            New sample
+        """
+        with self._cond:
+            if self._closed:
+                return
+
+            if len(self._buffer) >= self.maxsize:
+                if self.policy == "drop_newest":
+                    self.dropped += 1
+                    return
+                if self.policy == "drop_oldest":
+                    self._buffer.popleft()
+                    self.dropped += 1
+                else:
+                    self._cond.wait_for(lambda: len(self._buffer) < self.maxsize or self._closed)
+                    if self._closed:
+                        return
+
+            self._buffer.append(sample)
+
+        self.__wake()
+
+    def close(self) -> None:
+        """
+        ## Close
+
+        Ends the stream. Samples already buffered are still delivered
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+
+        self.__wake()
+        if self._on_close is not None:
+            self._on_close(self)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __wake(self) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # Consumer loop is gone
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
+
+    def __aiter__(self) -> "GazeStream":
+        return self
+
+    async def __anext__(self) -> GazeSample:
+        while True:
+            with self._cond:
+                if self._buffer:
+                    sample = self._buffer.popleft()
+                    self._cond.notify_all()
+                    return sample
+                if self._closed:
+                    raise StopAsyncIteration
+                # Cleared under the lock, so a publish after this point sets it again
+                self._ready.clear()
+
+            await self._ready.wait()
+
+    async def __aenter__(self) -> "GazeStream":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,419 @@
+from engine.agent_selection import AgentSelect
+from engine.gaze_stream import GazeSample
+from engine.selection_debounce import SelectionDebouncer
+
+from typing import Any, Dict, Optional, Sequence, Tuple
+import numpy as np
+import threading
+import struct
+import json
+import time
+import os
+
+
+# File layout: magic, header length (uint32), JSON header padded to HEADER_ALIGN, then fixed width records
+TRACE_MAGIC = b"GAZETRC1"
+HEADER_ALIGN = 64
+
+# Version 1 stored agent positions as float32, version 2 as float64
+TRACE_VERSION = 2
+
+
+def trace_dtype(num_agents: int, version: int = TRACE_VERSION) -> np.dtype:
+    """
+    ## Trace Dtype
+
+    Record layout of a trace with `num_agents` agents (60 + 16 * num_agents bytes). The
+    calibrated gaze and the agent positions keep full precision so replayed selections
+    match the recorded ones. Version 1 traces have float32 positions
+
+    Fields
+    ------
+    seq : gaze sample sequence number
+    timestamp : frame capture time (time.monotonic)
+    selected_at : time the selection ran (time.monotonic)
+    raw : gaze in webcam reference frame, before calibration
+    point : calibrated gaze in screen px
+    face : face box (left, top, right, bottom), -1 when unknown
+    confidence : face tracker confidence, NaN when unknown
+    choice : raw agent choice of AgentSelect
+    selected : debounced selection, -1 before the first selection
+    positions : agent positions seen by AgentSelect, rows follow the header's agent_ids
+    """
+    return np.dtype([
+        ("seq", "<u4"),
+        ("timestamp", "<f8"),
+        ("selected_at", "<f8"),
+        ("raw", "<f4", (2,)),
+        ("point", "<f8", (2,)),
+        ("face", "<i2", (4,)),
+        ("confidence", "<f4"),
+        ("choice", "<i2"),
+        ("selected", "<i2"),
+        ("positions", "<f8" if version >= 2 else "<f4", (num_agents, 2)),
+    ])
+
+
+class TraceRecorder:
+    """
+    ## Trace Recorder
+
+    Appends gaze and selection records to a binary trace file. Records collect in a
+    preallocated chunk that is written out whenever it fills, so recording costs one array
+    write per `chunk` samples. Appending to an existing trace requires the same agents
+
+    Parameters
+    ----------
+    path : str
+        Trace file, created if missing
+    agent_ids : Sequence[int]
+        Agents whose positions are recorded
+    chunk : int
+        Records buffered between writes
+    metadata : Optional[Dict[str, Any]]
+        Extra JSON data stored in the header of a new file
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, path: str, agent_ids: Sequence[int], chunk: int = 256,
+                 metadata: Optional[Dict[str, Any]] = None) -> None:
+        self.path = path
+        self.agent_ids = [int(agent_id) for agent_id in agent_ids]
+        self.dtype = trace_dtype(len(self.agent_ids))
+        self.recorded = 0
+
+        self._buffer = np.zeros(chunk, dtype=self.dtype)
+        self._count = 0
+        self._lock = threading.Lock()
+
+        if os.path.exists(path) and os.path.getsize(path):
+            header, offset = read_header(path)
+            if header["agent_ids"] != self.agent_ids:
+                raise ValueError(f"{path} records agents {header['agent_ids']}, not {self.agent_ids}")
+            if header.get("version", 1) != TRACE_VERSION:
+                raise ValueError(f"{path} is a version {header.get('version', 1)} trace, append needs version {TRACE_VERSION}")
+
+            # Drop a partial record left by an interrupted session before appending
+            count = (os.path.getsize(path) - offset) // self.dtype.itemsize
+            os.truncate(path, offset + count * self.dtype.itemsize)
+            self._file = open(path, "ab")
+        else:
+            self._file = open(path, "wb")
+            self._file.write(_encode_header({
+                "version": TRACE_VERSION,
+                "agent_ids": self.agent_ids,
+                "dtype": self.dtype.descr,
+                "clock": "monotonic",
+                "created": time.time(),
+                **(metadata or {}),
+            }))
+
+    def record(self, sample: GazeSample, choice: int, selected: Optional[int], selected_at: float,
+               positions: Optional[np.ndarray] = None) -> None:
+        """
+        ## Record
+
+        Adds one selection record
+
+        Parameters
+        ----------
+        sample : GazeSample
+            Gaze sample the selection was made on
+        choice : int
+            Raw agent choice
+        selected : Optional[int]
+            Debounced selection
+        selected_at : float
+            Time the selection ran (time.monotonic)
+        positions : Optional[np.ndarray]
+            (num_agents, 2) agent positions the selection was made on, rows follow agent_ids
+            (see AgentSelect.selection_positions)
+        """
+        with self._lock:
+            row = self._buffer[self._count]
+            row["seq"] = sample.seq
+            row["timestamp"] = sample.timestamp
+            row["selected_at"] = selected_at
+            row["raw"] = sample.raw
+            row["point"] = sample.point
+            row["face"] = sample.face if sample.face is not None else (-1, -1, -1, -1)
+            row["confidence"] = sample.confidence if sample.confidence is not None else np.nan
+            row["choice"] = choice
+            row["selected"] = selected if selected is not None else -1
+            if positions is not None:
+                row["positions"] = positions
+
+            self._count += 1
+            self.recorded += 1
+            if self._count == len(self._buffer):
+                self.__write()
+
+    def flush(self) -> None:
+        with self._lock:
+            self.__write()
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            self.__write()
+            self._file.close()
+
+    def __write(self) -> None:
+        if self._count:
+            self._file.write(self._buffer[: self._count].tobytes())
+            self._count = 0
+
+    def __enter__(self) -> "TraceRecorder":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _encode_header(header: Dict[str, Any]) -> bytes:
+    data = json.dumps(header).encode("utf-8")
+    size = len(TRACE_MAGIC) + 4 + len(data)
+    padding = -size % HEADER_ALIGN
+    return TRACE_MAGIC + struct.pack("<I", len(data) + padding) + data + b" " * padding
+
+
+def read_header(path: str) -> Tuple[Dict[str, Any], int]:
+    """
+    ## Read Header
+
+    Header of a trace file
+
+    Parameters
+    ----------
+    path : str
+        Trace file
+
+    Returns
+    -------
+    Tuple[Dict[str, Any], int]
+        Header and the byte offset of the first record
+    """
+    with open(path, "rb") as infile:
+        magic = infile.read(len(TRACE_MAGIC))
+        if magic != TRACE_MAGIC:
+            raise ValueError(f"{path} is not a gaze trace")
+        (length,) = struct.unpack("<I", infile.read(4))
+        header = json.loads(infile.read(length).decode("utf-8"))
+    return header, len(TRACE_MAGIC) + 4 + length
+
+
+def read_trace(path: str) -> Tuple[Dict[str, Any], np.ndarray]:
+    """
+    ## Read Trace
+
+    Memory maps the records of a trace file. A partial record at the end (e.g. from a
+    crash while writing) is ignored
+
+    Parameters
+    ----------
+    path : str
+        Trace file
+
+    Returns
+    -------
+    Tuple[Dict[str, Any], np.ndarray]
+        Header and read-only record array
+    """
+    header, offset = read_header(path)
+    dtype = trace_dtype(len(header["agent_ids"]), header.get("version", 1))
+    count = (os.path.getsize(path) - offset) // dtype.itemsize
+    if count == 0:
+        return header, np.zeros(0, dtype=dtype)
+    return header, np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+
+def replay_selection(records: np.ndarray, selector: AgentSelect,
+                     debouncer: Optional[SelectionDebouncer] = None) -> np.ndarray:
+    """
+    ## Replay Selection
+
+    Feeds recorded samples through an agent selector (and debouncer) as fast as possible.
+    Agent positions, sample times and selection times all come from the trace, so a replay
+    gives the same result every time and can be compared with the recorded selections
+
+    Parameters
+    ----------
+    records : np.ndarray
+        Records from `read_trace`. The selector must cover the trace's agents in header order
+    selector : AgentSelect
+        Selector to test, e.g. with a different mode or compensation
+    debouncer : Optional[SelectionDebouncer]
+        Debouncer to test. Defaults to SelectionDebouncer()
+
+    Returns
+    -------
+    np.ndarray
+        (N, 2) raw choice and debounced selection (-1 for none) per record
+    """
+    if debouncer is None:
+        debouncer = SelectionDebouncer()
+    if len(records) and records.dtype["positions"].shape[0] != len(selector.agent_ids):
+        raise ValueError("Selector agents do not match the trace")
+
+    # Fields are read once as whole columns, memmap access per record would dominate
+    positions = np.asarray(records["positions"], dtype=np.float64)
+    points = np.asarray(records["point"], dtype=np.float64).tolist()
+    timestamps = records["timestamp"].tolist()
+    selected_at = records["selected_at"].tolist()
+    moved = np.ones(len(records), dtype=bool)
+    moved[1:] = np.any(positions[1:] != positions[:-1], axis=(1, 2))
+
+    distance = selector.distance if selector.selection_method == "position" else None
+    result = np.full((len(records), 2), -1, dtype=np.int64)
+    for i in range(len(records)):
+        if moved[i]:
+            selector.set_positions(positions[i])
+        choice = selector.getAgent(points[i], timestamps[i], selected_at[i])
+        debouncer.update(choice, selected_at[i], distance)
+        result[i, 0] = choice
+        result[i, 1] = debouncer.current if debouncer.current is not None else -1
+
+    return result
+
+
+class TraceGaze:
+    """
+    ## Trace Gaze
+
+    Gaze source that plays a recorded trace back on its own thread, for running the
+    controller without a camera. Has the parts of the GazeOTS interface used for agent
+    selection (`gaze_location`, `gaze_sample`, `latest_sample`, `wait_for_sample`,
+    `sample_seq`, `stop`)
+
+    Parameters
+    ----------
+    path : str
+        Trace file
+    speed : Optional[float]
+        Playback speed relative to the recording, None plays as fast as possible
+    loop : bool
+        Start over at the end of the trace
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, path: str, speed: Optional[float] = 1.0, loop: bool = False) -> None:
+        self.header, self.records = read_trace(path)
+        self.speed = speed
+        self.loop = loop
+
+        self.sample_seq = 0
+        self._sample = GazeSample(0, 0.0, (0.0, 0.0), (0.0, 0.0))
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="trace-replay", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        records = self.records
+        if not len(records):
+            self.stop()
+            return
+
+        while self._running:
+            start = time.monotonic()
+            first = float(records["timestamp"][0])
+
+            for record in records:
+                if not self._running:
+                    return
+
+                # Samples are stamped with the replay clock, so sample ages stay realistic
+                offset = float(record["timestamp"]) - first
+                if self.speed:
+                    delay = start + offset / self.speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                timestamp = start + offset / self.speed if self.speed else time.monotonic()
+
+                face = tuple(int(v) for v in record["face"]) if record["face"][0] >= 0 else None
+                confidence = float(record["confidence"]) if not np.isnan(record["confidence"]) else None
+                with self._cond:
+                    self.sample_seq += 1
+                    self._sample = GazeSample(self.sample_seq, timestamp, tuple(record["raw"].tolist()),
+                                              tuple(record["point"].tolist()), face, confidence)
+                    self._cond.notify_all()
+
+            if not self.loop:
+                break
+
+        self.stop()
+
+    @property
+    def gaze_location(self) -> Tuple[float, float]:
+        with self._cond:
+            return self._sample.point
+
+    @property
+    def gaze_sample(self) -> Tuple[float, float, float]:
+        with self._cond:
+            return (self._sample.point[0], self._sample.point[1], self._sample.timestamp)
+
+    @property
+    def latest_sample(self) -> GazeSample:
+        with self._cond:
+            return self._sample
+
+    @property
+    def finished(self) -> bool:
+        return not self._running
+
+    def wait_for_sample(self, after_seq: int, timeout: Optional[float] = None) -> int:
+        with self._cond:
+            self._cond.wait_for(lambda: self.sample_seq > after_seq or not self._running, timeout=timeout)
+            return self.sample_seq
+
+    def stop(self) -> None:
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+
+def main() -> None:
+    import argparse
+
+    from engine.agent_state import AgentStore
+    from engine.gaze_filter import LatencyCompensator
+
+    parser = argparse.ArgumentParser(description="Replay a gaze trace through AgentSelect")
+    parser.add_argument("trace", help="Trace file recorded with SingleWindowController(record_trace=...)")
+    parser.add_argument("--mode", default="position", choices=("position", "velocity"))
+    parser.add_argument("--prediction", default=None, choices=("kalman", "one_euro"))
+    args = parser.parse_args()
+
+    header, records = read_trace(args.trace)
+    if not len(records):
+        raise Exception(f"{args.trace} has no records.")
+
+    agents = AgentStore(len(header["agent_ids"]))
+    for agent_id, position in zip(header["agent_ids"], records["positions"][0]):
+        agents.add(agent_id, position=position)
+    compensation = LatencyCompensator(args.prediction) if args.prediction else None
+    selector = AgentSelect(agents, args.mode, agent_ids=header["agent_ids"], compensation=compensation)
+
+    start = time.perf_counter()
+    result = replay_selection(records, selector)
+    elapsed = time.perf_counter() - start
+
+    duration = float(records["timestamp"][-1] - records["timestamp"][0])
+    print(f"{len(records)} records ({duration:.0f} s of gaze) replayed in {elapsed:.2f} s")
+    print(f"Raw choice matches recording: {np.mean(result[:, 0] == records['choice']):.1%}")
+    print(f"Selection matches recording: {np.mean(result[:, 1] == records['selected']):.1%}")
+    print(f"Selection changes: recorded {np.count_nonzero(np.diff(records['selected']))}, "
+          f"replayed {np.count_nonzero(np.diff(result[:, 1]))}")
+
+
+if __name__ == "__main__":
+    main()
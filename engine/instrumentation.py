@@ -0,0 +1,265 @@
+from typing import Dict, Optional
+import numpy as np
+import threading
+import logging
+import time
+import csv
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """
+    ## Latency Histogram
+
+    Rolling window of the most recent durations of one pipeline stage
+
+    Parameters
+    ----------
+    window : int
+        Number of recent samples the percentiles are taken over
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, window: int = 4096) -> None:
+        self.samples = np.zeros(window, dtype=np.float64)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self.samples[self.count % len(self.samples)] = seconds
+            self.count += 1
+            self.total += seconds
+
+    def summary(self) -> Dict[str, float]:
+        """
+        ## Summary
+
+        Percentiles over the window in ms, plus the all-time sample count and mean
+
+        Returns
+        -------
+        Dict[str, float]
+            count, mean, p50, p95, p99 and max
+        """
+        with self._lock:
+            count, total = self.count, self.total
+            window = self.samples[: min(count, len(self.samples))].copy()
+
+        if not count:
+            return {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+
+        p50, p95, p99 = np.percentile(window, (50, 95, 99)) * 1000
+        return {
+            "count": count,
+            "mean": total / count * 1000,
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+            "max": float(window.max() * 1000),
+        }
+
+
+class PipelineMetrics:
+    """
+    ## Pipeline Metrics
+
+    Latency histograms and counters for each stage between camera and screen. Disabled by
+    default, in which case the hooks only check a flag. Stages are timed with
+
+        start = metrics.clock()
+        ...
+        metrics.record("stage", start)
+
+    Parameters
+    ----------
+    enabled : bool
+        Start recording immediately
+    window : int
+        Samples kept per stage for the rolling percentiles
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, enabled: bool = False, window: int = 4096) -> None:
+        self.enabled = enabled
+        self.window = window
+
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.reset()
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+            self.started = time.perf_counter()
+
+    def clock(self) -> float:
+        """
+        ## Clock
+
+        Start time for `record`, 0 when disabled
+        """
+        return time.perf_counter() if self.enabled else 0.0
+
+    def record(self, stage: str, start: float) -> None:
+        """
+        ## Record
+
+        Adds the time since `start` (from `clock`) to a stage's histogram
+
+        Parameters
+        ----------
+        stage : str
+            Stage name
+        start : float
+            Value returned by `clock` when the stage began
+        """
+        if not self.enabled or not start:
+            return
+
+        elapsed = time.perf_counter() - start
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(stage, LatencyHistogram(self.window))
+        histogram.add(elapsed)
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        """
+        ## Count
+
+        Increments a counter such as dropped frames
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """
+        ## Snapshot
+
+        Current statistics of every stage and counter
+
+        Returns
+        -------
+        Dict[str, Dict[str, float]]
+            Per stage: count, rate (per second), mean, p50, p95, p99 and max (ms).
+            Per counter: count and rate
+        """
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        with self._lock:
+            histograms = dict(self.histograms)
+            counters = dict(self.counters)
+
+        stats = {}
+        for stage, histogram in sorted(histograms.items()):
+            summary = histogram.summary()
+            summary["rate"] = summary["count"] / elapsed
+            stats[stage] = summary
+        for counter, value in sorted(counters.items()):
+            stats[counter] = {"count": value, "rate": value / elapsed}
+        return stats
+
+    def report(self) -> str:
+        lines = [f"{'stage':<16}{'count':>9}{'rate/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"]
+        for name, stats in self.snapshot().items():
+            if "p50" in stats:
+                lines.append(
+                    f"{name:<16}{stats['count']:>9}{stats['rate']:>9.1f}{stats['p50']:>9.2f}"
+                    f"{stats['p95']:>9.2f}{stats['p99']:>9.2f}{stats['max']:>9.2f}"
+                )
+            else:
+                lines.append(f"{name:<16}{stats['count']:>9}{stats['rate']:>9.1f}")
+        return "\n".join(lines)
+
+    def write_csv(self, path: str) -> None:
+        """
+        ## Write CSV
+
+        Appends the current snapshot to a CSV file, one row per stage or counter
+
+        Parameters
+        ----------
+        path : str
+            CSV file, created with a header if missing
+        """
+        fields = ["time", "name", "count", "rate", "mean", "p50", "p95", "p99", "max"]
+        new_file = not os.path.exists(path)
+        now = time.time()
+
+        with open(path, "a", newline="") as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=fields)
+            if new_file:
+                writer.writeheader()
+            for name, stats in self.snapshot().items():
+                writer.writerow({"time": f"{now:.3f}", "name": name, **stats})
+
+
+class MetricsReporter:
+    """
+    ## Metrics Reporter
+
+    Logs the pipeline metrics and optionally appends them to a CSV file every `interval` seconds
+
+    Parameters
+    ----------
+    metrics : PipelineMetrics
+        Metrics to report
+    interval : float
+        Seconds between reports
+    csv_path : Optional[str]
+        CSV file to append to. Only logged when None
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, metrics: "PipelineMetrics", interval: float = 10.0, csv_path: Optional[str] = None) -> None:
+        self.metrics = metrics
+        self.interval = interval
+        self.csv_path = csv_path
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-reporter", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self.dump()
+
+    def dump(self) -> None:
+        logger.info("Pipeline metrics\n%s", self.metrics.report())
+        if self.csv_path is not None:
+            self.metrics.write_csv(self.csv_path)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.dump()
+
+
+# Shared by every stage of the pipeline: capture, cvtColor, detect, track, predictor,
+# transform, getAgent, select_window and tick, plus dropped frame counters
+metrics = PipelineMetrics()
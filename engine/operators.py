@@ -0,0 +1,142 @@
+from engine.gaze_stream import GazeSample
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+
+# Movement keys per operator, in operator order. The second operator turns right with "f"
+# because "d" prints canvas info
+OPERATOR_KEYS: Tuple[Dict[str, str], ...] = (
+    {"forward": "Up", "backward": "Down", "left": "Left", "right": "Right"},
+    {"forward": "w", "backward": "s", "left": "a", "right": "f"},
+    {"forward": "i", "backward": "k", "left": "j", "right": "l"},
+    {"forward": "KP_8", "backward": "KP_5", "left": "KP_4", "right": "KP_6"},
+)
+
+
+@dataclass
+class OperatorConfig:
+    """
+    ## Operator Config
+
+    One person controlling a group of agents
+
+    Parameters
+    ----------
+    source : Union[None, int, str, Any]
+        Camera index, video path, "synthetic" or a FrameSource. Operators with the same source
+        share one camera and are told apart by face track. None is the first webcam. A ready
+        made gaze source such as TraceGaze is used as is
+    agents : Optional[Sequence[int]]
+        Agents this operator controls. Agents are split evenly between operators when None
+    keys : Optional[Dict[str, str]]
+        Tk key names for "forward", "backward", "left" and "right". Defaults to OPERATOR_KEYS
+    name : Optional[str]
+        Display name
+    """
+    source: Union[None, int, str, Any] = None
+    agents: Optional[Sequence[int]] = None
+    keys: Optional[Dict[str, str]] = None
+    name: Optional[str] = None
+
+
+@dataclass
+class Operator:
+    """
+    ## Operator
+
+    Runtime state of one operator in the controller
+
+    Parameters
+    ----------
+    name : str
+        Display name
+    gaze : Any
+        Gaze source (GazeOTS or OperatorGaze)
+    agent_ids : List[int]
+        Agents this operator controls
+    keys : Dict[str, str]
+        Movement key bindings
+    selector : Any
+        AgentSelect over the operator's agents
+    scheduler : Any
+        SelectionScheduler feeding the operator's selections to the UI
+    selected : Optional[int]
+        Currently selected agent
+    """
+    name: str
+    gaze: Any
+    agent_ids: List[int]
+    keys: Dict[str, str]
+    selector: Any = None
+    scheduler: Any = None
+    selected: Optional[int] = None
+    agent_set: frozenset = field(default=frozenset(), repr=False)
+
+    def __post_init__(self) -> None:
+        self.agent_set = frozenset(self.agent_ids)
+
+
+class OperatorGaze:
+    """
+    ## Operator Gaze
+
+    Gaze of one face followed by a multi-face GazeOTS. Has the parts of the GazeOTS interface
+    used for agent selection (`gaze_location`, `gaze_sample`, `latest_sample`, `wait_for_sample`,
+    `sample_seq`)
+
+    Parameters
+    ----------
+    gaze : GazeOTS
+        Gaze pipeline following the face
+    slot : int
+        Operator slot of the face
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, gaze, slot: int) -> None:
+        self.gaze = gaze
+        self.slot = slot
+
+    @property
+    def gaze_location(self) -> Tuple[float, float]:
+        return self.gaze.operator_location(self.slot)
+
+    @property
+    def gaze_sample(self) -> Tuple[float, float, float]:
+        _, gaze_x, gaze_y, timestamp = self.gaze.operator_samples[self.slot]
+        return (gaze_x, gaze_y, timestamp)
+
+    @property
+    def latest_sample(self) -> GazeSample:
+        # Raw gaze is only kept for slot 0
+        seq, gaze_x, gaze_y, timestamp = self.gaze.operator_samples[self.slot]
+        if self.slot == 0:
+            return self.gaze.latest_sample
+        return GazeSample(seq, timestamp, (float("nan"), float("nan")), (float(gaze_x), float(gaze_y)))
+
+    @property
+    def sample_seq(self) -> int:
+        return self.gaze.operator_samples[self.slot][0]
+
+    def wait_for_sample(self, after_seq: int, timeout: Optional[float] = None) -> int:
+        return self.gaze.wait_for_operator_sample(self.slot, after_seq, timeout)
+
+
+def split_agents(agent_ids: Sequence[int], groups: int) -> List[List[int]]:
+    """
+    ## Split Agents
+
+    Splits agents into `groups` contiguous groups of near equal size
+    """
+    agent_ids = list(agent_ids)
+    size, extra = divmod(len(agent_ids), groups)
+    split = []
+    start = 0
+    for group in range(groups):
+        end = start + size + (1 if group < extra else 0)
+        split.append(agent_ids[start:end])
+        start = end
+    return split
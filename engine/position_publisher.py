@@ -0,0 +1,289 @@
+from engine.agent_state import AgentStore
+
+from typing import Any, Callable, List, NamedTuple, Optional
+import numpy as np
+import threading
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class PositionSnapshot(NamedTuple):
+    """
+    ## Position Snapshot
+
+    State of every agent at one publish, delivered to "snapshot" subscribers. Arrays are
+    copies owned by the subscriber
+
+    Parameters
+    ----------
+    seq : int
+        Publish sequence number
+    timestamp : float
+        Publish time (time.monotonic)
+    ids : np.ndarray
+        (N,) agent ids
+    positions : np.ndarray
+        (N, 2) positions in screen px
+    headings : np.ndarray
+        (N,) headings in degrees
+    changed : np.ndarray
+        (N,) agents that changed since the subscriber's previous snapshot
+    """
+    seq: int
+    timestamp: float
+    ids: np.ndarray
+    positions: np.ndarray
+    headings: np.ndarray
+    changed: np.ndarray
+
+
+# What subscribers receive. "delta": {agent_id: (x, y, heading)} of changed agents,
+# "positions": {agent_id: (x, y)} of every agent, "snapshot": PositionSnapshot
+PUBLISH_FORMATS = ("delta", "positions", "snapshot")
+
+
+class PositionSubscription:
+    """
+    ## Position Subscription
+
+    One subscriber of a PositionPublisher. The callback runs on the subscription's own thread.
+    Publishes that arrive while the callback is busy, or faster than `max_rate`, are folded
+    into one update with the latest state of every agent that changed in between
+
+    Parameters
+    ----------
+    publisher : PositionPublisher
+        Publisher the subscription belongs to
+    callback : Callable[[Any], None]
+        Receives each update, see PUBLISH_FORMATS
+    max_rate : Optional[float]
+        Most updates per second, no limit when None
+    format : str
+        "delta", "positions" or "snapshot"
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, publisher: "PositionPublisher", callback: Callable[[Any], None],
+                 max_rate: Optional[float] = None, format: str = "delta") -> None:
+        if format not in PUBLISH_FORMATS:
+            raise ValueError(f"Unknown publish format {format}")
+        if max_rate is not None and max_rate <= 0:
+            raise ValueError("max_rate must be positive")
+
+        self.publisher = publisher
+        self.callback = callback
+        self.format = format
+        self.interval = 0.0 if max_rate is None else 1 / max_rate
+
+        self.delivered = 0
+        self.coalesced = 0
+
+        # Guarded by the publisher's lock
+        self._cond = threading.Condition(publisher._lock)
+        self._pending = np.zeros(0, dtype=bool)
+        self._publishes = 0
+        self._closed = False
+
+        self._thread = threading.Thread(target=self.__run, name="position-subscriber", daemon=True)
+
+    def _mark(self, changed: np.ndarray) -> None:
+        # Called by the publisher with its lock held
+        if len(self._pending) != len(changed):
+            pending = np.ones(len(changed), dtype=bool)
+            pending[: len(self._pending)] = self._pending
+            self._pending = pending
+        else:
+            self._pending |= changed
+        self._publishes += 1
+        self._cond.notify()
+
+    def __take(self) -> Any:
+        # Called with the publisher's lock held, copies what the callback needs
+        publisher = self.publisher
+        changed = self._pending
+        self._pending = np.zeros_like(changed)
+        self.coalesced += self._publishes - 1
+        self._publishes = 0
+
+        if self.format == "snapshot":
+            return PositionSnapshot(
+                publisher.seq, publisher.timestamp, publisher._ids.copy(), publisher._positions.copy(),
+                publisher._headings.copy(), changed,
+            )
+        if self.format == "positions":
+            return dict(zip(publisher._ids.tolist(), map(tuple, publisher._positions.tolist())))
+        return {
+            agent_id: (x, y, heading)
+            for agent_id, (x, y), heading in zip(
+                publisher._ids[changed].tolist(), publisher._positions[changed].tolist(),
+                publisher._headings[changed].tolist(),
+            )
+        }
+
+    def __run(self) -> None:
+        next_delivery = 0.0
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    if self._publishes:
+                        delay = next_delivery - time.monotonic()
+                        if delay <= 0:
+                            break
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait()
+                update = self.__take()
+
+            next_delivery = time.monotonic() + self.interval
+            try:
+                self.callback(update)
+            except Exception:
+                logger.exception("Position subscriber failed")
+            self.delivered += 1
+
+    def close(self) -> None:
+        """
+        ## Close
+
+        Stops the subscription. Pending updates are dropped
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+
+        self.publisher._remove(self)
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+
+class PositionPublisher:
+    """
+    ## Position Publisher
+
+    Hands agent positions to any number of subscribers without blocking the UI thread.
+    `publish` compares the store with the last published state in one vectorized step and
+    only marks what changed. Each subscriber has its own thread and rate limit, so a slow
+    subscriber gets fewer, coalesced updates instead of holding up the frame
+
+    Parameters
+    ----------
+    agents : AgentStore
+        Agents to publish
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, agents: AgentStore) -> None:
+        self.agents = agents
+        self.seq = 0
+        self.timestamp = 0.0
+
+        self._lock = threading.Lock()
+        self._subscriptions: List[PositionSubscription] = []
+
+        # Last published state
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._positions = np.zeros((0, 2), dtype=np.float64)
+        self._headings = np.zeros(0, dtype=np.float64)
+
+    def subscribe(self, callback: Callable[[Any], None], max_rate: Optional[float] = None,
+                  format: str = "delta") -> PositionSubscription:
+        """
+        ## Subscribe
+
+        Adds a subscriber. Its first update has every agent as changed
+
+        Parameters
+        ----------
+        callback : Callable[[Any], None]
+            Receives each update on the subscription's thread, see PUBLISH_FORMATS
+        max_rate : Optional[float]
+            Most updates per second, no limit when None
+        format : str
+            "delta", "positions" or "snapshot"
+
+        Returns
+        -------
+        PositionSubscription
+            Subscription, close it to unsubscribe
+        """
+        subscription = PositionSubscription(self, callback, max_rate, format)
+        with self._lock:
+            self._subscriptions.append(subscription)
+            if len(self._ids):
+                subscription._mark(np.ones(len(self._ids), dtype=bool))
+        subscription._thread.start()
+        return subscription
+
+    def _remove(self, subscription: PositionSubscription) -> None:
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+            if not self._subscriptions:
+                # Not tracked without subscribers, the next publish resends everything
+                self._ids = np.zeros(0, dtype=np.int64)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscriptions)
+
+    def publish(self, timestamp: Optional[float] = None) -> int:
+        """
+        ## Publish
+
+        Offers the current agent state to every subscriber. Called from the UI thread
+
+        Parameters
+        ----------
+        timestamp : Optional[float]
+            Time of the state, defaults to now (time.monotonic)
+
+        Returns
+        -------
+        int
+            Number of agents that changed since the last publish
+        """
+        if not self._subscriptions:
+            return 0
+
+        positions = self.agents.positions
+        headings = self.agents.headings
+        with self._lock:
+            if len(positions) != len(self._ids):
+                # Agents were added, everything is resent
+                self._ids = self.agents.ids.copy()
+                self._positions = positions.copy()
+                self._headings = headings.copy()
+                changed = np.ones(len(positions), dtype=bool)
+            else:
+                changed = (positions != self._positions).any(axis=1)
+                changed |= headings != self._headings
+                if not changed.any():
+                    return 0
+                np.copyto(self._positions, positions)
+                np.copyto(self._headings, headings)
+
+            self.seq += 1
+            self.timestamp = time.monotonic() if timestamp is None else timestamp
+            for subscription in self._subscriptions:
+                subscription._mark(changed)
+        return int(np.count_nonzero(changed))
+
+    def close(self) -> None:
+        """
+        ## Close
+
+        Closes every subscription
+        """
+        for subscription in list(self._subscriptions):
+            subscription.close()
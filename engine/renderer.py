@@ -0,0 +1,284 @@
+from engine.agent_state import AgentState, AgentStore
+
+from typing import Dict, Iterable, Optional, Tuple
+from turtle import RawTurtle, TurtleScreen
+import tkinter as tk
+import numpy as np
+
+
+# Outline of turtle's built-in "turtle" shape, nose along +y
+TURTLE_SHAPE = np.array(
+    [
+        (0, 16), (-2, 14), (-1, 10), (-4, 7), (-7, 9), (-9, 8), (-6, 5), (-7, 1),
+        (-5, -3), (-8, -6), (-6, -8), (-4, -5), (0, -7), (4, -5), (6, -8), (8, -6),
+        (5, -3), (7, 1), (6, 5), (9, 8), (7, 9), (4, 7), (1, 10), (2, 14),
+    ],
+    dtype=np.float64,
+)
+
+
+class TurtleRenderer:
+    """
+    ## Turtle Renderer
+
+    Draws agents with RawTurtle objects but with turtle animation turned off. Agent state
+    changes are applied to the turtles once per frame followed by a single screen update,
+    and frames without changes skip the update. A screen update still redraws every
+    turtle, so use CanvasRenderer for large agent counts
+
+    Parameters
+    ----------
+    screen : TurtleScreen
+        Screen the turtles are drawn on
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, screen: TurtleScreen) -> None:
+        self.screen = screen
+        self.screen.tracer(0)
+
+        self._drawn: Dict[int, Tuple[Tuple[float, float], float]] = {}
+        self._pending = False
+
+    def add_agent(self, agent_id: int, agent: AgentState, size: float) -> None:
+        turtle = RawTurtle(self.screen)
+        turtle.hideturtle()
+        turtle.penup()
+        turtle.shape("turtle")
+        turtle.color(agent.color)
+        turtle.shapesize(size, size)
+        turtle.setpos(*agent.position)
+        turtle.setheading(agent.heading)
+        turtle.showturtle()
+
+        agent.turtle = turtle
+        self._drawn[agent_id] = (tuple(agent.position), agent.heading)
+        self._pending = True
+
+    def highlight(self, agent_id: int, agent: AgentState, selected: bool) -> None:
+        if selected:
+            agent.turtle.color(agent.color, "white")
+        else:
+            agent.turtle.color(agent.color)
+        self._pending = True
+
+    def render(self, agents: AgentStore, dirty: Optional[Iterable[int]] = None,
+               poses: Optional[Dict[int, Tuple[Tuple[float, float], float]]] = None) -> None:
+        """
+        ## Render
+
+        Applies agent state to the turtles and redraws the screen once
+
+        Parameters
+        ----------
+        agents : AgentStore
+            All agents
+        dirty : Optional[Iterable[int]]
+            Agents that may have changed since the last frame. All agents are checked when None
+        poses : Optional[Dict[int, Tuple[Tuple[float, float], float]]]
+            Position and heading to draw instead of the agent state (e.g. interpolated poses)
+        """
+        for agent_id in agents if dirty is None else dirty:
+            agent = agents[agent_id]
+            if poses is not None and agent_id in poses:
+                state = (tuple(poses[agent_id][0]), poses[agent_id][1])
+            else:
+                state = (tuple(agent.position), agent.heading)
+            if self._drawn.get(agent_id) == state:
+                continue
+
+            agent.turtle.setposition(state[0])
+            agent.turtle.setheading(state[1])
+            self._drawn[agent_id] = state
+            self._pending = True
+
+        if self._pending:
+            self.screen.update()
+            self._pending = False
+
+
+class CanvasRenderer:
+    """
+    ## Canvas Renderer
+
+    Draws agents as tk.Canvas polygons without going through turtle. Outlines for every
+    changed agent are computed in one vectorized step, and Tk redraws the canvas once
+    when the frame's changes are done
+
+    Parameters
+    ----------
+    canvas : tk.Canvas
+        Canvas in screen px (y pointing down)
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, canvas: tk.Canvas) -> None:
+        self.canvas = canvas
+
+        self._items: Dict[int, int] = {}
+        self._sizes: Dict[int, float] = {}
+        self._drawn: Dict[int, Tuple[Tuple[float, float], float]] = {}
+
+    def add_agent(self, agent_id: int, agent: AgentState, size: float) -> None:
+        agent.turtle = None
+        self._sizes[agent_id] = size
+        self._items[agent_id] = self.canvas.create_polygon(
+            *self.outlines(np.array([agent.position]), np.array([agent.heading]), np.array([size]))[0].ravel(),
+            fill=agent.color,
+            outline=agent.color,
+        )
+        self._drawn[agent_id] = (tuple(agent.position), agent.heading)
+
+    def highlight(self, agent_id: int, agent: AgentState, selected: bool) -> None:
+        self.canvas.itemconfigure(
+            self._items[agent_id],
+            fill="white" if selected else agent.color,
+            outline=agent.color,
+        )
+
+    @staticmethod
+    def outlines(positions: np.ndarray, headings: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+        """
+        ## Outlines
+
+        Polygon coordinates for a group of agents
+
+        Parameters
+        ----------
+        positions : np.ndarray
+            (M, 2) agent positions
+        headings : np.ndarray
+            (M,) headings in degrees
+        sizes : np.ndarray
+            (M,) shape scale per agent
+
+        Returns
+        -------
+        np.ndarray
+            (M, len(TURTLE_SHAPE), 2) canvas coordinates
+        """
+        headings = np.radians(headings)
+
+        # Nose along the heading, shape x axis perpendicular to it
+        forward = np.column_stack((np.cos(headings), np.sin(headings))) * sizes[:, None]
+        side = np.column_stack((np.sin(headings), -np.cos(headings))) * sizes[:, None]
+
+        return (
+            positions[:, None, :]
+            + TURTLE_SHAPE[None, :, 1:2] * forward[:, None, :]
+            + TURTLE_SHAPE[None, :, 0:1] * side[:, None, :]
+        )
+
+    def render(self, agents: AgentStore, dirty: Optional[Iterable[int]] = None,
+               poses: Optional[Dict[int, Tuple[Tuple[float, float], float]]] = None) -> None:
+        """
+        ## Render
+
+        Moves the polygons of every changed agent
+
+        Parameters
+        ----------
+        agents : AgentStore
+            All agents
+        dirty : Optional[Iterable[int]]
+            Agents that may have changed since the last frame. All agents are checked when None
+        poses : Optional[Dict[int, Tuple[Tuple[float, float], float]]]
+            Position and heading to draw instead of the agent state (e.g. interpolated poses)
+        """
+        changed = []
+        for agent_id in agents if dirty is None else dirty:
+            agent = agents[agent_id]
+            if poses is not None and agent_id in poses:
+                state = (tuple(poses[agent_id][0]), poses[agent_id][1])
+            else:
+                state = (tuple(agent.position), agent.heading)
+            if self._drawn.get(agent_id) != state:
+                changed.append(agent_id)
+                self._drawn[agent_id] = state
+
+        if not changed:
+            return
+
+        sizes = np.array([self._sizes[agent_id] for agent_id in changed])
+        states = [self._drawn[agent_id] for agent_id in changed]
+        coords = self.outlines(
+            np.array([state[0] for state in states]), np.array([state[1] for state in states]), sizes
+        )
+        for agent_id, outline in zip(changed, coords):
+            self.canvas.coords(self._items[agent_id], *outline.ravel())
+
+
+class NullRenderer:
+    """
+    ## Null Renderer
+
+    Renderer without a window, for headless runs. Keeps track of what would have been drawn
+    so throughput runs still pay for change detection, and can optionally compute the canvas
+    outlines offscreen to include the geometry cost of CanvasRenderer
+
+    Parameters
+    ----------
+    outlines : bool
+        Compute CanvasRenderer outlines for every changed agent
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, outlines: bool = False) -> None:
+        self.outlines = outlines
+
+        self.frames = 0
+        self.drawn_agents = 0
+        self._sizes: Dict[int, float] = {}
+        self._drawn: Dict[int, Tuple[Tuple[float, float], float]] = {}
+
+    def add_agent(self, agent_id: int, agent: AgentState, size: float) -> None:
+        agent.turtle = None
+        self._sizes[agent_id] = size
+        self._drawn[agent_id] = (tuple(agent.position), agent.heading)
+
+    def highlight(self, agent_id: int, agent: AgentState, selected: bool) -> None:
+        pass
+
+    def render(self, agents: AgentStore, dirty: Optional[Iterable[int]] = None,
+               poses: Optional[Dict[int, Tuple[Tuple[float, float], float]]] = None) -> None:
+        """
+        ## Render
+
+        Counts the frame and the agents whose pose changed
+
+        Parameters
+        ----------
+        agents : AgentStore
+            All agents
+        dirty : Optional[Iterable[int]]
+            Agents that may have changed since the last frame. All agents are checked when None
+        poses : Optional[Dict[int, Tuple[Tuple[float, float], float]]]
+            Position and heading to draw instead of the agent state (e.g. interpolated poses)
+        """
+        changed = []
+        for agent_id in agents if dirty is None else dirty:
+            agent = agents[agent_id]
+            if poses is not None and agent_id in poses:
+                state = (tuple(poses[agent_id][0]), poses[agent_id][1])
+            else:
+                state = (tuple(agent.position), agent.heading)
+            if self._drawn.get(agent_id) != state:
+                changed.append(agent_id)
+                self._drawn[agent_id] = state
+
+        self.frames += 1
+        self.drawn_agents += len(changed)
+
+        if self.outlines and changed:
+            states = [self._drawn[agent_id] for agent_id in changed]
+            CanvasRenderer.outlines(
+                np.array([state[0] for state in states]),
+                np.array([state[1] for state in states]),
+                np.array([self._sizes[agent_id] for agent_id in changed]),
+            )
@@ -0,0 +1,211 @@
+from engine.agent_selection import AgentSelect
+from engine.gaze_trace import TraceRecorder
+from engine.selection_debounce import SelectionDebouncer
+from engine.instrumentation import metrics
+
+from typing import Any, Optional
+from collections import deque
+import threading
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class SelectionMailbox:
+    """
+    ## Selection Mailbox
+
+    Single slot hand-off from the selection thread to the Tk loop. Posting replaces any
+    unread selection (latest wins), and both sides only use atomic deque operations, so
+    neither thread ever waits on the other
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self) -> None:
+        self._slot: deque = deque(maxlen=1)
+
+    def post(self, selection: Any) -> None:
+        self._slot.append(selection)
+
+    def poll(self) -> Optional[Any]:
+        """
+        ## Poll
+
+        Takes the newest unread selection without blocking
+
+        Returns
+        -------
+        Optional[Any]
+            Selection, or None if nothing new was posted
+        """
+        try:
+            return self._slot.pop()
+        except IndexError:
+            return None
+
+
+class SelectionScheduler:
+    """
+    ## Selection Scheduler
+
+    Runs gaze based agent selection on its own thread at a bounded rate, debounces it,
+    and hands selection changes to the UI thread through a SelectionMailbox
+
+    Parameters
+    ----------
+    gaze : GazeOTS
+        Gaze source providing `gaze_sample` and `wait_for_sample`
+    selector : AgentSelect
+        Agent selector
+    hz : Optional[float]
+        Maximum selections per second. Defaults to the selector's rate
+    pacing : str
+        "camera" runs once per new gaze sample (capped at `hz`),
+        "rate" samples the latest gaze at exactly `hz`
+    debouncer : Optional[SelectionDebouncer]
+        Dwell and hysteresis state machine. Defaults to SelectionDebouncer()
+    recorder : Optional[TraceRecorder]
+        Records every selection with its gaze sample and agent positions, for replay
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, gaze, selector: AgentSelect, hz: Optional[float] = None, pacing: str = "camera",
+                 debouncer: Optional[SelectionDebouncer] = None, recorder: Optional[TraceRecorder] = None) -> None:
+        if pacing not in ("camera", "rate"):
+            raise ValueError(f"Unknown pacing {pacing}")
+
+        self.gaze = gaze
+        self.selector = selector
+        self.hz = hz if hz is not None else selector.hz
+        self.pacing = pacing
+        self.mailbox = SelectionMailbox()
+        self.debouncer = debouncer if debouncer is not None else SelectionDebouncer()
+        self.recorder = recorder
+
+        self.selections = 0
+
+        # Debounced update and its post, or a forced selection and the mailbox flush, happen
+        # as one step so a dwell switch cannot land after a key press
+        self._select_lock = threading.Lock()
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="agent-selection", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+    def poll(self) -> Optional[int]:
+        """
+        ## Poll
+
+        Newest selection change since the last poll, for the UI thread
+
+        Returns
+        -------
+        Optional[int]
+            Newly selected agent id, or None if the selection has not changed
+        """
+        return self.mailbox.poll()
+
+    def _run(self) -> None:
+        period = 1.0 / self.hz if self.hz else 0.0
+        next_time = time.monotonic()
+        sample_seq = 0
+
+        while not self._stop.is_set():
+            if self.pacing == "camera":
+                wait_start = time.monotonic()
+                new_seq = self.gaze.wait_for_sample(sample_seq, timeout=0.5)
+                if new_seq == sample_seq:
+                    # A stopped source returns at once, wait out the timeout instead of spinning
+                    remaining = 0.5 - (time.monotonic() - wait_start)
+                    if remaining > 0:
+                        self._stop.wait(remaining)
+                    continue
+                sample_seq = new_seq
+
+            # One bad selection must not end gaze selection for the rest of the session
+            try:
+                self.select()
+            except Exception:
+                logger.exception("Agent selection failed")
+
+            # Sleep until the next slot, dropping slots that were missed rather than bursting
+            next_time += period
+            now = time.monotonic()
+            if next_time < now:
+                next_time = now
+            elif self._stop.wait(next_time - now):
+                break
+
+    def select(self) -> Optional[int]:
+        """
+        ## Select
+
+        Runs one selection and posts it if the debounced selection changed
+
+        Returns
+        -------
+        Optional[int]
+            Selected agent id after debouncing
+        """
+        start = metrics.clock()
+        if self.recorder is not None:
+            sample = self.gaze.latest_sample
+            (gaze_x, gaze_y), sample_time = sample.point, sample.timestamp
+        else:
+            gaze_x, gaze_y, sample_time = self.gaze.gaze_sample
+
+        # One clock reading for the whole selection, so a recorded trace replays exactly
+        now = time.monotonic()
+        agent_id = self.selector.getAgent((gaze_x, gaze_y), sample_time, now)
+        metrics.record("getAgent", start)
+        self.selections += 1
+
+        # Distance hysteresis only makes sense when the raw choice is the nearest agent
+        distance = self.selector.distance if self.selector.selection_method == "position" else None
+        with self._select_lock:
+            changed = self.debouncer.update(agent_id, now, distance)
+            if changed is not None:
+                self.mailbox.post(changed)
+            current = self.debouncer.current
+
+        if self.recorder is not None:
+            self.recorder.record(sample, agent_id, current, now, self.selector.selection_positions)
+
+        return current
+
+    def override(self, agent_id: int) -> None:
+        """
+        ## Override
+
+        Tells the debouncer about a selection made outside of gaze (e.g. a key press), and drops
+        any gaze selection change not yet taken by the UI, so it cannot undo the key press
+
+        Parameters
+        ----------
+        agent_id : int
+            Selected agent id
+        """
+        with self._select_lock:
+            self.debouncer.force(agent_id)
+            self.mailbox.poll()
+
+    @property
+    def current(self) -> Optional[int]:
+        return self.debouncer.current
@@ -0,0 +1,100 @@
+from typing import Callable, Optional
+import threading
+
+
+class SelectionDebouncer:
+    """
+    ## Selection Debouncer
+
+    State machine between raw agent selection and the UI. A new agent is only selected once it
+    has been the raw choice for `dwell_time` seconds and is closer to the gaze than the current
+    agent by at least `hysteresis` px, so noise near the midpoint between agents cannot make the
+    selection flicker. `update` returns a value only when the selection actually changes.
+    `update` (selection thread) and `force` (UI thread) may be called from different threads
+
+    Parameters
+    ----------
+    dwell_time : float
+        Seconds a candidate must persist before it is selected
+    hysteresis : float
+        Distance margin in px the candidate must win by
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, dwell_time: float = 0.15, hysteresis: float = 30.0) -> None:
+        self.dwell_time = dwell_time
+        self.hysteresis = hysteresis
+
+        self.current: Optional[int] = None
+        self.candidate: Optional[int] = None
+        self.candidate_since = 0.0
+        self.changes = 0
+
+        self._lock = threading.Lock()
+
+    def update(self, agent_id: int, timestamp: float, distance: Optional[Callable[[int], float]] = None) -> Optional[int]:
+        """
+        ## Update
+
+        Feeds one raw selection into the state machine
+
+        Parameters
+        ----------
+        agent_id : int
+            Raw selection for this gaze sample
+        timestamp : float
+            Sample time in seconds
+        distance : Optional[Callable[[int], float]]
+            Distance from the current gaze to an agent. Without it only the dwell time applies
+
+        Returns
+        -------
+        Optional[int]
+            Newly selected agent, or None if the selection did not change
+        """
+        with self._lock:
+            return self.__update(agent_id, timestamp, distance)
+
+    def __update(self, agent_id: int, timestamp: float, distance: Optional[Callable[[int], float]]) -> Optional[int]:
+        if self.current is None:
+            return self.__switch(agent_id)
+
+        if agent_id == self.current:
+            self.candidate = None
+            return None
+
+        # Raw choice must beat the current agent by the hysteresis margin
+        if distance is not None and distance(agent_id) + self.hysteresis >= distance(self.current):
+            self.candidate = None
+            return None
+
+        if agent_id != self.candidate:
+            self.candidate = agent_id
+            self.candidate_since = timestamp
+
+        if timestamp - self.candidate_since >= self.dwell_time:
+            return self.__switch(agent_id)
+        return None
+
+    def force(self, agent_id: Optional[int]) -> None:
+        """
+        ## Force
+
+        Sets the selection directly (e.g. from a key press) without emitting a change
+
+        Parameters
+        ----------
+        agent_id : Optional[int]
+            Selected agent
+        """
+        with self._lock:
+            self.current = agent_id
+            self.candidate = None
+
+    def __switch(self, agent_id: int) -> int:
+        self.current = agent_id
+        self.candidate = None
+        self.changes += 1
+        return agent_id
@@ -0,0 +1,171 @@
+from engine.agent_state import (
+    AgentStore, MOVING_BACKWARD, MOVING_FORWARD, TURNING_LEFT, TURNING_RIGHT
+)
+
+from typing import Dict, Set, Tuple
+import numpy as np
+
+
+# Agent speeds are given in px per step of the original 60 Hz update loop
+BASE_RATE = 60.0
+
+
+class SimulationCore:
+    """
+    ## Simulation Core
+
+    Integrates agent kinematics on a fixed timestep, independent of how often the UI
+    gets to run. Real elapsed time is collected in an accumulator and consumed in whole
+    steps, and the leftover fraction is used to interpolate agent poses for rendering
+
+    Parameters
+    ----------
+    agents : AgentStore
+        Agents to simulate, updated in place
+    bounds : Tuple[float, float, float, float]
+        Allowed area as (min_x, max_x, min_y, max_y)
+    rotation_speed : float
+        Degrees turned per 60 Hz step
+    timestep : float
+        Simulation step in seconds
+    max_steps : int
+        Most steps run per `advance` call, so a long stall does not trigger a burst of catch-up work
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self, agents: AgentStore, bounds: Tuple[float, float, float, float],
+                 rotation_speed: float = 15, timestep: float = 1 / BASE_RATE, max_steps: int = 8) -> None:
+        self.agents = agents
+        self.bounds = bounds
+        self.rotation_speed = rotation_speed
+        self.timestep = timestep
+        self.max_steps = max_steps
+
+        self.accumulator = 0.0
+        self.steps = 0
+        self.time = 0.0
+
+        # Rows that moved in the last step and their poses before it, for interpolation
+        self._previous_rows = np.zeros(0, dtype=np.intp)
+        self._previous_positions = np.zeros((0, 2))
+        self._previous_headings = np.zeros(0)
+
+    def advance(self, elapsed: float) -> Set[int]:
+        """
+        ## Advance
+
+        Adds real elapsed time and runs every whole step it covers
+
+        Parameters
+        ----------
+        elapsed : float
+            Seconds since the last call
+
+        Returns
+        -------
+        Set[int]
+            Agents that moved or turned
+        """
+        self.accumulator += max(elapsed, 0.0)
+        moved: Set[int] = set()
+
+        steps = 0
+        while self.accumulator >= self.timestep and steps < self.max_steps:
+            moved |= self.step()
+            self.accumulator -= self.timestep
+            steps += 1
+
+        # Drop time that could not be simulated instead of falling further behind
+        if steps == self.max_steps and self.accumulator >= self.timestep:
+            self.accumulator %= self.timestep
+
+        return moved
+
+    def step(self) -> Set[int]:
+        """
+        ## Step
+
+        Advances every moving agent by one fixed timestep, as array operations over the store
+
+        Returns
+        -------
+        Set[int]
+            Agents that moved or turned
+        """
+        agents = self.agents
+        flags = agents.flags
+        forward = (flags & (MOVING_FORWARD | MOVING_BACKWARD)) != 0
+        # Screen y points down, so a left turn decreases the heading
+        turn = ((flags & TURNING_RIGHT) != 0).astype(np.float64) - ((flags & TURNING_LEFT) != 0)
+
+        rows = np.flatnonzero(forward | (turn != 0))
+        self._previous_rows = rows
+        self._previous_positions = agents.positions[rows]
+        self._previous_headings = agents.headings[rows]
+
+        self.steps += 1
+        self.time += self.timestep
+        if not len(rows):
+            return set()
+
+        scale = self.timestep * BASE_RATE
+        forward = forward[rows]
+        moving = rows[forward]
+        if len(moving):
+            # Forward wins when both directions are held
+            direction = np.where(flags[moving] & MOVING_FORWARD, 1.0, -1.0)
+            heading_rad = np.radians(agents.headings[moving])
+            step = (direction * agents.speeds[moving] * scale)[:, None]
+            agents.positions[moving] = self._clamp_positions(
+                agents.positions[moving]
+                + step * np.column_stack((np.cos(heading_rad), np.sin(heading_rad)))
+            )
+
+        agents.headings[rows] = (agents.headings[rows] + turn[rows] * self.rotation_speed * scale) % 360
+
+        return set(agents.ids[rows].tolist())
+
+    def _clamp_positions(self, positions: np.ndarray) -> np.ndarray:
+        min_x, max_x, min_y, max_y = self.bounds
+        return np.clip(positions, (min_x, min_y), (max_x, max_y))
+
+    @property
+    def alpha(self) -> float:
+        """
+        ## Alpha
+
+        Fraction of a step left in the accumulator, used to blend the last two poses
+        """
+        return min(self.accumulator / self.timestep, 1.0)
+
+    def interpolated(self) -> Dict[int, Tuple[Tuple[float, float], float]]:
+        """
+        ## Interpolated
+
+        Render poses of the agents that moved in the last step, blended between the pose
+        before and after that step
+
+        Returns
+        -------
+        Dict[int, Tuple[Tuple[float, float], float]]
+            Position and heading per agent
+        """
+        rows = self._previous_rows
+        if not len(rows):
+            return {}
+
+        alpha = self.alpha
+        positions = self._previous_positions + (self.agents.positions[rows] - self._previous_positions) * alpha
+
+        # Blend headings along the shorter arc
+        turn = (self.agents.headings[rows] - self._previous_headings + 180) % 360 - 180
+        headings = (self._previous_headings + turn * alpha) % 360
+
+        return {
+            agent_id: ((x, y), heading)
+            for agent_id, (x, y), heading in zip(
+                self.agents.ids[rows].tolist(), positions.tolist(), headings.tolist()
+            )
+        }
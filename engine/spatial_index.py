@@ -0,0 +1,145 @@
+from typing import Dict, Optional, Set, Tuple
+import numpy as np
+import math
+
+
+class GridIndex:
+    """
+    ## Grid Index
+
+    Uniform grid over a shared (N, 2) position array for nearest-agent queries. Moving an
+    agent only touches the two cells involved, and a query only inspects the cells around
+    the query point, so both are amortized O(1) for evenly spread agents
+
+    Parameters
+    ----------
+    positions : np.ndarray
+        (N, 2) float array of agent positions. Kept by reference, callers update it in place
+        and then call `update` with the rows that moved
+    cell_size : float
+        Width and height of a grid cell in px
+
+    Returns
+    -------
+    None
+    """
+    # Past this many rings a linear scan is cheaper than walking empty cells
+    MAX_RINGS = 32
+
+    def __init__(self, positions: np.ndarray, cell_size: float) -> None:
+        if cell_size <= 0:
+            raise ValueError("cell_size must be positive")
+
+        self.positions = positions
+        self.cell_size = float(cell_size)
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        """
+        ## Rebuild
+
+        Re-inserts every agent. Only needed when the position array is replaced
+        """
+        self.cells: Dict[Tuple[int, int], Set[int]] = {}
+        self.agent_cells = np.floor(self.positions / self.cell_size).astype(np.int64)
+        self._bounds: Optional[Tuple[int, int, int, int]] = None
+
+        for row, (cx, cy) in enumerate(self.agent_cells):
+            self.__insert(row, (int(cx), int(cy)))
+
+    def update(self, row: int) -> None:
+        """
+        ## Update
+
+        Moves one agent to the cell matching its current position
+
+        Parameters
+        ----------
+        row : int
+            Row of the agent in the position array
+        """
+        x, y = self.positions[row]
+        cell = (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+        old_cell = (int(self.agent_cells[row, 0]), int(self.agent_cells[row, 1]))
+        if cell == old_cell:
+            return
+
+        members = self.cells[old_cell]
+        members.discard(row)
+        if not members:
+            del self.cells[old_cell]
+
+        self.agent_cells[row] = cell
+        self.__insert(row, cell)
+
+    def __insert(self, row: int, cell: Tuple[int, int]) -> None:
+        self.cells.setdefault(cell, set()).add(row)
+
+        # Occupied area only ever grows, it bounds how far a query has to search
+        if self._bounds is None:
+            self._bounds = (cell[0], cell[0], cell[1], cell[1])
+        else:
+            min_x, max_x, min_y, max_y = self._bounds
+            self._bounds = (min(min_x, cell[0]), max(max_x, cell[0]), min(min_y, cell[1]), max(max_y, cell[1]))
+
+    def nearest(self, point: Tuple[float, float]) -> int:
+        """
+        ## Nearest
+
+        Finds the agent closest to a point
+
+        Parameters
+        ----------
+        point : Tuple[float, float]
+            Query point in px
+
+        Returns
+        -------
+        int
+            Row of the closest agent
+        """
+        if len(self.positions) == 0:
+            raise ValueError("GridIndex is empty")
+
+        px, py = float(point[0]), float(point[1])
+        cx, cy = math.floor(px / self.cell_size), math.floor(py / self.cell_size)
+
+        min_x, max_x, min_y, max_y = self._bounds
+        max_ring = max(cx - min_x, max_x - cx, cy - min_y, max_y - cy, 0)
+        if max_ring > self.MAX_RINGS:
+            return self.__scan(px, py)
+
+        best_row = -1
+        best_dist = math.inf
+        for ring in range(max_ring + 1):
+            # Cells in this ring are at least (ring - 1) cells away from the point
+            if best_row >= 0 and (ring - 1) * self.cell_size > best_dist:
+                break
+
+            for cell in self.__ring(cx, cy, ring):
+                members = self.cells.get(cell)
+                if not members:
+                    continue
+                for row in members:
+                    dist = math.hypot(self.positions[row, 0] - px, self.positions[row, 1] - py)
+                    if dist < best_dist:
+                        best_row, best_dist = row, dist
+
+        return best_row
+
+    def __scan(self, px: float, py: float) -> int:
+        diff = self.positions - (px, py)
+        return int(np.argmin(np.einsum("ij,ij->i", diff, diff)))
+
+    @staticmethod
+    def __ring(cx: int, cy: int, ring: int):
+        if ring == 0:
+            yield (cx, cy)
+            return
+
+        for dx in range(-ring, ring + 1):
+            yield (cx + dx, cy - ring)
+            yield (cx + dx, cy + ring)
+        for dy in range(-ring + 1, ring):
+            yield (cx - ring, cy + dy)
+            yield (cx + ring, cy + dy)
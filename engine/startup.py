@@ -0,0 +1,131 @@
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import threading
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfile:
+    """
+    ## Startup Profile
+
+    Times the stages of application startup. Stages may run on any thread, so overlapping
+    stages show up with overlapping start and end times in the report
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+    """
+    def __init__(self) -> None:
+        self.origin = time.perf_counter()
+        self._stages: List[Tuple[str, str, float, float]] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        ## Stage
+
+        Context manager timing one named stage on the calling thread
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self._stages.append((name, threading.current_thread().name, start - self.origin, end - self.origin))
+
+    def mark(self, name: str) -> None:
+        """
+        ## Mark
+
+        Records a point in time, such as the first gaze sample
+        """
+        now = time.perf_counter() - self.origin
+        with self._lock:
+            self._stages.append((name, threading.current_thread().name, now, now))
+
+    def background(self, name: str, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """
+        ## Background
+
+        Runs `function` as a timed stage on its own daemon thread
+
+        Parameters
+        ----------
+        name : str
+            Stage name, also used as the thread name
+        function : Callable[..., Any]
+            Work to run
+        *args, **kwargs : Any
+            Arguments for `function`
+
+        Returns
+        -------
+        Future
+            Result of `function`, or the exception it raised
+        """
+        future: Future = Future()
+
+        def run() -> None:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                with self.stage(name):
+                    result = function(*args, **kwargs)
+            except BaseException as error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        threading.Thread(target=run, name=f"startup-{name}", daemon=True).start()
+        return future
+
+    @property
+    def stages(self) -> Dict[str, float]:
+        """
+        ## Stages
+
+        Duration in seconds of every finished stage
+        """
+        with self._lock:
+            return {name: end - start for name, _, start, end in self._stages}
+
+    def report(self, total: Optional[float] = None) -> str:
+        """
+        ## Report
+
+        Timing breakdown, one line per stage in start order
+
+        Parameters
+        ----------
+        total : Optional[float]
+            Time from the profile origin to "ready". Defaults to now
+
+        Returns
+        -------
+        str
+            Formatted report
+        """
+        if total is None:
+            total = time.perf_counter() - self.origin
+
+        with self._lock:
+            stages = sorted(self._stages, key=lambda stage: stage[2])
+
+        lines = [f"Startup took {total * 1000:.0f} ms"]
+        for name, thread, start, end in stages:
+            lines.append(f"  {name:<16} {start * 1000:7.0f} -> {end * 1000:7.0f} ms  ({(end - start) * 1000:6.0f} ms, {thread})")
+        return "\n".join(lines)
+
+    def log(self, total: Optional[float] = None) -> None:
+        logger.info(self.report(total))
@@ -1,5 +1,7 @@
 from engine.agent_controller import SingleWindowController
+import logging
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     agent_control = SingleWindowController()
     agent_control.run()
\ No newline at end of file